@@ -0,0 +1,115 @@
+"""
+Benchmark for logging words and chords into SQLite databases of different sizes
+Compares the single-statement upserts with the old read-modify-write path
+Run from the repository root: python -m benchmarks.bench_backend [num_rows ...]
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from nexus.Freqlog.backends import SQLiteBackend
+from nexus.Freqlog.Definitions import CaseSensitivity, ChordMetadata, WordMetadata
+
+NUM_LOGGED = 20_000  # Entries logged per path and database size
+
+
+def legacy_log_word(backend: SQLiteBackend, word: str, start_time: datetime, end_time: datetime) -> bool:
+    """log_word() as done before upserts: banlist check, SELECT, merge in Python, then UPDATE or INSERT"""
+    if backend.check_banned(word):
+        return False
+    metadata = backend.get_word_metadata(word, CaseSensitivity.SENSITIVE)
+    if metadata:
+        metadata |= WordMetadata(word, 1, end_time, end_time - start_time)
+        backend._execute("UPDATE freqlog SET frequency=?, lastused=?, avgspeed=? WHERE word=?",
+                         (metadata.frequency, metadata.last_used.timestamp(), metadata.average_speed.total_seconds(),
+                          word))
+    else:
+        backend._execute("INSERT INTO freqlog VALUES (?, ?, ?, ?)",
+                         (word, 1, end_time.timestamp(), (end_time - start_time).total_seconds()))
+    return True
+
+
+def legacy_log_chord(backend: SQLiteBackend, chord: str, end_time: datetime) -> bool:
+    """log_chord() as done before upserts"""
+    if backend.check_banned(chord):
+        return False
+    metadata = backend.get_chord_metadata(chord)
+    if metadata:
+        metadata |= ChordMetadata(chord, 1, end_time)
+        backend._execute("UPDATE chordlog SET frequency=?, lastused=? WHERE chord=?",
+                         (metadata.frequency, metadata.last_used.timestamp(), chord))
+    else:
+        backend._execute("INSERT INTO chordlog VALUES (?, ?, ?)", (chord, 1, end_time.timestamp()))
+    return True
+
+
+def populate(backend: SQLiteBackend, num_rows: int) -> None:
+    """Fill freqlog and chordlog (10:1) with num_rows synthetic entries"""
+    num_chords = num_rows // 10
+    start = datetime(2020, 1, 1).timestamp()
+    backend.cursor.executemany("INSERT INTO freqlog VALUES (?, ?, ?, ?)",
+                               ((f"w{i:08d}", 1 + i % 50, start + i, 0.5) for i in range(num_rows - num_chords)))
+    backend.cursor.executemany("INSERT INTO chordlog VALUES (?, ?, ?)",
+                               ((f"c{i:08d}", 1 + i % 50, start + i) for i in range(num_chords)))
+    backend.conn.commit()
+
+
+def bench(num_rows: int, seed: int = 0) -> tuple[float, float]:
+    """Time NUM_LOGGED entries (half existing, half new) with each path, returning seconds per entry"""
+    num_chords = num_rows // 10
+    results = []
+    with tempfile.TemporaryDirectory() as path:
+        template = os.path.join(path, "template.db")
+        backend = SQLiteBackend(template, lambda _: "bench", wal=False, reader_pool_size=0)
+        populate(backend, num_rows)
+        backend.close()
+        for name, log_word, log_chord in (("legacy", legacy_log_word, legacy_log_chord),
+                                          ("upsert", SQLiteBackend.log_word, SQLiteBackend.log_chord)):
+            # Same database and entries for both paths
+            rng = random.Random(seed)
+            db_path = os.path.join(path, f"{name}.db")
+            shutil.copyfile(template, db_path)
+            # Reads and writes on the one connection, so the in-memory journal doesn't lock out pooled readers
+            backend = SQLiteBackend(db_path, lambda _: "bench", wal=False, reader_pool_size=0)
+            backend.cursor.execute("PRAGMA synchronous = OFF")  # Time the statements rather than the disk
+            backend.cursor.execute("PRAGMA journal_mode = MEMORY")
+            entries = []
+            now = datetime(2030, 1, 1)
+            for i in range(NUM_LOGGED):
+                now += timedelta(milliseconds=1)  # lastused is unique
+                existing = rng.random() < 0.5
+                if rng.random() < 0.1:
+                    chord = f"c{rng.randrange(num_chords):08d}" if existing else f"new-c{i}"
+                    entries.append((False, chord, now))
+                else:
+                    word = f"w{rng.randrange(num_rows - num_chords):08d}" if existing else f"new-w{i}"
+                    entries.append((True, word, now))
+            start = time.perf_counter()
+            for is_word, entry, end_time in entries:
+                if is_word:
+                    log_word(backend, entry, end_time - timedelta(milliseconds=300), end_time)
+                else:
+                    log_chord(backend, entry, end_time)
+            results.append((time.perf_counter() - start) / NUM_LOGGED)
+            backend.close()
+            os.remove(db_path)
+    return results[0], results[1]
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000, 10_000_000]
+    print(f"{NUM_LOGGED} entries logged per path (half new, half existing, 10% chords), "
+          "one commit each with synchronous=OFF")
+    for num_rows in sizes:
+        legacy, upsert = bench(num_rows)
+        print(f"{num_rows:>11,} rows: legacy {legacy * 1e6:7.1f} us/entry, upsert {upsert * 1e6:7.1f} us/entry "
+              f"({legacy / upsert:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark for opening a database with a large banlist
+Compares deferring banlist decryption until the banlist is listed with the old path that decrypted every entry on open
+Run from the repository root: python -m benchmarks.bench_banlist [num_banned ...]
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+from nexus.Freqlog.backends import SQLiteBackend
+from nexus.Freqlog.Definitions import BanlistAttr, BanlistEntry
+
+from benchmarks.bench_score import best_of
+
+
+def populate_banlist(backend: SQLiteBackend, num_banned: int) -> None:
+    """Ban num_banned words in one transaction, as a bulk import would"""
+    backend.cursor.executemany("INSERT INTO banlist (word, dateadded, hash) VALUES (?, ?, ?)",
+                               ((backend.encrypt(f"banned{i}"), 1e9 + i, backend._hash_word(f"banned{i}"))
+                                for i in range(num_banned)))
+    backend.conn.commit()
+
+
+def legacy_open(db_path: str) -> SQLiteBackend:
+    """Open a backend and decrypt its banlist, as done on open before decryption was deferred"""
+    backend = SQLiteBackend(db_path, lambda _: "bench")
+    backend.legacy_banlist = [BanlistEntry(backend.decrypt(row[0]), datetime.fromtimestamp(row[1])) for row in
+                              backend._fetchall("SELECT word, dateadded FROM banlist")]
+    return backend
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    print("Opening a database (key already derived) and checking a word, then listing the banlist")
+    for num_banned in sizes:
+        with tempfile.TemporaryDirectory() as path:
+            db_path = os.path.join(path, "freqlog.db")
+            backend = SQLiteBackend(db_path, lambda _: "bench")
+            populate_banlist(backend, num_banned)
+            backend.close()
+
+            def deferred():
+                opened = SQLiteBackend(db_path, lambda _: "bench")
+                assert opened.check_banned("banned0")
+                opened.close()
+
+            def legacy():
+                opened = legacy_open(db_path)
+                assert opened.check_banned("banned0")
+                opened.close()
+
+            def listed():
+                opened = SQLiteBackend(db_path, lambda _: "bench")
+                assert len(opened.list_banned_words(0, BanlistAttr.word, False)) == num_banned
+                opened.close()
+
+            legacy_time, deferred_time, listed_time = best_of(legacy), best_of(deferred), best_of(listed)
+            print(f"{num_banned:>7,} banned: decrypted on open {legacy_time * 1e3:8.1f} ms, "
+                  f"deferred {deferred_time * 1e3:6.1f} ms ({legacy_time / deferred_time:,.0f}x), "
+                  f"open and list {listed_time * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
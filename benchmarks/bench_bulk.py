@@ -0,0 +1,52 @@
+"""
+Benchmark for banning, unbanning and deleting many words at once, as the GUI's multi-select and the CLI do
+Compares the batch methods (one transaction) with the old loops over the single-item methods (one commit each)
+Run from the repository root: python -m benchmarks.bench_bulk [num_words]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from nexus.Freqlog.backends import SQLiteBackend
+from nexus.Freqlog.Definitions import CaseSensitivity
+
+from benchmarks.bench_search import populate_words
+
+
+def timed(func: callable) -> float:
+    """Time of one call, in seconds"""
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    num_words = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    num_logged = num_words // 10  # Imported lists are mostly words that were never typed
+    print(f"{num_words:,} words ({num_logged:,} of them logged) out of {num_words * 10:,} logged words")
+    for name, bulk in (("loop", False), ("batch", True)):
+        with tempfile.TemporaryDirectory() as path:
+            backend = SQLiteBackend(os.path.join(path, "freqlog.db"), lambda _: "bench")
+            logged = populate_words(backend, num_words * 10)
+            words = [f"imported{i}" for i in range(num_words - num_logged)] + logged[:num_logged]
+            deleted = logged[num_logged:num_logged + num_words // 10]
+            now = datetime.now()
+            if bulk:
+                ban = timed(lambda: backend.ban_words(words, now))
+                unban = timed(lambda: backend.unban_words(words))
+                delete = timed(lambda: backend.delete_words(dict.fromkeys(deleted, CaseSensitivity.INSENSITIVE)))
+            else:
+                ban = timed(lambda: [backend.ban_word(word, now) for word in words])
+                unban = timed(lambda: [backend.unban_word(word) for word in words])
+                delete = timed(lambda: [backend.delete_word(word, CaseSensitivity.INSENSITIVE) for word in deleted])
+            assert not backend.check_banned(words[0]) and backend.num_words() == num_words * 10 - 2 * num_logged
+            print(f"{name:>6}: ban {ban * 1e3:8.1f} ms, unban {unban * 1e3:8.1f} ms, "
+                  f"delete {len(deleted):,} logged words {delete * 1e3:8.1f} ms")
+            backend.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark for logging words while the GUI refreshes its word list from the same database
+Compares rollback journal mode with WAL mode and pooled read-only connections
+Run from the repository root: python -m benchmarks.bench_concurrency [num_rows] [seconds]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from nexus.Freqlog.backends import SQLiteBackend
+
+from benchmarks.bench_backend import populate
+
+
+def percentiles(samples: list[float]) -> str:
+    """Median, p99 and max of latencies in seconds, formatted in milliseconds"""
+    if not samples:
+        return "no samples"
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return (f"median {statistics.median(samples) * 1e3:7.2f} ms, p99 {p99 * 1e3:7.2f} ms, "
+            f"max {samples[-1] * 1e3:7.2f} ms")
+
+
+def bench(num_rows: int, duration: float, wal: bool) -> None:
+    """Log words on one backend while another lists the top words, for duration seconds"""
+    with tempfile.TemporaryDirectory() as path:
+        db_path = os.path.join(path, "freqlog.db")
+        backend = SQLiteBackend(db_path, lambda _: "bench", wal=wal)
+        populate(backend, num_rows)
+        backend.close()
+
+        writer = SQLiteBackend(db_path, lambda _: "bench", wal=wal)
+        reader = SQLiteBackend(db_path, lambda _: "bench", wal=wal)
+        commits, reads, failures = [], [], [0]
+        stop = threading.Event()
+
+        def read():
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    reader.list_words(limit=100)
+                    reads.append(time.perf_counter() - start)
+                except Exception:  # Database locked for longer than the busy timeout
+                    failures[0] += 1
+
+        # sqlite3 connections stay on the thread that opened them, so the writer logs from this one
+        thread = threading.Thread(target=read)
+        thread.start()
+        now = datetime(2030, 1, 1)
+        end = time.perf_counter() + duration
+        i = 0
+        while time.perf_counter() < end:
+            i += 1
+            now += timedelta(milliseconds=1)
+            start = time.perf_counter()
+            try:
+                writer.log_word(f"new-w{i}", now - timedelta(milliseconds=300), now)
+                commits.append(time.perf_counter() - start)
+            except Exception:
+                failures[0] += 1
+        stop.set()
+        thread.join()
+        writer.close()
+        reader.close()
+
+    print(f"{'WAL' if wal else 'rollback':>8}: {len(commits):6} commits ({percentiles(commits)})")
+    print(f"{'':>8}  {len(reads):6} reads   ({percentiles(reads)})")
+    print(f"{'':>8}  {failures[0]:6} failed with the database locked")
+
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print(f"{num_rows:,} rows, logging words and listing the top 100 concurrently for {duration:g}s per mode")
+    for wal in (False, True):
+        bench(num_rows, duration, wal)
+
+
+if __name__ == "__main__":
+    main()
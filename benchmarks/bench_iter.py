@@ -0,0 +1,55 @@
+"""
+Benchmark for exporting every word in a large database
+Compares paging through words with a keyset iterator with the old path that loaded every word into a list first
+Run from the repository root: python -m benchmarks.bench_iter [num_words]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from nexus.Freqlog.backends import SQLiteBackend
+from nexus.Freqlog.Definitions import CaseSensitivity, WordMetadata, WordMetadataAttr
+
+from benchmarks.bench_search import populate_words
+
+
+def legacy_list_words(backend: SQLiteBackend) -> list[WordMetadata]:
+    """list_words() with no limit, as done before keyset iterators (now also the list_words() path)"""
+    res = backend._read_all("SELECT word, frequency, lastused, avgspeed FROM freqlog ORDER BY score DESC, word DESC")
+    return [WordMetadata(row[0], row[1], datetime.fromtimestamp(row[2]), timedelta(seconds=row[3])) for row in res]
+
+
+def measure(func: callable) -> tuple[float, int, int]:
+    """Run func, returning its time in seconds, the number of words it went through and its peak memory in bytes"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, count, peak
+
+
+def main():
+    num_words = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as path:
+        backend = SQLiteBackend(os.path.join(path, "freqlog.db"), lambda _: "bench")
+        backend.cursor.execute("PRAGMA synchronous = OFF")
+        populate_words(backend, num_words)
+        print(f"{num_words:,} words, going through all of them by score")
+        for name, func in (
+                ("list", lambda: len(legacy_list_words(backend))),
+                ("iterator", lambda: sum(1 for _ in backend.iter_words(WordMetadataAttr.score, True,
+                                                                       CaseSensitivity.SENSITIVE)))):
+            elapsed, count, peak = measure(func)
+            assert count == num_words
+            print(f"{name:>8}: {elapsed:6.2f} s, peak memory {peak / 2 ** 20:8.1f} MiB")
+        backend.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark for merging two databases into a new one, as the mergedb command does
+Compares the merge of attached databases in SQL with the old merge of entry lists in Python (quadratic, with a
+commit per entry, so it only runs for small databases)
+Run from the repository root: python -m benchmarks.bench_merge [num_words]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from nexus.Freqlog.backends import SQLiteBackend
+from nexus.Freqlog.Definitions import Age, CaseSensitivity, ChordMetadataAttr, WordMetadataAttr
+
+LEGACY_MAX_WORDS = 20_000  # Largest databases the old merge is run on
+
+
+def populate(backend: SQLiteBackend, first: int, num_words: int) -> None:
+    """Fill freqlog and chordlog (10:1) with entries first..first + num_words, so databases can overlap"""
+    start = datetime(2020, 1, 1).timestamp()
+    backend.cursor.executemany("INSERT INTO freqlog VALUES (?, ?, ?, ?)",
+                               ((f"w{i:08d}", 1 + i % 50, start + i, 0.5) for i in range(first, first + num_words)))
+    backend.cursor.executemany("INSERT INTO chordlog VALUES (?, ?, ?)",
+                               ((f"c{i:08d}", 1 + i % 50, start + i) for i in range(first // 10,
+                                                                                    (first + num_words) // 10)))
+    backend.conn.commit()
+
+
+def legacy_merge(backend: SQLiteBackend, src_db: SQLiteBackend, dst_db: SQLiteBackend) -> None:
+    """merge_backend() freqlog and chordlog merge as done before merging in SQL"""
+    src_words = src_db.list_words(0, WordMetadataAttr.word, False, CaseSensitivity.SENSITIVE)
+    words = [word.word for word in backend.list_words(0, WordMetadataAttr.word, False, CaseSensitivity.SENSITIVE)]
+    entries = backend.list_words(0, WordMetadataAttr.word, False, CaseSensitivity.SENSITIVE)
+    for src_word in src_words:
+        if src_word.word in words:
+            entries[words.index(src_word.word)] |= src_word
+        else:
+            entries.append(src_word)
+    for word in entries:
+        dst_db._insert_word(word.word, word.frequency, word.last_used, word.average_speed)
+    src_chords = src_db.list_chords(0, ChordMetadataAttr.chord, False, "")
+    chords = [chord.chord for chord in backend.list_chords(0, ChordMetadataAttr.chord, False, "")]
+    entries = backend.list_chords(0, ChordMetadataAttr.chord, False, "")
+    for src_chord in src_chords:
+        if src_chord.chord in chords:
+            entries[chords.index(src_chord.chord)] |= src_chord
+        else:
+            entries.append(src_chord)
+    for chord in entries:
+        dst_db._insert_chord(chord.chord, chord.frequency, chord.last_used)
+
+
+def main():
+    num_words = int(sys.argv[1]) if len(sys.argv) > 1 else LEGACY_MAX_WORDS
+    with tempfile.TemporaryDirectory() as path:
+        paths = [os.path.join(path, f"{name}.db") for name in ("a", "b", "legacy", "merged")]
+        backend, src_db = (SQLiteBackend(db_path, lambda _: "bench") for db_path in paths[:2])
+        populate(backend, 0, num_words)
+        populate(src_db, num_words // 2, num_words)  # Half of the entries are in both
+        src_db.close()
+        print(f"Two databases of {num_words:,} words and {num_words // 10:,} chords, half of them in both")
+
+        if num_words <= LEGACY_MAX_WORDS:
+            src_db, dst_db = SQLiteBackend(paths[1], lambda _: "bench"), SQLiteBackend(paths[2], lambda _: "bench")
+            start = time.perf_counter()
+            legacy_merge(backend, src_db, dst_db)
+            print(f"  Python: {time.perf_counter() - start:8.2f} s")
+            src_db.close()
+            dst_db.close()
+
+        start = time.perf_counter()
+        backend.merge_backend([paths[1]], paths[3], Age.OLDER, [lambda _: "bench"], lambda _: "bench")
+        print(f"     SQL: {time.perf_counter() - start:8.2f} s")
+        backend.close()
+        merged = SQLiteBackend(paths[3], lambda _: "bench")
+        assert merged.num_words(CaseSensitivity.SENSITIVE) == num_words * 3 // 2
+        merged.close()
+
+
+if __name__ == "__main__":
+    main()
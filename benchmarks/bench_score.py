@@ -0,0 +1,69 @@
+"""
+Benchmark for listing the top words and chords by score in a large database
+Compares the indexed score column with the old path that sorted every row in Python
+Run from the repository root: python -m benchmarks.bench_score [num_words] [limit]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from nexus.Freqlog.backends import SQLiteBackend
+from nexus.Freqlog.Definitions import CaseSensitivity, ChordMetadata, ChordMetadataAttr, WordMetadata, \
+    WordMetadataAttr
+
+from benchmarks.bench_backend import populate
+
+REPEATS = 5  # Best of
+
+
+def legacy_top_words(backend: SQLiteBackend, limit: int) -> list[WordMetadata]:
+    """list_words() by score as done before the score column: read every row, then sort in Python"""
+    res = backend._read_all("SELECT word, frequency, lastused, avgspeed FROM freqlog")
+    ret = sorted([WordMetadata(row[0], row[1], datetime.fromtimestamp(row[2]), timedelta(seconds=row[3]))
+                  for row in res], key=lambda x: x.score, reverse=True)
+    return ret[:limit]
+
+
+def legacy_top_chords(backend: SQLiteBackend, limit: int) -> list[ChordMetadata]:
+    """list_chords() by score as done before the score column"""
+    res = backend._read_all("SELECT chord, frequency, lastused FROM chordlog")
+    ret = sorted([ChordMetadata(row[0], row[1], datetime.fromtimestamp(row[2])) for row in res],
+                 key=lambda x: x.score, reverse=True)
+    return ret[:limit]
+
+
+def best_of(func: callable) -> float:
+    """Fastest of REPEATS calls, in seconds"""
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    num_words = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    with tempfile.TemporaryDirectory() as path:
+        backend = SQLiteBackend(os.path.join(path, "freqlog.db"), lambda _: "bench")
+        backend.cursor.execute("PRAGMA synchronous = OFF")
+        populate(backend, num_words + num_words // 10)  # populate() splits rows 10:1 between words and chords
+        print(f"{num_words:,} words and {num_words // 10:,} chords, top {limit} by score")
+        for name, legacy, indexed in (
+                ("words", lambda: legacy_top_words(backend, limit),
+                 lambda: backend.list_words(limit, WordMetadataAttr.score, True, CaseSensitivity.SENSITIVE)),
+                ("chords", lambda: legacy_top_chords(backend, limit),
+                 lambda: backend.list_chords(limit, ChordMetadataAttr.score, True))):
+            assert [m.score for m in legacy()] == [m.score for m in indexed()]
+            legacy_time, indexed_time = best_of(legacy), best_of(indexed)
+            print(f"{name:>6}: sorted in Python {legacy_time * 1e3:9.2f} ms, indexed {indexed_time * 1e3:7.3f} ms "
+                  f"({legacy_time / indexed_time:,.0f}x)")
+        backend.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark for searching words in a large database, as the GUI does on every keystroke in its search box
+Compares the trigram search index with the old LIKE '%search%' scan
+Run from the repository root: python -m benchmarks.bench_search [num_words]
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+from nexus.Freqlog.backends import SQLiteBackend
+from nexus.Freqlog.Definitions import CaseSensitivity, WordMetadataAttr
+
+from benchmarks.bench_score import best_of
+
+LIMIT = 100  # Default number of entries in the GUI table
+SYLLABLES = [c + v for c in "bcdfghjklmnprstvwyz" for v in "aeiou"] + ["th", "ng", "st", "er", "in", "re", "qu"]
+
+
+def populate_words(backend: SQLiteBackend, num_words: int, seed: int = 0) -> list[str]:
+    """Fill freqlog with num_words made up words of 1 to 5 syllables, with Zipf-like frequencies"""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < num_words:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(1, 5))))
+    words = sorted(words)
+    rng.shuffle(words)
+    backend.cursor.executemany("INSERT INTO freqlog VALUES (?, ?, ?, ?)",
+                               ((word, 1 + 10_000 // (i + 1), 1e9 + i, 0.5) for i, word in enumerate(words)))
+    backend.conn.commit()
+    return words
+
+
+def legacy_search(backend: SQLiteBackend, search: str) -> list[tuple]:
+    """list_words() search as done before the search index (sorted by score, now an indexed column)"""
+    return backend._read_all(f"SELECT word, frequency, lastused, avgspeed FROM freqlog WHERE word LIKE '%{search}%' "
+                             f"ORDER BY score DESC, word DESC LIMIT {LIMIT}")
+
+
+def main():
+    num_words = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as path:
+        backend = SQLiteBackend(os.path.join(path, "freqlog.db"), lambda _: "bench")
+        backend.cursor.execute("PRAGMA synchronous = OFF")
+        words = populate_words(backend, num_words)
+        backend.cursor.execute("INSERT INTO freqlog_search (freqlog_search) VALUES ('optimize')")  # As upgrades do
+        backend.conn.commit()
+        print(f"{num_words:,} words, top {LIMIT} by score containing the search")
+
+        # Searches typed one character at a time, from common to rare substrings
+        rng = random.Random(1)
+        for word in rng.sample([word for word in words if len(word) >= 8], 3):
+            for length in range(2, 9):
+                search = word[:length]
+                matches = len(backend.list_words(0, WordMetadataAttr.score, True, CaseSensitivity.SENSITIVE, search))
+                indexed = backend.list_words(LIMIT, WordMetadataAttr.score, True, CaseSensitivity.SENSITIVE, search)
+                assert [metadata.word for metadata in indexed] == [row[0] for row in legacy_search(backend, search)]
+                legacy_time = best_of(lambda: legacy_search(backend, search))
+                indexed_time = best_of(lambda: backend.list_words(LIMIT, WordMetadataAttr.score, True,
+                                                                  CaseSensitivity.SENSITIVE, search))
+                print(f"{search!r:>10} ({matches:>7,} matches): LIKE {legacy_time * 1e3:8.2f} ms, "
+                      f"indexed {indexed_time * 1e3:8.3f} ms ({legacy_time / indexed_time:,.1f}x)")
+        backend.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Microbenchmark for per-key classification and segmentation of captured events
+Run from the repository root: python -m benchmarks.bench_segmenter [num_events]
+"""
+
+import random
+import sys
+import tempfile
+import timeit
+
+import vinput
+
+from nexus.Freqlog.BatchSegmenter import RECORD_DTYPE, BatchSegmenter
+from nexus.Freqlog.Definitions import ActionType, Defaults
+from nexus.Freqlog.Events import EventClock
+from nexus.Freqlog.Journal import Journal
+from nexus.Freqlog.Segmenter import Segmenter
+
+
+def make_events(n: int, seed: int = 0) -> list[tuple]:
+    """Generate n synthetic captured events: typed words, chords, backspaces and the odd mouse click"""
+    rng = random.Random(seed)
+    letters = [chr(c).encode() for c in range(ord('a'), ord('z') + 1)]
+    events = []
+    t = 0
+    while len(events) < n:
+        chord = rng.random() < 0.3
+        for _ in range(rng.randint(2, 9)):
+            t += rng.randint(1, 3) * 1_000_000 if chord else rng.randint(60, 180) * 1_000_000
+            events.append((ActionType.PRESS, rng.choice(letters), 0, t))
+            if not chord and rng.random() < 0.05:
+                t += 150_000_000
+                events.append((ActionType.PRESS, b'\b', 0, t))
+        t += rng.randint(50, 400) * 1_000_000
+        events.append((ActionType.PRESS, b' ', 0, t))
+        if rng.random() < 0.02:
+            events.append((ActionType.PRESS, vinput.MouseButtonEvent(), 0, t))
+    return events[:n]
+
+
+def legacy_classify(events: list[tuple], allowed_chars: set) -> int:
+    """Per-key checks as done inline in _process_queue before the lookup table"""
+    def is_key(x):
+        if isinstance(x, vinput.MouseButtonEvent):
+            return False
+        return x != '' and x != '\0'
+
+    n = 0
+    for _, key, _, _ in events:
+        if isinstance(key, bytes):
+            key = key.decode('utf-8')
+        if key == '\b':
+            n += 1
+        elif is_key(key) and (key in " \t\n\r" or key not in allowed_chars):
+            n += 2
+        elif not is_key(key):
+            n += 3
+        else:
+            n += 4
+    return n
+
+
+def table_classify(events: list[tuple], segmenter: Segmenter) -> int:
+    """Per-key checks using the segmenter's precomputed table"""
+    classes = segmenter.classes
+    classify = segmenter._classify
+    n = 0
+    for _, key, _, _ in events:
+        try:
+            cls, _ = classes[key]
+        except (KeyError, TypeError):
+            cls, _ = classify(key)
+        n += cls.value
+    return n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    events = make_events(n)
+    counts = {"words": 0, "chords": 0}
+
+    def new_segmenter() -> Segmenter:
+        def on_word(*_):
+            counts["words"] += 1
+
+        def on_chord(*_):
+            counts["chords"] += 1
+
+        return Segmenter(on_word, on_chord, Defaults.DEFAULT_ALLOWED_CHARS, Defaults.DEFAULT_ALLOWED_FIRST_CHARS,
+                         vinput.KeyboardModifiers(), Defaults.DEFAULT_CHORD_CHAR_THRESHOLD)
+
+    segmenter = new_segmenter()
+    legacy = min(timeit.repeat(lambda: legacy_classify(events, Defaults.DEFAULT_ALLOWED_CHARS), number=1, repeat=5))
+    table = min(timeit.repeat(lambda: table_classify(events, segmenter), number=1, repeat=5))
+    full = min(timeit.repeat(lambda: new_segmenter().feed_all(events), number=1, repeat=5))
+    threshold = int(Defaults.DEFAULT_NEW_WORD_THRESHOLD * 1_000_000_000)
+    timed = min(timeit.repeat(lambda: new_segmenter().feed_all(events, threshold), number=1, repeat=5))
+
+    print(f"{n} events")
+    print(f"classify (legacy checks): {legacy * 1e9 / n:8.1f} ns/event")
+    print(f"classify (lookup table):  {table * 1e9 / n:8.1f} ns/event ({legacy / table:.2f}x)")
+    print(f"segment (Segmenter):      {full * 1e9 / n:8.1f} ns/event, {n / full:,.0f} events/s")
+    print(f"({counts['words'] // 10} words, {counts['chords'] // 10} chords per run)")
+
+    if not BatchSegmenter.available():
+        print("batch segmentation: numpy not installed")
+        return
+    with tempfile.TemporaryDirectory() as path:
+        journal = Journal(path, EventClock(), max_segment_size=sys.maxsize)
+        journal.append(events)
+        journal.close()
+        _, records, _ = BatchSegmenter.read_segment(Journal.segment_files(path)[0])
+    assert records.dtype == RECORD_DTYPE
+    batches = []
+
+    def batch_segment():
+        batches.append(BatchSegmenter(new_segmenter(), threshold))
+        batches[-1].feed(records)
+        batches[-1].flush()
+
+    batch = min(timeit.repeat(batch_segment, number=1, repeat=5))
+    print(f"segment with timeouts:    {timed * 1e9 / n:8.1f} ns/event, {n / timed:,.0f} events/s")
+    print(f"segment (BatchSegmenter): {batch * 1e9 / n:8.1f} ns/event, {n / batch:,.0f} events/s "
+          f"({timed / batch:.2f}x, {batches[-1].vectorized / n:.0%} vectorized)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Vectorized word/chord segmentation of recorded events, for replaying journals in bulk."""
+
+import logging
+import os
+from typing import Iterator
+
+from .Events import EventClock
+from .Journal import HEADER, Journal, RecordKind
+from .Segmenter import KeyClass, Segmenter
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, it's only needed to segment recordings in batches
+    np = None
+
+# Journal.RECORD as a numpy dtype
+RECORD_DTYPE = None if np is None else np.dtype(
+    [("time_ns", "<i8"), ("modifiers", "<u2"), ("kind", "u1"), ("code", "u1")])
+
+# Longest run of chars classified with array operations. The closed-form average below is exact, while the streaming
+# segmenter accumulates it in floats; up to this length the rounding error can't change which side of the chord
+# threshold a word falls on
+MAX_VECTORIZED_RUN = 64
+
+
+class BatchSegmenter:
+    """
+    Segments arrays of journal records into the same words and chords as feeding them to a Segmenter one at a time
+    Runs of chars (and backspaces) that were typed slower than the chord threshold and are ended by a separator, i.e.
+    most typed words, are classified with array operations over the whole batch. Everything else (chords, word deletes,
+    mouse clicks, idle timeouts, ...) is fed to the wrapped Segmenter, which holds the state between the two.
+    """
+
+    def __init__(self, segmenter: Segmenter, new_word_threshold_ns: int) -> None:
+        """
+        Initialize the batch segmenter
+        :param segmenter: Streaming segmenter to take settings and callbacks from, and to fall back to
+        :param new_word_threshold_ns: Nanoseconds between events after which the word in progress is finished
+        :raises ImportError: If numpy isn't installed
+        """
+        if np is None:
+            raise ImportError("Batch segmentation requires numpy")
+        self.segmenter = segmenter
+        self.new_word_threshold_ns = new_word_threshold_ns
+        # Key byte -> KeyClass value
+        self.classes = np.array([segmenter._classify(bytes([code]))[0].value for code in range(256)], dtype=np.uint8)
+        self.events = 0  # Number of events segmented
+        self.vectorized = 0  # Number of those classified with array operations
+
+    @staticmethod
+    def available() -> bool:
+        """Whether batch segmentation can be used (i.e. numpy is installed)"""
+        return np is not None
+
+    @staticmethod
+    def read_segment(file_path: str) -> tuple[EventClock, "np.ndarray", int | None]:
+        """
+        Read a journal segment into a record array (see Journal.read_segment())
+        :param file_path: Path to the segment file
+        :returns: Clock of the events, RECORD_DTYPE array of key presses, releases and mouse buttons, and the number of
+                  them before the last checkpoint (None if there is no checkpoint in this segment)
+        :raises ValueError: If the file isn't a journal segment
+        """
+        clock, data = Journal.read_segment_bytes(file_path)
+        records = np.frombuffer(data, dtype=RECORD_DTYPE)
+        kind = records["kind"]
+        is_event = (kind == RecordKind.KEY_PRESS.value) | (kind == RecordKind.KEY_RELEASE.value) | (
+                kind == RecordKind.MOUSE_BUTTON.value)
+        checkpoints = np.flatnonzero(kind == RecordKind.CHECKPOINT.value)
+        checkpoint = int(np.count_nonzero(is_event[:checkpoints[-1]])) if len(checkpoints) else None
+        unknown = len(records) - len(checkpoints) - int(np.count_nonzero(is_event))
+        if unknown:
+            logging.warning(f"Skipping {unknown} journal records of unknown kind in {file_path}")
+        return clock, records[is_event], checkpoint
+
+    @classmethod
+    def iter_segments(cls, path: str) -> Iterator[tuple[EventClock, "np.ndarray", int | None]]:
+        """
+        Read journal segments one at a time as record arrays (see Journal.iter_segments())
+        :param path: Journal directory or a single segment file
+        """
+        for segment in Journal.segment_files(path):
+            if os.path.getsize(segment) < HEADER.size:
+                continue
+            yield cls.read_segment(segment)
+
+    def feed(self, records: "np.ndarray") -> None:
+        """
+        Process a batch of recorded events
+        :param records: RECORD_DTYPE array of key presses, releases and mouse buttons in the order they were captured
+        """
+        n = len(records)
+        if not n:
+            return
+        self.events += n
+        segmenter = self.segmenter
+        t = records["time_ns"].astype(np.int64)
+        modifiers = records["modifiers"]
+        codes = records["code"]
+        cls = np.where(records["kind"] == RecordKind.KEY_PRESS.value, self.classes[codes], 0)
+
+        # Runs of chars and backspaces that could make up a typed word
+        is_char = (cls == KeyClass.CHAR.value) & ((modifiers & segmenter.banned_modifiers) == 0)
+        is_bs = (cls == KeyClass.BACKSPACE.value) & ((modifiers & segmenter.word_del_modifiers) == 0)
+        in_run = is_char | is_bs
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], in_run, [False]))))
+        starts, stops = edges[::2], edges[1::2]  # Each run is [start, stop), and stop is the event ending it
+        if not len(starts):
+            segmenter.feed_all(Journal.unpack_records(records.tobytes())[0], self.new_word_threshold_ns)
+            return
+        lengths = stops - starts
+        offsets = np.cumsum(lengths) - lengths  # Start of each run among the events in runs
+
+        # Word length after each event of a run, which must not go negative (backspace on an empty word isn't one)
+        depth = np.cumsum(is_char.astype(np.int64) - is_bs)
+        base = np.where(starts > 0, depth[np.maximum(starts - 1, 0)], 0)
+        emptied = np.add.reduceat(depth[in_run] < np.repeat(base, lengths), offsets) > 0
+        has_bs = np.add.reduceat(is_bs[in_run], offsets) > 0
+
+        # Timing is averaged over the chars after the last backspace, and the word is ended by a separator that comes
+        # before the idle timeout. With deltas d_i from the first char p, the segmenter's running average works out to
+        # (d_1 + sum(d_i)) / count, i.e. (t[p + 1] - t[p] + t[last] - t[p]) / count
+        last_bs = np.maximum.accumulate(np.where(is_bs, np.arange(n), -1))
+        first = np.maximum(last_bs[stops - 1] + 1, starts)
+        count = stops - first
+        ended = stops < n
+        stops_c = np.minimum(stops, n - 1)
+        first_c = np.minimum(first, n - 1)
+        second_c = np.minimum(first + 1, n - 1)
+        total = t[second_c] - t[first_c] + t[stops - 1] - t[first_c]
+
+        deltas = np.diff(t)
+        bad_gaps = np.concatenate(([0], np.cumsum((deltas < 0) | (deltas > self.new_word_threshold_ns))))
+        vectorized = (ended & is_char[starts] & (cls[stops_c] == KeyClass.SEPARATOR.value) & ~emptied &
+                      (count >= 2) & (lengths <= MAX_VECTORIZED_RUN) & (t[second_c] > t[first_c]) &
+                      (bad_gaps[stops_c] == bad_gaps[starts]) & (total > segmenter.chord_char_threshold_ns * count))
+
+        raw = codes.tobytes()
+        times = t.tolist()
+        pos = 0
+        for start, stop, backspaced in zip(starts[vectorized].tolist(), stops[vectorized].tolist(),
+                                           has_bs[vectorized].tolist()):
+            if pos < start:
+                segmenter.feed_all(Journal.unpack_records(records[pos:start].tobytes())[0], self.new_word_threshold_ns)
+            if segmenter.word and (
+                    (segmenter.last_event_time is not None and
+                     times[start] - segmenter.last_event_time > self.new_word_threshold_ns) or
+                    (segmenter.last_key_was_disallowed and segmenter.word_end_time and
+                     times[start] - segmenter.word_end_time > segmenter.chord_char_threshold_ns)):
+                segmenter.flush()  # The run's first char finishes the word in progress (i.e. a chord), see feed()
+            if segmenter.word_start_time is not None:  # Word in progress, the run doesn't start a new one
+                segmenter.feed_all(Journal.unpack_records(records[start:stop + 1].tobytes())[0],
+                                   self.new_word_threshold_ns)
+            else:
+                # The separator finishes the word, as in Segmenter.flush()
+                if backspaced:
+                    chars = []
+                    for code in raw[start:stop]:
+                        if code == 8:
+                            chars.pop()
+                        else:
+                            chars.append(chr(code))
+                    word = "".join(chars).strip()
+                else:
+                    word = raw[start:stop].decode("ascii").strip()
+                if len(word) >= 2:
+                    segmenter.on_word(word, times[start], times[stop - 1])
+                segmenter.last_event_time = times[stop]
+                self.vectorized += stop + 1 - start
+            pos = stop + 1
+        if pos < n:
+            segmenter.feed_all(Journal.unpack_records(records[pos:].tobytes())[0], self.new_word_threshold_ns)
+
+    def flush(self) -> None:
+        """Log the word in progress, see Segmenter.flush()"""
+        self.segmenter.flush()
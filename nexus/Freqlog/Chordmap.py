@@ -0,0 +1,120 @@
+"""Index of a device's chordmap outputs, for checking logged chords against it."""
+
+from enum import Enum
+from typing import Iterable
+
+
+class Modification(Enum):
+    """How a logged chord was modified from the output in the chordmap"""
+    NONE = 0
+    CASE = 1  # Capitalized, upper or lower case
+    PLURAL = 2
+    PAST_TENSE = 3
+    GERUND = 4
+
+
+# Suffix added by each modification, after any doubled final consonant (i.e. "stopped" is "stop" + "p" + "ed")
+_SUFFIXES: dict[str, Modification] = {
+    "s": Modification.PLURAL, "es": Modification.PLURAL, "ies": Modification.PLURAL,
+    "d": Modification.PAST_TENSE, "ed": Modification.PAST_TENSE, "ied": Modification.PAST_TENSE,
+    "ing": Modification.GERUND, "ying": Modification.GERUND,
+}
+_VOWELS = set("aeiou")
+
+
+def _variants(output: str) -> Iterable[tuple[str, Modification]]:
+    """Get the usual English plural, past tense and gerund forms of a (lower case) chord output"""
+    last, before_last = output[-1:], output[-2:-1]
+    consonant_y = last == "y" and before_last not in _VOWELS
+    if consonant_y:
+        yield output[:-1] + "ies", Modification.PLURAL
+        yield output[:-1] + "ied", Modification.PAST_TENSE
+    elif output.endswith(("s", "x", "z", "ch", "sh")):
+        yield output + "es", Modification.PLURAL
+    else:
+        yield output + "s", Modification.PLURAL
+    if last == "e":
+        yield output + "d", Modification.PAST_TENSE
+    elif not consonant_y:
+        yield output + "ed", Modification.PAST_TENSE
+    if output.endswith("ie"):
+        yield output[:-2] + "ying", Modification.GERUND
+    elif last == "e" and before_last != "e":
+        yield output[:-1] + "ing", Modification.GERUND
+    else:
+        yield output + "ing", Modification.GERUND
+
+
+class ChordmapIndex:
+    """
+    Chordmap outputs indexed for matching logged chords
+    Outputs and their precomputed modification variants are kept in a case-folded hash map for O(1) lookups, and a
+    trie of outputs matches the variants that aren't precomputed (i.e. doubled final consonants)
+    """
+
+    def __init__(self, outputs: Iterable[str] = ()) -> None:
+        """
+        Initialize the index
+        :param outputs: Chord outputs (phrases) to add
+        """
+        self.outputs: set[str] = set()
+        self._variants: dict[str, tuple[str, Modification]] = {}  # Output or folded variant -> (output, modification)
+        self._trie: dict = {}  # Char -> child node, None -> output ending at this node
+        for output in outputs:
+            self.add(output)
+
+    def add(self, output: str) -> None:
+        """
+        Add a chord output and its modification variants
+        :param output: Chord output (phrase), as stored on the device
+        """
+        output = output.strip()
+        if not output or output in self.outputs:
+            return
+        self.outputs.add(output)
+        folded = output.lower()
+        self._variants[output] = (output, Modification.NONE)  # Outputs take precedence over variants of others
+        if folded != output and self._variants.get(folded, (None, None))[1] is not Modification.NONE:
+            self._variants[folded] = (output, Modification.CASE)
+        for variant, modification in _variants(folded):
+            self._variants.setdefault(variant, (output, modification))
+        node = self._trie
+        for char in folded:
+            node = node.setdefault(char, {})
+        node.setdefault(None, output)
+
+    def __len__(self) -> int:
+        return len(self.outputs)
+
+    def __contains__(self, chord: str) -> bool:
+        """Whether a chord is an output in the chordmap or a modification of one"""
+        return self.match(chord) is not None
+
+    def match(self, chord: str) -> tuple[str, Modification] | None:
+        """
+        Find the chordmap output a logged chord came from
+        :param chord: Logged chord
+        :returns: The output and how the chord was modified from it, or None if the chord isn't in the chordmap
+        """
+        found = self._variants.get(chord)
+        if found is not None:
+            return found
+        folded = chord.lower()
+        found = self._variants.get(folded)
+        if found is not None:
+            return found if found[1] is not Modification.NONE else (found[0], Modification.CASE)
+
+        # Walk the trie for the longest output that is a prefix of the chord followed by a modification suffix
+        found = None
+        node = self._trie
+        for i, char in enumerate(folded[:-1]):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                suffix = folded[i + 1:]
+                if suffix[0] == char and char not in _VOWELS:  # Doubled final consonant
+                    suffix = suffix[1:]
+                if suffix in _SUFFIXES:
+                    found = node[None], _SUFFIXES[suffix]
+        return found
@@ -1,13 +1,31 @@
+import json
 import os
 import sys
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from enum import Enum
-from typing import Any, Self
+from enum import Enum, Flag
+from typing import Any, Callable, Self
 
 from nexus import __author__
 import vinput
 
 
+class CaptureStream(Flag):
+    """Flags for optional input event streams to capture (key presses are always captured)"""
+    NONE = 0
+    KEY_RELEASE = 1
+    MOUSE_BUTTON = 2
+    MOUSE_MOVE = 4
+
+
+class OverflowPolicy(Enum):
+    """What to do with captured events when the event buffer is full"""
+    DROP = 1
+    BLOCK = 2
+    SPILL = 3
+
+
 class Defaults:
     # Default allowed [first] chars: [a-z, A-Z], 0-9, apostrophe, dash, underscore, slash, tilde
     DEFAULT_ALLOWED_FIRST_CHARS: set = \
@@ -20,9 +38,26 @@ class Defaults:
     # TODO: uncomment above line when first char detection is implemented
     DEFAULT_NEW_WORD_THRESHOLD: float = 5  # seconds after which character input is considered a new word
     DEFAULT_CHORD_CHAR_THRESHOLD: int = 5  # milliseconds between characters in a chord to be considered a chord
+    DEFAULT_WRITE_BUFFER_SIZE: int = 256  # distinct buffered words/chords after which the write-behind buffer flushes
+    DEFAULT_WRITE_BUFFER_INTERVAL: float = 60  # seconds after which the write-behind buffer flushes
+    DEFAULT_BUSY_TIMEOUT: float = 5  # seconds to wait for another connection's lock before giving up
+    DEFAULT_READER_POOL_SIZE: int = 2  # idle read-only connections kept open per backend
+    # Mouse clicks end words, releases and mouse movement are not used by the logger
+    DEFAULT_CAPTURE: CaptureStream = CaptureStream.MOUSE_BUTTON
+    DEFAULT_EVENT_BUFFER_SIZE: int = 4096  # max captured events waiting to be processed
+    DEFAULT_OVERFLOW_POLICY: OverflowPolicy = OverflowPolicy.DROP
+    DEFAULT_JOURNAL_SEGMENT_SIZE: int = 4 * 1024 * 1024  # bytes after which a new journal segment file is started
+    DEFAULT_JOURNAL_SYNC_INTERVAL: float = 1  # seconds after which journaled events are fsync'd
+    DEFAULT_JOURNAL_DIR_SUFFIX: str = "-events"  # appended to the db path for the journal dir (SQLite uses -journal)
     DEFAULT_DB_FILE: str = "nexus_freqlog_db.sqlite3"
     DEFAULT_NUM_WORDS_CLI: int = 10
     DEFAULT_NUM_WORDS_GUI: int = 100
+    DEFAULT_PAGE_SIZE: int = 1000  # entries fetched per query when iterating over words/chords
+    DEFAULT_HISTORY_DAYS: int = 90  # days of usage history kept per day before rolling up into weeks
+    DEFAULT_HISTORY_WEEKS: int = 104  # weeks of usage history kept per week before rolling up into months
+    DEFAULT_HISTORY_DAYS_CLI: int = 7  # days of usage history shown by default
+    DEFAULT_PROGRESS_INTERVAL: float = 0.1  # seconds between progress callbacks of long operations
+    DEFAULT_MERGE_CHUNK_SIZE: int = 100_000  # entries per source merged (and checkpointed) per transaction
 
     # Set per platform
     DEFAULT_DB_PATH: str
@@ -179,3 +214,137 @@ class BanlistAttr(Enum):
     """Enum for banlist attributes"""
     word = "word"
     date_added = "dateadded"
+
+
+class HistoryPeriod(Enum):
+    """Enum for the length of usage history buckets"""
+    DAY = 1
+    WEEK = 2
+    MONTH = 3
+
+
+class HistoryEntry:
+    """Number of times a word or chord was used in a usage history bucket"""
+
+    def __init__(self, entry: str, start: datetime, period: HistoryPeriod, frequency: int) -> None:
+        self.entry = entry
+        self.start = start
+        self.period = period
+        self.frequency = frequency
+
+    def __str__(self) -> str:
+        return f"Entry: {self.entry} | {self.period.name.capitalize()} of {self.start.date()} | " \
+               f"Frequency: {self.frequency}"
+
+
+class KeysetIterator:
+    """
+    Iterator over sorted entries, fetched a page at a time after the sort key of the last one (keyset pagination),
+    so memory use doesn't grow with the number of entries
+    Can be resumed after the last returned entry with its cursor
+    """
+
+    def __init__(self, fetch_page: Callable[[tuple | None, int], list[tuple[Any, tuple]]], page_size: int,
+                 cursor: str | None = None) -> None:
+        """
+        Initialize the iterator
+        :param fetch_page: Callback to get up to page_size (entry, sort key) pairs in order after a sort key
+                Should take two arguments: the sort key of the last returned entry (None for the first page), and
+                the number of entries to get
+        :param page_size: Number of entries to fetch at a time
+        :param cursor: Cursor of an iterator over the same entries to resume after its last returned entry
+        :raises ValueError: If the cursor is invalid
+        """
+        if page_size <= 0:
+            raise ValueError("page_size must be positive")
+        key = json.loads(cursor) if cursor else None  # json.JSONDecodeError is a ValueError
+        if key is not None and not isinstance(key, list):
+            raise ValueError(f"Invalid cursor: {cursor}")
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self._key: tuple | None = tuple(key) if key is not None else None  # Sort key of the last returned entry
+        self._page: deque[tuple[Any, tuple]] = deque()
+        self._last_page = False
+
+    @property
+    def cursor(self) -> str | None:
+        """Opaque token to resume after the last returned entry, None if no entries were returned or resumed after"""
+        return json.dumps(self._key) if self._key is not None else None
+
+    def __iter__(self) -> Self:
+        return self
+
+    def __next__(self) -> Any:
+        if not self._page:
+            if self._last_page:
+                raise StopIteration
+            self._page.extend(self.fetch_page(self._key, self.page_size))
+            self._last_page = len(self._page) < self.page_size
+            if not self._page:
+                raise StopIteration
+        entry, self._key = self._page.popleft()
+        return entry
+
+
+class Progress:
+    """Progress of a long-running operation, passed to progress callbacks as it advances"""
+
+    def __init__(self, task: str, total: int, callback: Callable[[Self], None] | None = None, done: int = 0,
+                 unit: str = "rows", interval: float = Defaults.DEFAULT_PROGRESS_INTERVAL) -> None:
+        """
+        Initialize progress, calling the callback once
+        :param task: What the operation is doing
+        :param total: Number of rows the operation goes through (0 if unknown)
+        :param callback: Callback to call with this object as the operation advances, at most every interval seconds,
+                and once when it is finished
+        :param done: Number of rows done before now, when resuming the operation
+        :param unit: What the operation counts (rows unless otherwise stated)
+        :param interval: Minimum seconds between callbacks
+        """
+        self.task = task
+        self.total = total
+        self.done = done
+        self.unit = unit
+        self.callback = callback
+        self.interval = interval
+        self.finished = False
+        self._resumed_at = done  # Rows done before now don't count towards the rate
+        self._start = time.monotonic()
+        self._last_report = self._start
+        if self.callback:
+            self.callback(self)
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the operation started (or resumed)"""
+        return time.monotonic() - self._start
+
+    @property
+    def rate(self) -> float:
+        """Rows per second since the operation started (or resumed)"""
+        elapsed = self.elapsed
+        return (self.done - self._resumed_at) / elapsed if elapsed > 0 else 0.0
+
+    def advance(self, rows: int = 1) -> None:
+        """
+        Add rows done, calling the callback if it is due
+        :param rows: Number of rows done since the last call
+        """
+        self.done += rows
+        now = time.monotonic()
+        if self.callback and now - self._last_report >= self.interval:
+            self._last_report = now
+            self.callback(self)
+
+    def finish(self) -> None:
+        """Mark the operation as done, calling the callback"""
+        self.total = self.done  # Totals are estimates for some operations
+        self.finished = True
+        if self.callback:
+            self.callback(self)
+
+    def __str__(self) -> str:
+        if self.total <= 0:
+            return f"{self.task}: {self.done:,} {self.unit} ({self.rate:,.0f}/s)"
+        return (f"{self.task}: {self.done:,}/{self.total:,} {self.unit} "
+                f"({self.done / self.total:.0%}, {self.rate:,.0f}/s)")
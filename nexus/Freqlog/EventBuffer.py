@@ -0,0 +1,144 @@
+"""Bounded ring buffer between the input listener and Freqlog's queue processor."""
+
+import logging
+import time
+from collections import deque
+from threading import Condition, RLock
+from typing import Any
+
+from .Definitions import Defaults, OverflowPolicy
+
+
+class EventBuffer:
+    """
+    Bounded ring buffer of captured events with a single consumer that drains it in batches
+    When full, new events are handled according to the overflow policy:
+        DROP: discard the new event (counted in `dropped`)
+        BLOCK: block the producer until the consumer makes room (backpressure on the listener thread)
+        SPILL: append the event to an unbounded overflow list, drained after the ring (counted in `spilled`)
+    """
+
+    def __init__(self, capacity: int = Defaults.DEFAULT_EVENT_BUFFER_SIZE,
+                 overflow: OverflowPolicy = Defaults.DEFAULT_OVERFLOW_POLICY) -> None:
+        """
+        Initialize the buffer
+        :param capacity: Maximum number of events held in the ring
+        :param overflow: What to do with new events when the ring is full
+        :raises ValueError: If capacity is not positive
+        """
+        if capacity <= 0:
+            raise ValueError("Event buffer capacity must be greater than 0")
+        self.capacity = capacity
+        self.overflow = overflow
+        self._ring: list[Any] = [None] * capacity
+        self._head: int = 0  # Index of the oldest event in the ring
+        self._size: int = 0  # Number of events in the ring
+        self._spill: deque = deque()  # Events that overflowed the ring (SPILL policy only)
+        self._lock = RLock()  # Reentrant so close() can be called from a signal handler on the consumer's thread
+        self._not_empty = Condition(self._lock)
+        self._not_full = Condition(self._lock)
+        self.closed: bool = False
+
+        # Counters
+        self.accepted: int = 0  # Events put in the ring or spill
+        self.dropped: int = 0
+        self.spilled: int = 0
+        self.max_depth: int = 0
+        self._rate: float = 0  # Events per second in the last complete window
+        self._window_start: float = time.monotonic()
+        self._window_count: int = 0
+
+    def put(self, event: Any) -> bool:
+        """
+        Add an event to the buffer
+        :param event: Event to add
+        :returns: True if the event was buffered, False if it was dropped or the buffer is closed
+        """
+        with self._not_empty:
+            if self.closed:
+                return False
+
+            # Events per second over ~1s windows
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._rate = self._window_count / (now - self._window_start)
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+
+            if self._size == self.capacity or self._spill:  # Keep order once events have spilled
+                match self.overflow:
+                    case OverflowPolicy.DROP:
+                        if self.dropped == 0:
+                            logging.warning(f"Event buffer full ({self.capacity} events), dropping new events")
+                        self.dropped += 1
+                        return False
+                    case OverflowPolicy.BLOCK:
+                        while self._size == self.capacity and not self.closed:
+                            self._not_full.wait()
+                        if self.closed:
+                            return False
+                    case OverflowPolicy.SPILL:
+                        if not self._spill:
+                            logging.warning(f"Event buffer full ({self.capacity} events), spilling new events")
+                        self._spill.append(event)
+                        self.spilled += 1
+                        self.accepted += 1
+                        self._not_empty.notify()
+                        return True
+            self._ring[(self._head + self._size) % self.capacity] = event
+            self._size += 1
+            self.accepted += 1
+            if self._size > self.max_depth:
+                self.max_depth = self._size
+            self._not_empty.notify()
+            return True
+
+    def drain(self, timeout: float | None = None, max_items: int | None = None) -> list[Any]:
+        """
+        Remove and return buffered events, oldest first
+        :param timeout: Seconds to wait for an event if the buffer is empty, None to wait indefinitely
+        :param max_items: Maximum number of events to return, None for all of them
+        :returns: List of events, empty if the timeout expired or the buffer is closed and empty
+        """
+        with self._not_empty:
+            if not self._size and not self._spill and not self.closed:
+                self._not_empty.wait(timeout)
+            n = self._size if max_items is None else min(self._size, max_items)
+            end = self._head + n
+            if end <= self.capacity:
+                batch = self._ring[self._head:end]
+            else:  # Wrapped around
+                batch = self._ring[self._head:] + self._ring[:end - self.capacity]
+            self._head = end % self.capacity
+            self._size -= n
+            if self._spill and not self._size:  # Spilled events are newer than everything in the ring
+                while self._spill and (max_items is None or len(batch) < max_items):
+                    batch.append(self._spill.popleft())
+            if n:
+                self._not_full.notify_all()
+            return batch
+
+    def close(self) -> None:
+        """Stop accepting events and wake up the consumer and any blocked producers"""
+        with self._not_empty:
+            self.closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    @property
+    def depth(self) -> int:
+        """Number of events waiting to be drained"""
+        return self._size + len(self._spill)
+
+    @property
+    def events_per_second(self) -> float:
+        """Rate of incoming events over the last ~1s window"""
+        if time.monotonic() - self._window_start >= 2:  # No events in the last window
+            return 0
+        return self._rate
+
+    def __str__(self) -> str:
+        return f"depth: {self.depth}/{self.capacity} (max {self.max_depth}) | " \
+               f"events/s: {round(self.events_per_second, 1)} | accepted: {self.accepted} | " \
+               f"dropped: {self.dropped} | spilled: {self.spilled} | overflow: {self.overflow.name}"
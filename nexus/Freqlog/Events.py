@@ -0,0 +1,65 @@
+"""Compact records for captured input events."""
+
+import time
+from datetime import datetime, timedelta
+from typing import Iterable
+
+import vinput
+
+from .Definitions import Defaults
+
+# Captured events are plain tuples to keep allocations on the capture path down:
+#   (action: ActionType, key: str | bytes | vinput.MouseButtonEvent, modifiers: int, time_ns: int)
+# modifiers is a bitmask (see MODIFIER_BITS), time_ns a monotonic time.perf_counter_ns() timestamp
+
+
+def pack_modifiers(modifiers: vinput.KeyboardModifiers) -> int:
+    """Pack a KeyboardModifiers struct into an int bitmask by reading its raw bitfield storage"""
+    return int.from_bytes(bytes(modifiers), "little")
+
+
+def _modifier_bit(name: str) -> int:
+    """Get the bit used by a modifier in pack_modifiers() bitmasks"""
+    modifiers = vinput.KeyboardModifiers()
+    setattr(modifiers, name, True)
+    return pack_modifiers(modifiers)
+
+
+# Bit of each modifier in packed bitmasks, derived from the struct layout so it matches pack_modifiers()
+MODIFIER_BITS: dict[str, int] = {name: _modifier_bit(name) for name in Defaults.MODIFIER_NAMES}
+
+
+def modifier_mask(modifiers: vinput.KeyboardModifiers | Iterable[str]) -> int:
+    """
+    Get the bitmask for a set of modifiers
+    :param modifiers: KeyboardModifiers struct, or names of modifiers (see Defaults.MODIFIER_NAMES)
+    :return: Bitmask compatible with pack_modifiers()
+    """
+    if isinstance(modifiers, vinput.KeyboardModifiers):
+        return pack_modifiers(modifiers)
+    mask = 0
+    for name in modifiers:
+        mask |= MODIFIER_BITS[name]
+    return mask
+
+
+class EventClock:
+    """Converts monotonic event timestamps to wall-clock time"""
+
+    def __init__(self, anchor_ns: int | None = None, anchor: datetime | None = None) -> None:
+        """
+        Initialize the clock
+        :param anchor_ns: time.perf_counter_ns() at the anchor instant, defaults to now
+        :param anchor: Wall-clock time at the anchor instant, defaults to now (to replay events from an earlier run)
+        """
+        # Anchor both clocks at the same instant, wall-clock times are derived from monotonic offsets from here
+        self.anchor_ns: int = time.perf_counter_ns() if anchor_ns is None else anchor_ns
+        self.anchor: datetime = datetime.now() if anchor is None else anchor
+
+    def same_session(self, other: "EventClock") -> bool:
+        """Whether another clock has the same anchors, i.e. timestamps from both are comparable"""
+        return self.anchor_ns == other.anchor_ns and self.anchor == other.anchor
+
+    def to_datetime(self, time_ns: int) -> datetime:
+        """Convert a time.perf_counter_ns() timestamp to a datetime"""
+        return self.anchor + timedelta(microseconds=(time_ns - self.anchor_ns) / 1000)
@@ -1,18 +1,26 @@
+import heapq
+import itertools
 import logging
-import queue
+import os
 import time
-from datetime import datetime, timedelta
-from queue import Empty as EmptyException, Queue
-from threading import Thread
-from typing import Optional
-import sys
+from concurrent.futures import Future
+from datetime import datetime
+from threading import Lock, Thread
+from typing import Iterable, Optional
 
 from charachorder import CharaChorder, SerialException
 import vinput
 
 from .backends import Backend, SQLiteBackend
-from .Definitions import ActionType, BanlistAttr, BanlistEntry, CaseSensitivity, ChordMetadata, ChordMetadataAttr, \
-    Defaults, WordMetadata, WordMetadataAttr
+from .BatchSegmenter import BatchSegmenter
+from .Chordmap import ChordmapIndex, Modification
+from .Definitions import ActionType, BanlistAttr, BanlistEntry, CaptureStream, CaseSensitivity, ChordMetadata, \
+    ChordMetadataAttr, Defaults, HistoryEntry, KeysetIterator, OverflowPolicy, Progress, WordMetadata, \
+    WordMetadataAttr
+from .EventBuffer import EventBuffer
+from .Events import EventClock, pack_modifiers
+from .Journal import Journal
+from .Segmenter import Segmenter
 
 
 class Freqlog:
@@ -20,14 +28,16 @@ class Freqlog:
     def _on_key(self, key: vinput.KeyboardEvent) -> None:
         kind = ActionType.PRESS
         if not key.pressed:
+            if not self.capture_releases:  # Drop releases before they reach the queue
+                return
             kind = ActionType.RELEASE
         if key.keychar == '' or key.keychar == '\0':
             return
-        self.q.put((kind, key.keychar.lower(), key.modifiers, datetime.now()))
+        self.q.put((kind, key.keychar.lower(), pack_modifiers(key.modifiers), time.perf_counter_ns()))
 
     def _on_mouse_button(self, button: vinput.MouseButtonEvent) -> None:
         """Store PRESS, key and current time in queue"""
-        self.q.put((ActionType.PRESS, button, None, datetime.now()))
+        self.q.put((ActionType.PRESS, button, 0, time.perf_counter_ns()))
 
     def _on_mouse_move(self, move: vinput.MouseMoveEvent) -> None:
         pass
@@ -54,214 +64,291 @@ class Freqlog:
         :param end_time: Timestamp of end of chord
         :returns: True if chord was logged, False if it was banned
         """
-        if self.chords and chord not in self.chords:  # TODO: handle chord modifications (i.e. tense, plural, case)
-            logging.warning(f"Chord '{chord}' not found in device chords, timing: {start_time} - {end_time}")
+        if self.chords:
+            match = self.chords.match(chord)
+            if match is None:
+                logging.warning(f"Chord '{chord}' not found in device chords, timing: {start_time} - {end_time}")
+            elif match[1] is not Modification.NONE:
+                logging.debug(f"Chord '{chord}' is '{match[0]}' with modification {match[1].name}")
         if self.backend.log_chord(chord, end_time):
             logging.info(f"Chord: {chord} - {end_time}")
         else:
             logging.info(f"Banned chord, {end_time}")
             logging.debug(f"(Banned chord was '{chord}')")
 
-    # This checks if the event is either a valid key or if it should be treated as mouse input/modifier key press.
-    @staticmethod
-    def _is_key(x: str | vinput.MouseButtonEvent) -> bool:
-        if isinstance(x, vinput.MouseButtonEvent):
-            return False
-        return x != '' and x != '\0'
-
-    def _process_queue(self):
-        word: str = ""  # word to be logged, reset on criteria below
-        word_start_time: datetime | None = None
-        word_end_time: datetime | None = None
-        chars_since_last_bs: int = 0
-        avg_char_time_after_last_bs: timedelta | None = None
-        last_key_was_disallowed: bool = False
-
-        def _get_timed_interruptable(q, timeout):
-            # Based on https://stackoverflow.com/a/37016663/9206488
-            stoploop = time.monotonic() + timeout - 0.5
-            while self.is_logging and time.monotonic() < stoploop:
-                try:
-                    return q.get(block=True, timeout=0.5)  # Allow check for Ctrl-C every second
-                except queue.Empty:
-                    pass
-                except TypeError:  # Weird bug in Threading (File "/usr/lib/python3.11/threading.py", line 324, in wait
-                    # gotit = waiter.acquire(True, timeout)
-                    #         ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
-                    # TypeError: main.<locals>.<lambda>() takes 0 positional arguments but 2 were given)
-                    # This except fixes it but I'm not sure what side effects it might have
-                    self.is_logging = False
-                    raise EmptyException
-            if not self.is_logging:
-                raise EmptyException
-
-            # Final wait for last fraction of a second
-            return q.get(block=True, timeout=max(0, stoploop + 0.5 - time.monotonic()))
-
-        def _log_and_reset_word(min_length: int = 2) -> None:
-            """Log word to file and reset word metadata"""
-            nonlocal word, word_start_time, word_end_time, chars_since_last_bs, avg_char_time_after_last_bs, \
-                last_key_was_disallowed
-            if not word:  # Don't log if word is empty
-                return
-
-            # Strip whitespace from start and end of word
-            word = word.strip()
-
-            # TODO: Do we need to trim word to only substring that is in allowed_chars?
-
-            # Only log words/chords that have >= min_length characters
-            if len(word) >= min_length:
-                if avg_char_time_after_last_bs and avg_char_time_after_last_bs > timedelta(
-                        milliseconds=self.chord_char_threshold):  # Word, based on backspace timing
-                    self._log_word(word, word_start_time, word_end_time)
-                else:  # Chord
-                    self._log_chord(word, word_start_time, word_end_time)
-
-            word = ""
-            word_start_time = None
-            word_end_time = None
-            chars_since_last_bs = 0
-            avg_char_time_after_last_bs = None
-            last_key_was_disallowed = False
-
-        def _update_timing():
-            """Must be called after adding a key to word and before self.q.task_done()"""
-            nonlocal word_start_time, word_end_time, last_key_was_disallowed, chars_since_last_bs, \
-                avg_char_time_after_last_bs
-            if not word_start_time:
-                word_start_time = time_pressed
-            elif chars_since_last_bs > 1 and avg_char_time_after_last_bs:
-                # Should only get here if chars_since_last_bs > 2
-                avg_char_time_after_last_bs = (avg_char_time_after_last_bs * (chars_since_last_bs - 1) +
-                                               (time_pressed - word_end_time)) / chars_since_last_bs
-            elif chars_since_last_bs > 1:
-                avg_char_time_after_last_bs = time_pressed - word_end_time
-            word_end_time = time_pressed
-
-        while self.is_logging:
-            try:
-                action: ActionType
-                key: str | vinput.MouseButtonEvent
-                modifiers: vinput.KeyboardModifiers | None
-                time_pressed: datetime
-
-                # Blocking here makes the while-True non-blocking
-                action, key, modifiers, time_pressed = _get_timed_interruptable(self.q, self.new_word_threshold)
-
-                if isinstance(key, bytes):
-                    key = key.decode('utf-8')
-
-                # Debug keystrokes
-                if self._is_key(key):
-                    logging.debug(f"{action}: {key} - {time_pressed}")
-                    logging.debug(f"word: '{word}', modifiers: {modifiers}")
-
-                if action == ActionType.RELEASE:
-                    continue
-
-                # On backspace, remove last char from word if word is not empty
-                if key == '\b' and word:
-                    if sys.platform == 'darwin':
-                        word_del_cond = modifiers.left_alt or modifiers.right_alt
-                    else:
-                        word_del_cond = modifiers.left_control or modifiers.right_control
-
-                    if word_del_cond:
-                        # Remove last word from word
-                        # FIXME: make this work - rn _log_and_reset_word() is called immediately upon ctrl/cmd keydown
-                        # TODO: make this configurable (i.e. for vim, etc)
-                        if " " in word:
-                            word = word[:word.rfind(" ")]
-                        elif "\t" in word:
-                            word = word[:word.rfind("\t")]
-                        elif "\n" in word:
-                            word = word[:word.rfind("\n")]
-                        else:  # Word is only one word
-                            word = ""
-                    else:
-                        logging.debug(f"Backspace: {word} -> {word[:-1]}")
-                        word = word[:-1]
-                    chars_since_last_bs = 0
-                    avg_char_time_after_last_bs = None
-                    self.q.task_done()
-                    continue
-
-                # Handle whitespace/disallowed keys
-                if self._is_key(key) and (key in " \t\n\r" or key not in self.allowed_chars):
-                    # If key is whitespace/disallowed and timing is more than chord_char_threshold, log and reset word
-                    if (word and avg_char_time_after_last_bs and
-                            avg_char_time_after_last_bs > timedelta(milliseconds=self.chord_char_threshold)):
-                        logging.debug(f"Whitespace/disallowed, log+reset: {word}")
-                        _log_and_reset_word()
-                    else:  # Add key to chord
-                        if self._is_key(key):
-                            word += key
-                            _update_timing()
-                        last_key_was_disallowed = True
-                    self.q.task_done()
-                    continue
-
-                # On non-chord key, log and reset word if it exists
-                #   Non-chord key = key in modifier keys or non-key
-                # FIXME: support modifier keys in chords
-                if not self._is_key(key):
-                    logging.debug(f"Non-chord key: {key}")
-                    if word:
-                        _log_and_reset_word()
-                    self.q.task_done()
-                    continue
+    def _make_segmenter(self, clock: EventClock | None = None) -> Segmenter:
+        """
+        Build a segmenter from the current settings that logs to the backend
+        :param clock: Clock the timestamps of the events to segment are relative to, defaults to self.clock
+        """
+        clock = clock or self.clock
+        # Convert event timestamps to wall-clock time only when handing off to the backend
+        return Segmenter(
+            lambda word, start, end: self._log_word(word, clock.to_datetime(start), clock.to_datetime(end)),
+            lambda chord, start, end: self._log_chord(chord, clock.to_datetime(start), clock.to_datetime(end)),
+            self.allowed_chars, self.allowed_first_chars, self.modifier_keys, self.chord_char_threshold)
 
-                banned_modifier_active = False
-                for attr in Defaults.MODIFIER_NAMES:
-                    # Skip non-enabled modifiers
-                    if not getattr(self.modifier_keys, attr):
-                        continue
+    def _recover_journal(self, journal_path: str, keep: bool = False) -> bool:
+        """
+        Log events left in a journal after the last checkpoint (i.e. from a run that crashed or was killed)
+        :param journal_path: Journal directory
+        :param keep: Don't delete the journal's segments afterwards
+        :returns: Whether any events were recovered
+        """
+        if not os.path.isdir(journal_path):
+            return False
+        try:
+            runs = Journal.read(journal_path, since_checkpoint=True)
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to read journal at {journal_path}, not recovering from it: {e}")
+            return False
+        if runs:
+            logging.warning(f"Recovering {sum(len(events) for _, events in runs)} unlogged events from journal")
+            new_word_threshold_ns = int(self.new_word_threshold * 1_000_000_000)
+            for clock, events in runs:
+                segmenter = self._make_segmenter(clock)
+                segmenter.feed_all(events, new_word_threshold_ns)
+                segmenter.flush()
+            self.backend.flush()
+        if not keep:
+            Journal.clear(journal_path)
+        return bool(runs)
+
+    def replay(self, journal_path: str, new_word_threshold: float | None = None,
+               chord_char_threshold: int | None = None, allowed_chars: set | str | None = None,
+               allowed_first_chars: set | str | None = None,
+               modifier_keys: vinput.KeyboardModifiers | None = None, batch: bool = True) -> int:
+        """
+        Log a recorded journal of captured events as fast as possible, segmenting them the same way as start_logging()
+        Idle timeouts are derived from event timestamps rather than waited for, and no listener is started
+        :param journal_path: Journal directory or segment file to replay
+        :param new_word_threshold: Seconds after which character input is considered a new word
+        :param chord_char_threshold: Milliseconds between characters in a chord to be considered a chord
+        :param allowed_chars: Chars to be considered as part of words
+        :param allowed_first_chars: Chars to be considered as the first char in words
+        :param modifier_keys: Modifier keys that prevent a key from being logged
+        :param batch: Segment whole journal segments at once with array operations if numpy is installed
+        :raises ValueError: If a file in the journal isn't a journal segment
+        :raises FileNotFoundError: If the journal doesn't exist
+        :returns: Number of events replayed
+        """
+        self._set_segmentation_settings(new_word_threshold, chord_char_threshold, allowed_chars, allowed_first_chars,
+                                        modifier_keys)
+        new_word_threshold_ns = int(self.new_word_threshold * 1_000_000_000)
+        counts = {"events": 0, "words": 0, "chords": 0, "banned": 0}
+        clock: EventClock | None = None
+        segmenter: Segmenter | None = None
+        batch_segmenter: BatchSegmenter | None = None
+        batch = batch and BatchSegmenter.available()
+        vectorized = 0
+
+        def _log_word(word: str, start: int, end: int) -> None:
+            if self.backend.log_word(word, clock.to_datetime(start), clock.to_datetime(end)):
+                counts["words"] += 1
+            else:
+                counts["banned"] += 1
 
-                    if getattr(modifiers, attr):
-                        banned_modifier_active = True
-                        break
+        def _log_chord(chord: str, _: int, end: int) -> None:
+            if self.backend.log_chord(chord, clock.to_datetime(end)):
+                counts["chords"] += 1
+            else:
+                counts["banned"] += 1
+
+        start_time = time.perf_counter()
+        segments = BatchSegmenter.iter_segments(journal_path) if batch else Journal.iter_segments(journal_path)
+        for segment_clock, events, _ in segments:
+            if segmenter is None or not clock.same_session(segment_clock):  # New session, timestamps restart
+                if segmenter is not None:
+                    segmenter.flush()
+                if batch_segmenter is not None:
+                    vectorized += batch_segmenter.vectorized
+                clock = segment_clock
+                segmenter = Segmenter(_log_word, _log_chord, self.allowed_chars, self.allowed_first_chars,
+                                      self.modifier_keys, self.chord_char_threshold)
+                if batch:
+                    batch_segmenter = BatchSegmenter(segmenter, new_word_threshold_ns)
+            if batch:
+                batch_segmenter.feed(events)
+            else:
+                segmenter.feed_all(events, new_word_threshold_ns)
+            counts["events"] += len(events)
+        if segmenter is not None:
+            segmenter.flush()
+        if batch_segmenter is not None:
+            vectorized += batch_segmenter.vectorized
+        self.backend.flush()
+        elapsed = time.perf_counter() - start_time
+        logging.info(f"Replayed {counts['events']} events ({counts['words']} words, {counts['chords']} chords, "
+                     f"{counts['banned']} banned) in {elapsed:.3f}s "
+                     f"({counts['events'] / max(elapsed, 1e-9):,.0f} events/s)")
+        if batch:
+            logging.info(f"{vectorized / max(counts['events'], 1):.0%} of events segmented in batches")
+        return counts["events"]
+
+    def _set_segmentation_settings(self, new_word_threshold: float | None, chord_char_threshold: int | None,
+                                   allowed_chars: set | str | None, allowed_first_chars: set | str | None,
+                                   modifier_keys: vinput.KeyboardModifiers | None) -> None:
+        """Override segmentation settings that aren't None (see start_logging())"""
+        if isinstance(allowed_chars, set):
+            self.allowed_chars = allowed_chars
+        elif isinstance(allowed_chars, str):
+            self.allowed_chars = set(allowed_chars)
+        if isinstance(allowed_first_chars, set):
+            self.allowed_first_chars = allowed_first_chars
+        elif isinstance(allowed_first_chars, str):
+            self.allowed_first_chars = set(allowed_first_chars)
+        if modifier_keys is not None:
+            self.modifier_keys = modifier_keys
+        if new_word_threshold is not None:
+            self.new_word_threshold = new_word_threshold
+        if chord_char_threshold is not None:
+            self.chord_char_threshold = chord_char_threshold
 
-                # Add new char to word and update word timing if no banned modifier keys are pressed
-                if not banned_modifier_active:
-                    # I think this is for chords that end in space
-                    # If last key was disallowed and timing of this key is more than chord_char_threshold, log+reset
-                    if (last_key_was_disallowed and word and word_end_time and
-                            (time_pressed - word_end_time) > timedelta(milliseconds=self.chord_char_threshold)):
-                        logging.debug(f"Disallowed and timing, log+reset: {word}")
-                        _log_and_reset_word()
-                    word += key
-                    chars_since_last_bs += 1
-                    _update_timing()
-                    self.q.task_done()
+    def _process_queue(self):
+        segmenter = self.segmenter
+        journal = self.journal
+
+        # Timer heap of (deadline, kind) in perf_counter_ns() time. Idle deadlines are due new_word_threshold after
+        #   the last activity and are re-armed lazily when they come up, so a burst of keys costs one heap entry per
+        #   kind. The journal sync deadline is due a fixed interval after the first unsynced write.
+        word_deadline, flush_deadline, sync_deadline = 0, 1, 2  # Kinds, in the order they run when due together
+        new_word_threshold_ns: int = int(self.new_word_threshold * 1_000_000_000)
+        journal_sync_interval_ns: int = int(Defaults.DEFAULT_JOURNAL_SYNC_INTERVAL * 1_000_000_000)
+        deadlines: list[tuple[int, int]] = []
+        armed: set[int] = set()
+        last_activity: int = 0  # perf_counter_ns() when the last batch was drained
+        device_discovered: Future | None = self.discover_device()  # None once its chords are loaded
+
+        def _arm(kind: int, deadline: int) -> None:
+            """Schedule a deadline of the given kind if it isn't already pending"""
+            if kind not in armed:
+                armed.add(kind)
+                heapq.heappush(deadlines, (deadline, kind))
+
+        def _run_due_deadlines() -> None:
+            """Finalize the pending word, flush the backend and/or sync the journal when they're due"""
+            now = time.perf_counter_ns()
+            while deadlines and deadlines[0][0] <= now:
+                _, kind = heapq.heappop(deadlines)
+                if kind != sync_deadline and last_activity + new_word_threshold_ns > now:
+                    # Activity since this was armed, push it back
+                    heapq.heappush(deadlines, (last_activity + new_word_threshold_ns, kind))
                     continue
-
-                # Should never get here
-                logging.error(f"Uncaught key: {key}")
-                self.q.task_done()
-            except EmptyException:  # Queue is empty
-                # If word is older than NEW_WORD_THRESHOLD seconds, log and reset word
-                if word:
-                    _log_and_reset_word()
-                if not self.is_logging:
-                    # Cleanup and exit if queue is empty and logging is stopped
-                    self.backend.close()
-                    logging.warning("Stopped freqlogging")
-                    return
+                armed.discard(kind)
+                if kind == word_deadline:
+                    # If word is older than NEW_WORD_THRESHOLD seconds, log and reset word
+                    segmenter.flush()
+                elif kind == flush_deadline:
+                    # Write out anything the backend has buffered while we're idle
+                    self.backend.flush()
+                    self._cache_chordmap()
+                    if journal and not segmenter.word:  # Everything journaled so far is in the backend
+                        journal.checkpoint()
+                else:
+                    journal.sync()
+
+        while True:
+            # Sleep until the next batch of events or the earliest deadline, nothing happens in between
+            timeout = None
+            if deadlines:
+                timeout = max(0, deadlines[0][0] - time.perf_counter_ns()) / 1_000_000_000
+            batch = self.q.drain(timeout)
+            if device_discovered is not None and device_discovered.done():
+                device_discovered = None
+                self._load_chordmap()
+            if batch:
+                last_activity = time.perf_counter_ns()
+                if journal:
+                    journal.append(batch)
+                    _arm(sync_deadline, last_activity + journal_sync_interval_ns)
+                segmenter.feed_all(batch)
+                if segmenter.word:
+                    _arm(word_deadline, last_activity + new_word_threshold_ns)
+                _arm(flush_deadline, last_activity + new_word_threshold_ns)
+            elif self.q.closed:  # Stopped and nothing left to process
+                break
+            _run_due_deadlines()
+
+        # Cleanup and exit, logging the word in progress (close() flushes anything buffered)
+        segmenter.flush()
+        self._cache_chordmap()
+        self.backend.close()
+        if journal:
+            journal.checkpoint()
+            journal.close()
+        logging.warning("Stopped freqlogging")
+
+    def discover_device(self) -> Future:
+        """
+        Start looking for a CharaChorder device in the background, if that hasn't been started yet
+        Nothing touches serial ports until this is called (loggable instances call it when initialized)
+        :returns: Future that resolves to the number of chords on the device (None if no device could be read) once
+                  device, num_chords and device_id are set
+        """
+        with self._device_lock:
+            if self._device_future is None:
+                self._device_future = Future()
+                Thread(target=self._discover_device, daemon=True).start()
+            return self._device_future
+
+    def _discover_device(self) -> None:
+        """Get the serial device and its number of chords, resolving the discover_device() future"""
+        try:
+            devices = CharaChorder.list_devices()
+            if len(devices) == 0:
+                logging.warning("No CharaChorder devices found")
+            else:
+                if len(devices) > 1:  # TODO: provide a selection method for users (including in GUI)
+                    logging.warning(f"Multiple CharaChorder devices found, using: {devices[0]}")
+                    logging.debug(f"Other devices: {devices[1:]}")
+                logging.info(f"Connecting to CharaChorder device at {devices[0]}")
+                try:
+                    self.device = devices[0]
+                    with self.device:
+                        self.num_chords = self.device.get_chordmap_count()
+                        self.device_id = f"{self.device.get_id()} {self.device.get_version()}"
+                except SerialException as e:
+                    logging.error(f"Failed to connect to CharaChorder device: {devices[0]}")
+                    logging.error(e)
+                except IOError as e:
+                    logging.error(f"I/O error while getting number of chords from CharaChorder device: {devices[0]}")
+                    logging.error(e)
+        except Exception as e:
+            self._device_future.set_exception(e)
+            raise
+        self._device_future.set_result(self.num_chords)
+
+    def _load_chordmap(self) -> None:
+        """
+        Load the discovered device's chords from the backend's cache if the device looks unchanged, or start getting
+        them from the device (from the thread that owns the backend, once discover_device() is done)
+        """
+        if self.device_id is None:
+            return
+        cached = self.backend.get_chordmap(self.device_id, self.num_chords)
+        if cached is not None:  # Device looks unchanged
+            self.chords = ChordmapIndex(cached)
+            logging.info(f"Loaded {len(cached)} chords from cache")
+        else:  # Asynchronously get chords from device
+            self.chords_thread = Thread(target=self._get_chords)
+            self.chords_thread.start()
 
     def _get_chords(self):
         """
-        Get chords from device
+        Get chords from device, swapping the new index in when done and leaving them for _cache_chordmap()
         """
         if self.device is None:
             return
 
         with self.device:
-            logging.info(f"Getting {self.device.get_chordmap_count()} chords from device")
-            self.chords = []
+            chord_count = self.device.get_chordmap_count()
+            logging.info(f"Getting {chord_count} chords from device")
+            chords = ChordmapIndex()
+            outputs = []
             started_logging = False  # prevent early short-circuit
             for chord, phrase in self.device.get_chordmaps():
-                self.chords.append(''.join(phrase).strip())
+                outputs.append(''.join(phrase))
+                chords.add(outputs[-1])
                 if not self.is_logging:  # Short circuit if logging is stopped
                     if started_logging:
                         logging.info("Stopped getting chords from device")
@@ -269,7 +356,43 @@ class Freqlog:
                 else:
                     started_logging = True
             else:
-                logging.info(f"Got {len(self.chords)} chords from device")
+                logging.info(f"Got {len(chords)} chords from device")
+                self.chords = chords
+                self._fetched_chordmap = (self.device_id, chord_count, outputs)
+
+    def _cache_chordmap(self) -> None:
+        """Store a chordmap fetched by _get_chords() in the backend (from the thread that owns the backend)"""
+        fetched, self._fetched_chordmap = self._fetched_chordmap, None
+        if fetched is not None:
+            device_id, chord_count, outputs = fetched
+            self.backend.set_chordmap(device_id, chord_count, outputs)
+            logging.info(f"Cached {chord_count} chords from {device_id}")
+
+    @staticmethod
+    def _write_csv(export_path: str, header: Iterable[str], entries: Iterable[WordMetadata | ChordMetadata],
+                   progress: Progress) -> int:
+        """
+        Write entries to a csv file as they're iterated over
+        :param export_path: Path to csv file to write to
+        :param header: Column names
+        :param entries: Entries to write, one per row
+        :param progress: Progress of the export, advanced for each entry
+        :return: Number of entries written
+        """
+        count = 0
+        with open(export_path, "w") as f:
+            f.write(",".join(header) + "\n")
+            for entry in entries:
+                f.write(("\n" if count else "") + ",".join(map(str, entry.__dict__.values())))
+                count += 1
+                progress.advance()
+        progress.finish()
+        return count
+
+    @staticmethod
+    def _page_size(limit: int) -> int:
+        """Page size to iterate over at most limit entries (-1 for no limit)"""
+        return min(limit, Defaults.DEFAULT_PAGE_SIZE) if limit > 0 else Defaults.DEFAULT_PAGE_SIZE
 
     @staticmethod
     def is_backend_initialized(backend_path: str) -> bool:
@@ -282,7 +405,8 @@ class Freqlog:
         return SQLiteBackend.is_db_populated(backend_path)
 
     def __init__(self, backend_path: str, password_callback: callable, loggable: bool = True,
-                 upgrade_callback: Optional[callable] = None) -> None:
+                 upgrade_callback: Optional[callable] = None, write_behind: bool = False,
+                 progress_callback: Optional[callable] = None) -> None:
         """
         Initialize Freqlog
         :param backend_path: Path to backend (currently == SQLiteBackend)
@@ -290,6 +414,10 @@ class Freqlog:
                 Should take one argument: whether the password is being set for the first time
         :param loggable: Whether to create listeners
         :param upgrade_callback: Callback to run if database is upgraded
+        :param write_behind: Whether the backend should buffer logged entries and write them in batches
+                (buffered entries are flushed when idle, when a size/time threshold is hit, and on stop_logging())
+        :param progress_callback: Callback to call with a Progress as long operations (upgrades, merges, exports)
+                advance
         :raises ValueError: If the database version is newer than the current version
         :raises PermissionError: If the database path is not readable or writable
         :raises IsADirectoryError: If the database path is not a file
@@ -298,39 +426,27 @@ class Freqlog:
         """
         logging.info("Initializing freqlog")
         self.device: CharaChorder | None = None
-        self.chords: list[str] | None = None
+        self.chords: ChordmapIndex | None = None
         self.num_chords: int | None = None
-
-        # Get serial device
-        devices = CharaChorder.list_devices()
-        if len(devices) == 0:
-            logging.warning("No CharaChorder devices found")
-        else:
-            if len(devices) > 1:  # TODO: provide a selection method for users (including in GUI)
-                logging.warning(f"Multiple CharaChorder devices found, using: {devices[0]}")
-                logging.debug(f"Other devices: {devices[1:]}")
-            logging.info(f"Connecting to CharaChorder device at {devices[0]}")
-            try:
-                self.device = devices[0]
-                with self.device:
-                    self.num_chords = self.device.get_chordmap_count()
-            except SerialException as e:
-                logging.error(f"Failed to connect to CharaChorder device: {devices[0]}")
-                logging.error(e)
-            except IOError as e:
-                logging.error(f"I/O error while getting number of chords from CharaChorder device: {devices[0]}")
-                logging.error(e)
+        self.device_id: str | None = None  # Identifies the device's chordmap cache
+        self._fetched_chordmap: tuple[str, int, list[str]] | None = None  # To be cached by the backend's thread
+        self.chords_thread: Thread | None = None
+        self._device_future: Future | None = None  # Set by discover_device()
+        self._device_lock: Lock = Lock()
 
         self.is_logging: bool = False  # Used in self._get_chords, needs to be initialized here
         self.loggable = loggable
         if loggable:
             logging.info(f"Logging set to freqlog db at {backend_path}")
 
-            # Asynchronously get chords from device
-            Thread(target=self._get_chords).start()
+            # Look for the device while the backend is opened, its chords are loaded once logging starts
+            self.discover_device()
 
-        self.backend: Backend = SQLiteBackend(backend_path, password_callback, upgrade_callback)
-        self.q: Queue = Queue()
+        self.progress_callback = progress_callback
+        self.backend: Backend = SQLiteBackend(backend_path, password_callback, upgrade_callback, write_behind,
+                                              progress_callback=progress_callback)
+        self.q: EventBuffer = EventBuffer()
+        self.clock: EventClock = EventClock()
         self.listener: vinput.EventListener | None = None
         self.listener_thread = Thread(target=lambda: self._log_start())
         self.new_word_threshold: float = Defaults.DEFAULT_NEW_WORD_THRESHOLD
@@ -340,36 +456,64 @@ class Freqlog:
         self.modifier_keys: vinput.KeyboardModifiers = vinput.KeyboardModifiers()
         for attr in Defaults.DEFAULT_MODIFIERS:
             setattr(self.modifier_keys, attr, True)
+        self.capture: CaptureStream = Defaults.DEFAULT_CAPTURE
+        self.capture_releases: bool = CaptureStream.KEY_RELEASE in self.capture
+        self.segmenter: Segmenter | None = None  # Built from the settings above in start_logging()
+        self.journal: Journal | None = None
+        self.listener_start_time: float | None = None  # time.monotonic() when the listener thread started
         self.killed: bool = False
 
     def start_logging(self, new_word_threshold: float | None = None, chord_char_threshold: int | None = None,
                       allowed_chars: set | str | None = None, allowed_first_chars: set | str | None = None,
-                      modifier_keys: vinput.KeyboardModifiers | None = None) -> None:
+                      modifier_keys: vinput.KeyboardModifiers | None = None,
+                      capture: CaptureStream | None = None, event_buffer_size: int | None = None,
+                      overflow: OverflowPolicy | None = None, journal_path: str | None = None,
+                      keep_journal: bool = False) -> None:
+        """
+        Start logging, blocks until logging is stopped
+        :param new_word_threshold: Seconds after which character input is considered a new word
+        :param chord_char_threshold: Milliseconds between characters in a chord to be considered a chord
+        :param allowed_chars: Chars to be considered as part of words
+        :param allowed_first_chars: Chars to be considered as the first char in words
+        :param modifier_keys: Modifier keys that prevent a key from being logged
+        :param capture: Optional event streams to subscribe to, anything not included is never captured
+        :param event_buffer_size: Max number of captured events waiting to be processed
+        :param overflow: What to do with captured events when the event buffer is full
+        :param journal_path: Directory to journal captured events to until they're logged, None to not journal.
+                Events left in the journal by a previous run that didn't stop cleanly are logged first.
+                The journal contains raw keystrokes, including anything typed into password fields.
+        :param keep_journal: Keep journaled events after they're logged, as a recording for replay()
+        """
         if not self.loggable:
             return
 
-        if isinstance(allowed_chars, set):
-            self.allowed_chars = allowed_chars
-        elif isinstance(allowed_chars, str):
-            self.allowed_chars = set(allowed_chars)
-        if isinstance(allowed_first_chars, set):
-            self.allowed_first_chars = allowed_first_chars
-        elif isinstance(allowed_first_chars, str):
-            self.allowed_first_chars = set(allowed_first_chars)
-        if modifier_keys is not None:
-            self.modifier_keys = modifier_keys
-        if new_word_threshold is not None:
-            self.new_word_threshold = new_word_threshold
-        if chord_char_threshold is not None:
-            self.chord_char_threshold = chord_char_threshold
+        self._set_segmentation_settings(new_word_threshold, chord_char_threshold, allowed_chars, allowed_first_chars,
+                                        modifier_keys)
+        if capture is not None:
+            self.capture = capture
+            self.capture_releases = CaptureStream.KEY_RELEASE in capture
+        if event_buffer_size is not None or overflow is not None:
+            self.q = EventBuffer(self.q.capacity if event_buffer_size is None else event_buffer_size,
+                                 self.q.overflow if overflow is None else overflow)
 
         logging.info("Starting freqlogging")
         logging.debug(f"new_word_threshold={self.new_word_threshold}, "
                       f"chord_char_threshold={self.chord_char_threshold}, "
                       f"allowed_chars={self.allowed_chars}, "
                       f"allowed_first_chars={self.allowed_first_chars}, "
-                      f"modifier_keys={self.modifier_keys}")
-
+                      f"modifier_keys={self.modifier_keys}, "
+                      f"capture={self.capture}, "
+                      f"event_buffer_size={self.q.capacity}, "
+                      f"overflow={self.q.overflow.name}")
+
+        self.segmenter = self._make_segmenter()
+        if journal_path is not None:
+            logging.warning(f"Journaling raw keystrokes to {journal_path} " +
+                            ("(kept after they are logged)" if keep_journal else "until they are logged"))
+            recovered = self._recover_journal(journal_path, keep_journal)
+            self.journal = Journal(journal_path, self.clock, keep=keep_journal)
+            if recovered and keep_journal:  # Kept segments from the last run are logged now
+                self.journal.checkpoint(force=True)
         self.listener_thread.start()
         self.is_logging = True
         logging.warning("Started freqlogging")
@@ -377,25 +521,46 @@ class Freqlog:
         exit(0)
 
     def _log_start(self):
-        self.listener = vinput.EventListener(True, True, True)
+        # Only subscribe to the streams we need, so unused events never cross into Python
+        listen_mouse_button = CaptureStream.MOUSE_BUTTON in self.capture
+        listen_mouse_move = CaptureStream.MOUSE_MOVE in self.capture
+        self.listener = vinput.EventListener(True, listen_mouse_button, listen_mouse_move)
+        self.listener_start_time = time.monotonic()
 
         try:
             self.listener.start(
                 lambda x: self._on_key(x),
-                lambda x: self._on_mouse_button(x),
-                lambda x: self._on_mouse_move(x))
+                (lambda x: self._on_mouse_button(x)) if listen_mouse_button else None,
+                (lambda x: self._on_mouse_move(x)) if listen_mouse_move else None)
         except vinput.VInputException as e:
             logging.error("Failed to start listeners: " + str(e))
 
+    def listener_cpu_time(self) -> float | None:
+        """
+        Get the CPU time used by the listener thread so far
+        :returns: CPU time in seconds, None if the listener isn't running or the platform can't measure it
+        """
+        try:
+            return time.clock_gettime(time.pthread_getcpuclockid(self.listener_thread.ident))
+        except (AttributeError, OSError, TypeError):  # No pthread CPU clocks (Windows/macOS), or thread not running
+            return None
+
     def stop_logging(self) -> None:  # FIXME: find out why this runs twice on one Ctrl-C (does it still?)
         if self.killed:  # TODO: Forcibly kill if already killed once
             exit(1)  # This doesn't work rn
         self.killed = True
         logging.warning("Stopping freqlog")
+        cpu_time = self.listener_cpu_time()
+        if cpu_time is not None and self.listener_start_time is not None:
+            wall_time = time.monotonic() - self.listener_start_time
+            logging.info(f"Listener thread used {cpu_time:.3f}s CPU in {wall_time:.1f}s "
+                         f"({100 * cpu_time / max(wall_time, 1e-9):.3f}%), capture={self.capture}")
+        logging.info(f"Event buffer: {self.q}")
         if self.listener:
             del self.listener
             self.listener = None
         self.is_logging = False
+        self.q.close()  # Wake up _process_queue so it can finish up
         logging.info("Stopped listeners")
 
     def get_backend_version(self) -> str:
@@ -454,7 +619,12 @@ class Freqlog:
         :return: list of bools, True if word was banned, False if it was already banned
         """
         logging.info(f"Banning {len(entries)} words - {time_added}")
-        return [self.ban_word(word, time_added) for word in entries]
+        res = self.backend.ban_words(entries, time_added)
+        for word, banned in zip(entries, res):
+            if not banned:
+                logging.warning(f"'{word}' is already banned")
+        logging.warning(f"Banned {res.count(True)} words")
+        return res
 
     def delete_word(self, word: str, case: CaseSensitivity) -> bool:
         """
@@ -476,7 +646,12 @@ class Freqlog:
         :return: list of bools, True if word was deleted, False if it was already deleted
         """
         logging.info(f"Deleting {len(entries)} words")
-        return [self.delete_word(word, case) for word, case in entries.items()]
+        res = self.backend.delete_words(entries)
+        for (word, case), deleted in zip(entries.items(), res):
+            if not deleted:
+                logging.warning(f"'{word}', case {case.name} doesn't exist in freqlog")
+        logging.warning(f"Deleted {res.count(True)} words")
+        return res
 
     def unban_word(self, word: str) -> bool:
         """
@@ -499,7 +674,12 @@ class Freqlog:
         :return: list of bools, True if word was unbanned, False if it was already unbanned
         """
         logging.info(f"Unbanning {len(entries)} words")
-        return [self.unban_word(word) for word in entries]
+        res = self.backend.unban_words(entries)
+        for word, unbanned in zip(entries, res):
+            if not unbanned:
+                logging.warning(f"'{word}' isn't banned")
+        logging.warning(f"Unbanned {res.count(True)} words")
+        return res
 
     def num_words(self, case: CaseSensitivity = CaseSensitivity.INSENSITIVE) -> int:
         """
@@ -524,6 +704,24 @@ class Freqlog:
             f"Listing words, limit {limit}, sort_by {sort_by}, reverse {reverse}, case {case.name}, search {search}")
         return self.backend.list_words(limit, sort_by, reverse, case, search)
 
+    def iter_words(self, sort_by: WordMetadataAttr = WordMetadataAttr.score, reverse: bool = True,
+                   case: CaseSensitivity = CaseSensitivity.INSENSITIVE, search: str = "",
+                   page_size: int = Defaults.DEFAULT_PAGE_SIZE, cursor: str | None = None) -> KeysetIterator:
+        """
+        Iterate over words in the store without loading them all at once
+        :param sort_by: Attribute to sort by: word, frequency, last_used, average_speed, score
+        :param reverse: Reverse sort order
+        :param case: Case sensitivity
+        :param search: Part of word to search for
+        :param page_size: Number of words to fetch at a time
+        :param cursor: Cursor of an iterator with the same sort_by, reverse and case to resume after
+        :returns: Iterator of WordMetadata, with the cursor of the last word returned
+        :raises ValueError: If the cursor is invalid
+        """
+        logging.info(f"Iterating over words, sort_by {sort_by}, reverse {reverse}, case {case.name}, search {search}, "
+                     f"cursor {cursor}")
+        return self.backend.iter_words(sort_by, reverse, case, search, page_size, cursor)
+
     def export_words_to_csv(self, export_path: str, limit: int = -1, sort_by: WordMetadataAttr = WordMetadataAttr.score,
                             reverse: bool = True, case: CaseSensitivity = CaseSensitivity.INSENSITIVE) -> int:
         """
@@ -536,12 +734,15 @@ class Freqlog:
         :return: Number of words exported
         """
         logging.info(f"Exporting words, limit {limit}, sort_by {sort_by}, reverse {reverse}, case {case.name}")
-        words = self.backend.list_words(limit, sort_by, reverse, case)
-        with open(export_path, "w") as f:
-            f.write(",".join(filter(lambda k: not k.startswith("_"), WordMetadataAttr.__dict__.keys())) + "\n")
-            f.write("\n".join(map(lambda w: ",".join(map(str, w.__dict__.values())), words)))
-        logging.info(f"Exported {len(words)} words to {export_path}")
-        return len(words)
+        words = self.backend.iter_words(sort_by, reverse, case, page_size=self._page_size(limit))
+        total = self.backend.num_words(case)
+        num_words = self._write_csv(export_path,
+                                    filter(lambda k: not k.startswith("_"), WordMetadataAttr.__dict__.keys()),
+                                    itertools.islice(words, limit) if limit > 0 else words,
+                                    Progress("Exporting words", min(limit, total) if limit > 0 else total,
+                                             self.progress_callback))
+        logging.info(f"Exported {num_words} words to {export_path}")
+        return num_words
 
     def num_logged_chords(self) -> int:
         """
@@ -563,6 +764,22 @@ class Freqlog:
         logging.info(f"Listing chords, limit {limit}, sort_by {sort_by}, reverse {reverse}, search {search}")
         return self.backend.list_chords(limit, sort_by, reverse, search)
 
+    def iter_logged_chords(self, sort_by: ChordMetadataAttr = ChordMetadataAttr.score, reverse: bool = True,
+                           search: str = "", page_size: int = Defaults.DEFAULT_PAGE_SIZE,
+                           cursor: str | None = None) -> KeysetIterator:
+        """
+        Iterate over chords in the store without loading them all at once
+        :param sort_by: Attribute to sort by: chord, frequency, last_used, score
+        :param reverse: Reverse sort order
+        :param search: Part of chord to search for
+        :param page_size: Number of chords to fetch at a time
+        :param cursor: Cursor of an iterator with the same sort_by and reverse to resume after
+        :returns: Iterator of ChordMetadata, with the cursor of the last chord returned
+        :raises ValueError: If the cursor is invalid
+        """
+        logging.info(f"Iterating over chords, sort_by {sort_by}, reverse {reverse}, search {search}, cursor {cursor}")
+        return self.backend.iter_chords(sort_by, reverse, search, page_size, cursor)
+
     def export_chords_to_csv(self, export_path: str, limit: int = -1,
                              sort_by: ChordMetadataAttr = ChordMetadataAttr.score,
                              reverse: bool = True) -> int:
@@ -575,12 +792,64 @@ class Freqlog:
         :return: Number of chords exported
         """
         logging.info(f"Exporting chords, limit {limit}, sort_by {sort_by}, reverse {reverse}")
-        chords = self.backend.list_chords(limit, sort_by, reverse)
-        with open(export_path, "w") as f:
-            f.write(",".join(filter(lambda k: not k.startswith("_"), ChordMetadataAttr.__dict__.keys())) + "\n")
-            f.write("\n".join(map(lambda c: ",".join(map(str, c.__dict__.values())), chords)))
-        logging.info(f"Exported {len(chords)} chords to {export_path}")
-        return len(chords)
+        chords = self.backend.iter_chords(sort_by, reverse, page_size=self._page_size(limit))
+        total = self.backend.num_chords()
+        num_chords = self._write_csv(export_path,
+                                     filter(lambda k: not k.startswith("_"), ChordMetadataAttr.__dict__.keys()),
+                                     itertools.islice(chords, limit) if limit > 0 else chords,
+                                     Progress("Exporting chords", min(limit, total) if limit > 0 else total,
+                                              self.progress_callback))
+        logging.info(f"Exported {num_chords} chords to {export_path}")
+        return num_chords
+
+    def list_word_usage(self, start: datetime, end: datetime, limit: int = -1,
+                        case: CaseSensitivity = CaseSensitivity.INSENSITIVE) -> list[tuple[str, int]]:
+        """
+        List words by how many times they were used between two times
+        :param start: Start of the range (inclusive)
+        :param end: End of the range (exclusive)
+        :param limit: Maximum number of words to return
+        :param case: Case sensitivity
+        :returns: (word, number of uses) pairs, most used first
+        """
+        logging.info(f"Listing word usage from {start} to {end}, limit {limit}, case {case.name}")
+        return self.backend.list_word_usage(start, end, limit, case)
+
+    def list_chord_usage(self, start: datetime, end: datetime, limit: int = -1) -> list[tuple[str, int]]:
+        """
+        List chords by how many times they were used between two times
+        :param start: Start of the range (inclusive)
+        :param end: End of the range (exclusive)
+        :param limit: Maximum number of chords to return
+        :returns: (chord, number of uses) pairs, most used first
+        """
+        logging.info(f"Listing chord usage from {start} to {end}, limit {limit}")
+        return self.backend.list_chord_usage(start, end, limit)
+
+    def get_word_history(self, word: str, case: CaseSensitivity, start: datetime | None = None,
+                         end: datetime | None = None) -> list[HistoryEntry]:
+        """
+        Get the usage history of a word
+        :param word: Word to get the history of
+        :param case: Case sensitivity
+        :param start: Only get buckets starting at or after this time
+        :param end: Only get buckets starting before this time
+        :returns: Day, week and month buckets the word was used in, oldest first
+        """
+        logging.info(f"Getting usage history of '{word}' from {start} to {end}, case {case.name}")
+        return self.backend.get_word_history(word, case, start, end)
+
+    def get_chord_history(self, chord: str, start: datetime | None = None,
+                          end: datetime | None = None) -> list[HistoryEntry]:
+        """
+        Get the usage history of a chord
+        :param chord: Chord to get the history of
+        :param start: Only get buckets starting at or after this time
+        :param end: Only get buckets starting before this time
+        :returns: Day, week and month buckets the chord was used in, oldest first
+        """
+        logging.info(f"Getting usage history of '{chord}' from {start} to {end}")
+        return self.backend.get_chord_history(chord, start, end)
 
     def delete_logged_chord(self, chord: str) -> bool:
         """
@@ -602,7 +871,12 @@ class Freqlog:
         :return: list of bools, True if chord was deleted, False if it was already deleted
         """
         logging.info(f"Deleting {len(chords)} chords")
-        return [self.delete_logged_chord(chord) for chord in chords]
+        res = self.backend.delete_chords(list(chords))
+        for chord, deleted in zip(chords, res):
+            if not deleted:
+                logging.warning(f"'{chord}' doesn't exist in freqlog")
+        logging.warning(f"Deleted {res.count(True)} chords")
+        return res
 
     def list_banned_words(self, limit: int = -1, sort_by: BanlistAttr = BanlistAttr.word,
                           reverse: bool = False) -> list[BanlistEntry]:
@@ -0,0 +1,236 @@
+"""Append-only journal of captured events, used to recover input that hadn't been logged when nexus stopped."""
+
+import logging
+import os
+import struct
+from datetime import datetime
+from enum import Enum
+from typing import Iterable, Iterator
+
+import vinput
+
+from .Definitions import ActionType, Defaults
+from .Events import EventClock
+
+# Each segment file starts with a header, followed by fixed-size records
+MAGIC = b"NXJ1"
+HEADER = struct.Struct("<4sqq")  # magic, wall-clock anchor (µs since epoch), monotonic anchor (perf_counter_ns())
+RECORD = struct.Struct("<qHBB")  # time_ns, modifiers bitmask, RecordKind, key byte/mouse button
+SEGMENT_SUFFIX = ".journal"
+
+_KEYS = [bytes([i]) for i in range(256)]  # Key byte -> captured key
+
+
+class RecordKind(Enum):
+    KEY_PRESS = 1
+    KEY_RELEASE = 2
+    MOUSE_BUTTON = 3
+    CHECKPOINT = 4  # Everything before this has been logged to the backend
+
+
+class Journal:
+    """
+    Writes captured events to numbered segment files in a directory
+    Records are buffered and fsync'd by sync(), segments are rotated by size, and checkpoint() marks everything
+    written so far as logged to the backend and (unless the journal is kept as a recording) deletes the segments
+    before it
+    The journal holds raw keystrokes (including anything typed into password fields) until they are deleted
+    """
+
+    def __init__(self, path: str, clock: EventClock, max_segment_size: int = Defaults.DEFAULT_JOURNAL_SEGMENT_SIZE,
+                 keep: bool = False) -> None:
+        """
+        Open a new journal segment in a directory
+        :param path: Directory to write segments to, created if it doesn't exist
+        :param clock: Clock the monotonic timestamps of journaled events are relative to
+        :param max_segment_size: Size in bytes after which a new segment is started
+        :param keep: Keep segments after they're checkpointed, as a recording that can be replayed
+        """
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        self.path = path
+        self.clock = clock
+        self.max_segment_size = max_segment_size
+        self.keep = keep
+        segments = self.segment_files(path)
+        self._index: int = int(os.path.basename(segments[-1])[:-len(SEGMENT_SUFFIX)]) + 1 if segments else 0
+        self._file = None
+        self._size: int = 0
+        self._uncheckpointed: bool = False  # Whether events were appended since the last checkpoint
+        self._open_segment()
+
+    @staticmethod
+    def segment_files(path: str) -> list[str]:
+        """
+        Get the segment files of a journal in the order they were written
+        :param path: Journal directory or a single segment file
+        """
+        if os.path.isfile(path):
+            return [path]
+        return [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(SEGMENT_SUFFIX)]
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self.path, f"{index:08d}{SEGMENT_SUFFIX}")
+
+    def _open_segment(self) -> None:
+        """Start a new segment file, readable only by the current user"""
+        fd = os.open(self._segment_path(self._index), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        self._file = os.fdopen(fd, "wb")
+        wall_us = int(self.clock.anchor.timestamp()) * 1_000_000 + self.clock.anchor.microsecond
+        self._file.write(HEADER.pack(MAGIC, wall_us, self.clock.anchor_ns))
+        self._size = HEADER.size
+
+    def _rotate(self) -> None:
+        """Close the current segment and start the next one"""
+        self.sync()
+        self._file.close()
+        self._index += 1
+        self._open_segment()
+
+    def append(self, events: Iterable[tuple]) -> None:
+        """
+        Append captured events, rotating the segment if it gets too big (call sync() to make them durable)
+        :param events: (action, key, modifiers, time_ns) events
+        """
+        pack = RECORD.pack
+        records = []
+        for action, key, modifiers, time_ns in events:
+            if isinstance(key, vinput.MouseButtonEvent):
+                kind, code = RecordKind.MOUSE_BUTTON, key.button & 0xFF
+            else:
+                if isinstance(key, str):
+                    key = key.encode('utf-8')
+                kind = RecordKind.KEY_RELEASE if action == ActionType.RELEASE else RecordKind.KEY_PRESS
+                code = key[0] if key else 0
+            records.append(pack(time_ns, modifiers & 0xFFFF, kind.value, code))
+        self._file.write(b"".join(records))
+        self._size += len(records) * RECORD.size
+        self._uncheckpointed = True
+        if self._size >= self.max_segment_size:
+            self._rotate()
+
+    def sync(self) -> None:
+        """Write buffered records to disk"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def checkpoint(self, force: bool = False) -> None:
+        """
+        Mark everything journaled so far as logged to the backend, and delete it unless the journal is kept
+        :param force: Write a checkpoint even if nothing was appended since the last one (i.e. to mark segments
+                from an earlier run as logged)
+        """
+        if not self._uncheckpointed and not force:
+            return
+        self._file.write(RECORD.pack(0, 0, RecordKind.CHECKPOINT.value, 0))
+        self._rotate()  # Syncs the checkpoint before anything is deleted
+        self._uncheckpointed = False
+        if not self.keep:
+            for segment in self.segment_files(self.path):
+                if segment != self._segment_path(self._index):
+                    os.remove(segment)
+
+    def close(self) -> None:
+        """Sync and close the current segment"""
+        if self._file and not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    @staticmethod
+    def read_segment_bytes(file_path: str) -> tuple[EventClock, bytes]:
+        """
+        Read the header and raw records of a journal segment, ignoring a partially written last record
+        :param file_path: Path to the segment file
+        :returns: Clock of the events and the packed RECORD records
+        :raises ValueError: If the file isn't a journal segment
+        """
+        with open(file_path, "rb") as f:
+            data = f.read()
+        if len(data) < HEADER.size:
+            raise ValueError(f"Not a journal segment (too short): {file_path}")
+        magic, wall_us, anchor_ns = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"Not a journal segment: {file_path}")
+        clock = EventClock(anchor_ns, datetime.fromtimestamp(wall_us // 1_000_000).replace(
+            microsecond=wall_us % 1_000_000))
+        end = len(data) - (len(data) - HEADER.size) % RECORD.size
+        return clock, data[HEADER.size:end]
+
+    @staticmethod
+    def read_segment(file_path: str) -> tuple[EventClock, list[tuple], int | None]:
+        """
+        Read a journal segment, ignoring a partially written last record
+        :param file_path: Path to the segment file
+        :returns: Clock of the events, (action, key, modifiers, time_ns) events, and the number of events before the
+                  last checkpoint (None if there is no checkpoint in this segment)
+        :raises ValueError: If the file isn't a journal segment
+        """
+        clock, data = Journal.read_segment_bytes(file_path)
+        events, checkpoint = Journal.unpack_records(data, file_path)
+        return clock, events, checkpoint
+
+    @staticmethod
+    def unpack_records(data: bytes, source: str = "") -> tuple[list[tuple], int | None]:
+        """
+        Convert packed records back to captured events
+        :param data: Packed RECORD records
+        :param source: Where the records came from, for warnings
+        :returns: (action, key, modifiers, time_ns) events, and the number of events before the last checkpoint (None
+                  if there is no checkpoint)
+        """
+        events = []
+        checkpoint = None
+        press, release, mouse = RecordKind.KEY_PRESS.value, RecordKind.KEY_RELEASE.value, RecordKind.MOUSE_BUTTON.value
+        keys = _KEYS
+        for time_ns, modifiers, kind, code in RECORD.iter_unpack(data):
+            if kind == press:
+                events.append((ActionType.PRESS, keys[code], modifiers, time_ns))
+            elif kind == release:
+                events.append((ActionType.RELEASE, keys[code], modifiers, time_ns))
+            elif kind == mouse:
+                events.append((ActionType.PRESS, vinput.MouseButtonEvent(button=code), modifiers, time_ns))
+            elif kind == RecordKind.CHECKPOINT.value:
+                checkpoint = len(events)
+            else:
+                logging.warning(f"Skipping unknown journal record kind {kind} in {source}")
+        return events, checkpoint
+
+    @classmethod
+    def iter_segments(cls, path: str) -> Iterator[tuple[EventClock, list[tuple], int | None]]:
+        """
+        Read journal segments one at a time (see read_segment()), skipping segments with no header
+        :param path: Journal directory or a single segment file
+        """
+        for segment in cls.segment_files(path):
+            if os.path.getsize(segment) < HEADER.size:  # Crashed before the header was written, nothing in it
+                continue
+            yield cls.read_segment(segment)
+
+    @classmethod
+    def read(cls, path: str, since_checkpoint: bool = False) -> list[tuple[EventClock, list[tuple]]]:
+        """
+        Read captured events from a journal
+        :param path: Journal directory or a single segment file
+        :param since_checkpoint: Only return events after the last checkpoint, i.e. ones that may not have been logged
+        :returns: Runs of (action, key, modifiers, time_ns) events in the order they were captured, with the clock their
+                  timestamps are relative to. Consecutive segments from the same session are merged into one run.
+                  Everything is read into memory, use iter_segments() for large recordings.
+        """
+        runs: list[tuple[EventClock, list[tuple]]] = []
+        for clock, events, checkpoint in cls.iter_segments(path):
+            if since_checkpoint and checkpoint is not None:
+                runs.clear()
+                events = events[checkpoint:]
+            if runs and runs[-1][0].same_session(clock):
+                runs[-1][1].extend(events)
+            else:
+                runs.append((clock, events))
+        return [(clock, events) for clock, events in runs if events]
+
+    @classmethod
+    def clear(cls, path: str) -> None:
+        """
+        Delete all segments of a journal
+        :param path: Journal directory
+        """
+        for segment in cls.segment_files(path):
+            os.remove(segment)
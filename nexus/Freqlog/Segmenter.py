@@ -0,0 +1,234 @@
+"""Word/chord segmentation of captured input events."""
+
+import logging
+import sys
+from enum import Enum
+from typing import Callable, Iterable
+
+import vinput
+
+from .Definitions import ActionType
+from .Events import modifier_mask
+
+
+class KeyClass(Enum):
+    """How a key affects the word being segmented"""
+    CHAR = 1  # Allowed char, added to the word
+    SEPARATOR = 2  # Whitespace or disallowed char, ends a word or is added to a chord
+    BACKSPACE = 3  # Removes the last char (or word) from the word
+    NON_KEY = 4  # Mouse button or empty key, ends the word
+
+
+class Segmenter:
+    """
+    Splits a stream of captured events into words and chords
+    All key classification is precomputed into a lookup table when the segmenter is built, so each key costs one
+    dict lookup and a few identity/int comparisons
+    """
+
+    def __init__(self, on_word: Callable[[str, int, int], None], on_chord: Callable[[str, int, int], None],
+                 allowed_chars: set, allowed_first_chars: set, modifier_keys: vinput.KeyboardModifiers,
+                 chord_char_threshold: int) -> None:
+        """
+        Initialize the segmenter
+        :param on_word: Called with (word, start_ns, end_ns) for each finished word
+        :param on_chord: Called with (chord, start_ns, end_ns) for each finished chord
+        :param allowed_chars: Chars to be considered as part of words
+        :param allowed_first_chars: Chars to be considered as the first char in words
+        :param modifier_keys: Modifier keys that prevent a key from being logged
+        :param chord_char_threshold: Milliseconds between characters in a chord to be considered a chord
+        """
+        self.on_word = on_word
+        self.on_chord = on_chord
+        self.allowed_chars = allowed_chars
+        self.allowed_first_chars = allowed_first_chars  # TODO: use when first char detection is implemented
+
+        # Thresholds and masks in the units of captured events
+        self.chord_char_threshold_ns: int = chord_char_threshold * 1_000_000
+        self.banned_modifiers: int = modifier_mask(modifier_keys)
+        self.word_del_modifiers: int = modifier_mask(
+            ['left_alt', 'right_alt'] if sys.platform == 'darwin' else ['left_control', 'right_control'])
+
+        # Key -> (class, char), keyed by both the raw captured bytes and the decoded str
+        self.classes: dict[bytes | str, tuple[KeyClass, str]] = {}
+        for char in allowed_chars | set(" \t\n\r\b\0"):
+            self._classify(char)
+        # Backspace on an empty word falls back to this class
+        self.empty_backspace_class = KeyClass.CHAR if "\b" in allowed_chars else KeyClass.SEPARATOR
+        self.debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+        # Segmentation state
+        self.word: str = ""  # word to be logged, reset on criteria below
+        self.word_start_time: int | None = None  # nanosecond timestamps of captured events
+        self.word_end_time: int | None = None
+        self.chars_since_last_bs: int = 0
+        self.avg_char_time_after_last_bs: float | None = None  # nanoseconds
+        self.last_key_was_disallowed: bool = False
+        self.last_event_time: int | None = None  # Only tracked by feed_all() with a new word threshold
+
+    def _classify(self, key: bytes | str | vinput.MouseButtonEvent) -> tuple[KeyClass, str]:
+        """Classify a key that isn't in the lookup table yet, adding it if it's a char"""
+        if isinstance(key, vinput.MouseButtonEvent):
+            return KeyClass.NON_KEY, ""
+        if isinstance(key, bytes):
+            try:
+                char = key.decode('utf-8')
+            except UnicodeDecodeError:  # Partial multibyte char, never part of a word
+                return KeyClass.SEPARATOR, ""
+        else:
+            char = key
+        if char == '' or char == '\0':
+            cls = KeyClass.NON_KEY
+        elif char == '\b':
+            cls = KeyClass.BACKSPACE
+        elif char in " \t\n\r" or char not in self.allowed_chars:
+            cls = KeyClass.SEPARATOR
+        else:
+            cls = KeyClass.CHAR
+        self.classes[char] = self.classes[char.encode('utf-8')] = (cls, char)
+        return cls, char
+
+    def feed(self, action: ActionType, key: bytes | str | vinput.MouseButtonEvent, modifiers: int,
+             time_pressed: int) -> None:
+        """
+        Process one captured event
+        :param action: Whether the key was pressed or released
+        :param key: Key char (bytes as captured or str) or mouse button
+        :param modifiers: Bitmask of modifiers held (see Events.pack_modifiers())
+        :param time_pressed: Nanosecond timestamp of the event
+        """
+        try:
+            cls, char = self.classes[key]
+        except (KeyError, TypeError):  # Not in the table yet, or an (unhashable) mouse button
+            cls, char = self._classify(key)
+
+        # Debug keystrokes
+        if self.debug and cls is not KeyClass.NON_KEY:
+            logging.debug(f"{action}: {char} - {time_pressed}")
+            logging.debug(f"word: '{self.word}', modifiers: {modifiers:#x}")
+
+        if action == ActionType.RELEASE:
+            return
+
+        if cls is KeyClass.BACKSPACE:
+            if self.word:
+                # On backspace, remove last char from word if word is not empty
+                word = self.word
+                if modifiers & self.word_del_modifiers:
+                    # Remove last word from word
+                    # FIXME: make this work - rn _log_and_reset_word() is called immediately upon ctrl/cmd keydown
+                    # TODO: make this configurable (i.e. for vim, etc)
+                    if " " in word:
+                        word = word[:word.rfind(" ")]
+                    elif "\t" in word:
+                        word = word[:word.rfind("\t")]
+                    elif "\n" in word:
+                        word = word[:word.rfind("\n")]
+                    else:  # Word is only one word
+                        word = ""
+                else:
+                    logging.debug(f"Backspace: {word} -> {word[:-1]}")
+                    word = word[:-1]
+                self.word = word
+                self.chars_since_last_bs = 0
+                self.avg_char_time_after_last_bs = None
+                return
+            cls = self.empty_backspace_class
+
+        # Handle whitespace/disallowed keys
+        if cls is KeyClass.SEPARATOR:
+            # If key is whitespace/disallowed and timing is more than chord_char_threshold, log and reset word
+            if (self.word and self.avg_char_time_after_last_bs and
+                    self.avg_char_time_after_last_bs > self.chord_char_threshold_ns):
+                logging.debug(f"Whitespace/disallowed, log+reset: {self.word}")
+                self.flush()
+            else:  # Add key to chord
+                self.word += char
+                self._update_timing(time_pressed)
+                self.last_key_was_disallowed = True
+            return
+
+        # On non-chord key, log and reset word if it exists
+        #   Non-chord key = key in modifier keys or non-key
+        # FIXME: support modifier keys in chords
+        if cls is KeyClass.NON_KEY:
+            logging.debug(f"Non-chord key: {key}")
+            if self.word:
+                self.flush()
+            return
+
+        # Add new char to word and update word timing if no banned modifier keys are pressed
+        if not modifiers & self.banned_modifiers:
+            # I think this is for chords that end in space
+            # If last key was disallowed and timing of this key is more than chord_char_threshold, log+reset
+            if (self.last_key_was_disallowed and self.word and self.word_end_time and
+                    (time_pressed - self.word_end_time) > self.chord_char_threshold_ns):
+                logging.debug(f"Disallowed and timing, log+reset: {self.word}")
+                self.flush()
+            self.word += char
+            self.chars_since_last_bs += 1
+            self._update_timing(time_pressed)
+            return
+
+        # Should never get here
+        logging.error(f"Uncaught key: {char}")
+
+    def feed_all(self, events: Iterable[tuple], new_word_threshold_ns: int | None = None) -> None:
+        """
+        Process a batch of captured events
+        :param events: (action, key, modifiers, time_ns) events
+        :param new_word_threshold_ns: If given, finish the word in progress whenever the gap between two events is
+                longer than this, as the live logger's idle timeout would have (for recorded events), including
+                across calls
+        """
+        feed = self.feed
+        if new_word_threshold_ns is None:
+            for action, key, modifiers, time_pressed in events:
+                feed(action, key, modifiers, time_pressed)
+            return
+        last_time = self.last_event_time
+        for action, key, modifiers, time_pressed in events:
+            if self.word and last_time is not None and time_pressed - last_time > new_word_threshold_ns:
+                self.flush()
+            feed(action, key, modifiers, time_pressed)
+            last_time = time_pressed
+        self.last_event_time = last_time
+
+    def _update_timing(self, time_pressed: int) -> None:
+        """Must be called after adding a key to word"""
+        if self.word_start_time is None:
+            self.word_start_time = time_pressed
+        elif self.chars_since_last_bs > 1 and self.avg_char_time_after_last_bs:
+            # Should only get here if chars_since_last_bs > 2
+            self.avg_char_time_after_last_bs = (self.avg_char_time_after_last_bs * (self.chars_since_last_bs - 1) +
+                                                (time_pressed - self.word_end_time)) / self.chars_since_last_bs
+        elif self.chars_since_last_bs > 1:
+            self.avg_char_time_after_last_bs = time_pressed - self.word_end_time
+        self.word_end_time = time_pressed
+
+    def flush(self, min_length: int = 2) -> None:
+        """
+        Log the word in progress as a word or chord and reset word metadata
+        :param min_length: Only log words/chords that have >= min_length characters
+        """
+        if not self.word:  # Don't log if word is empty
+            return
+
+        # Strip whitespace from start and end of word
+        word = self.word.strip()
+
+        # TODO: Do we need to trim word to only substring that is in allowed_chars?
+
+        if len(word) >= min_length:
+            if (self.avg_char_time_after_last_bs and
+                    self.avg_char_time_after_last_bs > self.chord_char_threshold_ns):  # Word, based on backspace timing
+                self.on_word(word, self.word_start_time, self.word_end_time)
+            else:  # Chord
+                self.on_chord(word, self.word_start_time, self.word_end_time)
+
+        self.word = ""
+        self.word_start_time = None
+        self.word_end_time = None
+        self.chars_since_last_bs = 0
+        self.avg_char_time_after_last_bs = None
+        self.last_key_was_disallowed = False
@@ -2,7 +2,7 @@ from abc import ABC, abstractmethod
 from datetime import datetime
 
 from nexus.Freqlog.Definitions import BanlistAttr, BanlistEntry, CaseSensitivity, ChordMetadata, ChordMetadataAttr, \
-    WordMetadata, WordMetadataAttr
+    Defaults, HistoryEntry, KeysetIterator, WordMetadata, WordMetadataAttr
 
 
 class Backend(ABC):
@@ -67,6 +67,13 @@ class Backend(ABC):
         :returns: True if word was banned, False if it was already banned
         """
 
+    @abstractmethod
+    def ban_words(self, words: list[str], time: datetime) -> list[bool]:
+        """
+        Delete word/chord entries and add them to the ban list, all at once
+        :returns: For each word, True if it was banned, False if it was already banned (or earlier in words)
+        """
+
     @abstractmethod
     def delete_word(self, word: str, case: CaseSensitivity) -> bool:
         """
@@ -74,6 +81,14 @@ class Backend(ABC):
         :returns: True if word was deleted, False if it's not in the database
         """
 
+    @abstractmethod
+    def delete_words(self, words: dict[str, CaseSensitivity]) -> list[bool]:
+        """
+        Delete word/chord entries, all at once
+        :param words: Words to delete and the case sensitivity to delete each with
+        :returns: For each word, True if it was deleted, False if it's not in the database
+        """
+
     @abstractmethod
     def unban_word(self, word: str) -> bool:
         """
@@ -81,6 +96,13 @@ class Backend(ABC):
         :returns: True if word was unbanned, False if it was already not banned
         """
 
+    @abstractmethod
+    def unban_words(self, words: list[str]) -> list[bool]:
+        """
+        Remove words from the ban list, all at once
+        :returns: For each word, True if it was unbanned, False if it was already not banned (or earlier in words)
+        """
+
     @abstractmethod
     def num_words(self, case: CaseSensitivity = CaseSensitivity.INSENSITIVE) -> int:
         """
@@ -101,6 +123,22 @@ class Backend(ABC):
         :param search: Part of word to search for
         """
 
+    @abstractmethod
+    def iter_words(self, sort_by: WordMetadataAttr = WordMetadataAttr.score, reverse: bool = True,
+                   case: CaseSensitivity = CaseSensitivity.INSENSITIVE, search: str = "",
+                   page_size: int = Defaults.DEFAULT_PAGE_SIZE, cursor: str | None = None) -> KeysetIterator:
+        """
+        Iterate over words in the store, fetching them a page at a time
+        :param sort_by: Attribute to sort by: word, frequency, last_used, average_speed, score
+        :param reverse: Reverse sort order
+        :param case: Case sensitivity
+        :param search: Part of word to search for
+        :param page_size: Number of words to fetch at a time
+        :param cursor: Cursor of an iterator with the same sort_by, reverse and case to resume after
+        :returns: Iterator of WordMetadata, with the cursor of the last word returned
+        :raises ValueError: If the cursor is invalid
+        """
+
     @abstractmethod
     def num_chords(self):
         """Get number of chords in store"""
@@ -116,6 +154,66 @@ class Backend(ABC):
         :param search: Part of chord to search for
         """
 
+    @abstractmethod
+    def iter_chords(self, sort_by: ChordMetadataAttr = ChordMetadataAttr.score, reverse: bool = True,
+                    search: str = "", page_size: int = Defaults.DEFAULT_PAGE_SIZE,
+                    cursor: str | None = None) -> KeysetIterator:
+        """
+        Iterate over chords in the store, fetching them a page at a time
+        :param sort_by: Attribute to sort by: chord, frequency, last_used, score
+        :param reverse: Reverse sort order
+        :param search: Part of chord to search for
+        :param page_size: Number of chords to fetch at a time
+        :param cursor: Cursor of an iterator with the same sort_by and reverse to resume after
+        :returns: Iterator of ChordMetadata, with the cursor of the last chord returned
+        :raises ValueError: If the cursor is invalid
+        """
+
+    @abstractmethod
+    def list_word_usage(self, start: datetime, end: datetime, limit: int = -1,
+                        case: CaseSensitivity = CaseSensitivity.INSENSITIVE) -> list[tuple[str, int]]:
+        """
+        List words by how many times they were used between two times
+        :param start: Start of the range (inclusive)
+        :param end: End of the range (exclusive)
+        :param limit: Maximum number of words to return
+        :param case: Case sensitivity
+        :returns: (word, number of uses) pairs, most used first
+        """
+
+    @abstractmethod
+    def list_chord_usage(self, start: datetime, end: datetime, limit: int = -1) -> list[tuple[str, int]]:
+        """
+        List chords by how many times they were used between two times
+        :param start: Start of the range (inclusive)
+        :param end: End of the range (exclusive)
+        :param limit: Maximum number of chords to return
+        :returns: (chord, number of uses) pairs, most used first
+        """
+
+    @abstractmethod
+    def get_word_history(self, word: str, case: CaseSensitivity, start: datetime | None = None,
+                         end: datetime | None = None) -> list[HistoryEntry]:
+        """
+        Get the usage history of a word
+        :param word: Word to get the history of
+        :param case: Case sensitivity
+        :param start: Only get buckets starting at or after this time
+        :param end: Only get buckets starting before this time
+        :returns: Day, week and month buckets the word was used in, oldest first
+        """
+
+    @abstractmethod
+    def get_chord_history(self, chord: str, start: datetime | None = None,
+                          end: datetime | None = None) -> list[HistoryEntry]:
+        """
+        Get the usage history of a chord
+        :param chord: Chord to get the history of
+        :param start: Only get buckets starting at or after this time
+        :param end: Only get buckets starting before this time
+        :returns: Day, week and month buckets the chord was used in, oldest first
+        """
+
     @abstractmethod
     def delete_chord(self, chord: str) -> bool:
         """
@@ -123,6 +221,31 @@ class Backend(ABC):
         :returns: True if chord was deleted, False if it's not in the database
         """
 
+    @abstractmethod
+    def delete_chords(self, chords: list[str]) -> list[bool]:
+        """
+        Delete chord entries, all at once
+        :returns: For each chord, True if it was deleted, False if it's not in the database
+        """
+
+    @abstractmethod
+    def get_chordmap(self, device: str, chord_count: int) -> list[str] | None:
+        """
+        Get the cached chordmap of a device
+        :param device: Device identity
+        :param chord_count: Number of chords currently on the device
+        :returns: Chord outputs, None if the device's chordmap isn't cached or its chord count changed
+        """
+
+    @abstractmethod
+    def set_chordmap(self, device: str, chord_count: int, outputs: list[str]) -> None:
+        """
+        Replace the cached chordmap of a device
+        :param device: Device identity
+        :param chord_count: Number of chords on the device when its chordmap was fetched
+        :param outputs: Chord outputs
+        """
+
     @abstractmethod
     def list_banned_words(self, limit: int, sort_by: BanlistAttr,
                           reverse: bool) -> list[BanlistEntry]:
@@ -141,5 +264,8 @@ class Backend(ABC):
         :raises ValueError: If backend-specific requirements are not met
         """
 
+    def flush(self) -> None:
+        """Write any buffered entries to the store"""
+
     def close(self) -> None:
         """Close the backend"""
@@ -0,0 +1,71 @@
+"""Derivation of banlist keys from passwords, done once per process on a worker thread."""
+
+import hashlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+ITERATIONS = 480000  # PBKDF2-HMAC-SHA256 iterations, changing this makes existing banlists undecryptable
+KEY_LENGTH = 32  # bytes, as Fernet needs
+
+
+class KeyDerivation:
+    """
+    Derives banlist keys with PBKDF2 on a worker thread, remembering each key for the life of the process
+    Each database has its own random salt, so keys are remembered by a digest of salt and password (passwords
+    aren't kept), until they are forgotten for being wrong
+    """
+
+    _lock: Lock = Lock()
+    _executor: ThreadPoolExecutor | None = None
+    _keys: dict[bytes, Future[bytes]] = {}
+
+    @staticmethod
+    def _digest(salt: bytes, password: str) -> bytes:
+        """Key of a salt and password in _keys (length-prefixed, so no two salt and password pairs run together)"""
+        return hashlib.sha256(len(salt).to_bytes(4, "big") + salt + password.encode()).digest()
+
+    @staticmethod
+    def _derive(salt: bytes, password: str) -> bytes:
+        return PBKDF2HMAC(algorithm=hashes.SHA256(), length=KEY_LENGTH, salt=salt,
+                          iterations=ITERATIONS).derive(password.encode())
+
+    @classmethod
+    def start(cls, salt: bytes, password: str) -> Future[bytes]:
+        """
+        Start deriving a key in the background, if it isn't derived or being derived already
+        :param salt: Salt of the database
+        :param password: Password to derive the key from
+        :returns: Future of the key
+        """
+        digest = cls._digest(salt, password)
+        with cls._lock:
+            future = cls._keys.get(digest)
+            if future is None:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(thread_name_prefix="KeyDerivation")
+                future = cls._executor.submit(cls._derive, salt, password)
+                cls._keys[digest] = future
+            return future
+
+    @classmethod
+    def derive(cls, salt: bytes, password: str) -> bytes:
+        """
+        Get a key, waiting for it to be derived if necessary
+        :param salt: Salt of the database
+        :param password: Password to derive the key from
+        :returns: Key derived from the password and salt
+        """
+        return cls.start(salt, password).result()
+
+    @classmethod
+    def forget(cls, salt: bytes, password: str) -> None:
+        """
+        Forget a key, i.e. once its password turns out to be wrong or is changed
+        :param salt: Salt of the database
+        :param password: Password the key was derived from
+        """
+        with cls._lock:
+            cls._keys.pop(cls._digest(salt, password), None)
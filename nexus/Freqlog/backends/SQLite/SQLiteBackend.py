@@ -1,25 +1,79 @@
 import base64
+import hmac
+import json
 import logging
+import math
 import os
+import queue
 import sqlite3
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from pathlib import Path
 from sqlite3 import Cursor
+from typing import Iterator
 
 import cryptography.fernet as cryptography
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 
 from nexus import __version__
 from nexus.Freqlog.backends.Backend import Backend
+from nexus.Freqlog.backends.SQLite.KeyDerivation import KeyDerivation
 from nexus.Freqlog.Definitions import Age, BanlistAttr, BanlistEntry, CaseSensitivity, ChordMetadata, \
-    ChordMetadataAttr, WordMetadata, WordMetadataAttr
+    ChordMetadataAttr, Defaults, HistoryEntry, HistoryPeriod, KeysetIterator, Progress, WordMetadata, WordMetadataAttr
 from nexus.Version import Version
 
 # WARNING: Directly loaded into SQL query, do not use unsanitized user input
 SQL_SELECT_STAR_FROM_FREQLOG = "SELECT word, frequency, lastused, avgspeed FROM freqlog"
 SQL_SELECT_STAR_FROM_CHORDLOG = "SELECT chord, frequency, lastused FROM chordlog"
-SQL_SELECT_STAR_FROM_BANLIST = "SELECT word, dateadded FROM banlist"
+SQL_SELECT_STAR_FROM_BANLIST = "SELECT word, dateadded, hash FROM banlist"
+
+# Log (or merge) an entry in one statement, with the same result as merging WordMetadata/ChordMetadata with |
+#   (SET expressions see the row's values from before the update). Always the same strings, so sqlite3 reuses the
+#   prepared statements from its per-connection cache.
+SQL_UPSERT_WORD = ("INSERT INTO freqlog (word, frequency, lastused, avgspeed) VALUES (?, ?, ?, ?) "
+                   "ON CONFLICT(word) DO UPDATE SET frequency = frequency + excluded.frequency, "
+                   "lastused = max(lastused, excluded.lastused), "
+                   "avgspeed = (avgspeed * frequency + excluded.avgspeed * excluded.frequency) / "
+                   "(frequency + excluded.frequency)")
+SQL_UPSERT_CHORD = ("INSERT INTO chordlog (chord, frequency, lastused) VALUES (?, ?, ?) "
+                    "ON CONFLICT(chord) DO UPDATE SET frequency = frequency + excluded.frequency, "
+                    "lastused = max(lastused, excluded.lastused)")
+
+# Score (as in WordMetadata/ChordMetadata) as a virtual generated column, so it can be indexed for sorting
+SQL_WORD_SCORE = "score INTEGER GENERATED ALWAYS AS (length(word) * frequency) VIRTUAL"
+SQL_CHORD_SCORE = "score INTEGER GENERATED ALWAYS AS (length(chord) * frequency) VIRTUAL"
+
+# Aggregates of freqlog by un-cased word for INSENSITIVE and FIRST_CHAR queries, kept up to date by triggers
+#   case -> (table, key of a freqlog word, condition matching the freqlog words of a key using their indexes)
+SQL_WORD_AGGREGATES = {
+    CaseSensitivity.INSENSITIVE: ("freqlog_folded", "lower({word})", "word = {key} COLLATE NOCASE"),
+    CaseSensitivity.FIRST_CHAR: ("freqlog_firstchar", "lower(substr({word}, 1, 1)) || substr({word}, 2)",
+                                 "word IN ({key}, upper(substr({key}, 1, 1)) || substr({key}, 2))"),
+}
+
+# Trigram full-text indexes of freqlog and chordlog for substring searches, kept up to date by triggers
+#   table -> searched column. Trigrams only match searches of at least 3 characters, shorter ones scan.
+SQL_SEARCH_INDEXES = {"freqlog": "word", "chordlog": "chord"}
+SEARCH_INDEX_MIN_LENGTH = 3
+
+# Usage history of freqlog and chordlog in buckets of a day, rolled up into weeks and months as they get old
+#   table -> logged column. Entries are deleted from the history with their freqlog/chordlog entry by triggers.
+SQL_HISTORY_TABLES = {"freqlog": "word", "chordlog": "chord"}
+SQL_UPSERT_HISTORY = {table: (f"INSERT INTO {table}_history (period, start, {column}, frequency) VALUES (?, ?, ?, ?) "
+                              f"ON CONFLICT(period, start, {column}) DO UPDATE SET "
+                              "frequency = frequency + excluded.frequency")
+                      for table, column in SQL_HISTORY_TABLES.items()}
+
+# Versions with an upgrade step in _upgrade_database, to count them for progress
+UPGRADE_STEPS = ("0.4.1", "0.5.0", "0.5.4", "0.5.5", "0.5.6", "0.5.7", "0.5.8", "0.5.9", "0.5.10")
+
+# Where long operations (i.e. merges) got to, committed with each chunk of their work so they can resume
+#   operation -> JSON state of the operation
+SQL_CREATE_CHECKPOINTS = ("CREATE TABLE IF NOT EXISTS checkpoints (operation TEXT PRIMARY KEY, state TEXT NOT NULL) "
+                          "WITHOUT ROWID")
 
 
 class SQLiteBackend(Backend):
@@ -34,29 +88,171 @@ class SQLiteBackend(Backend):
 
         # Freqloq table
         cursor.execute("CREATE TABLE IF NOT EXISTS freqlog (word TEXT NOT NULL PRIMARY KEY, frequency INTEGER, "
-                       "lastused timestamp NOT NULL, avgspeed REAL NOT NULL) WITHOUT ROWID")
+                       f"lastused timestamp NOT NULL, avgspeed REAL NOT NULL, {SQL_WORD_SCORE}) WITHOUT ROWID")
         cursor.execute("CREATE INDEX IF NOT EXISTS freqlog_lower ON freqlog(word COLLATE NOCASE)")
         cursor.execute("CREATE INDEX IF NOT EXISTS freqlog_frequency ON freqlog(frequency)")
         cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS freqlog_lastused ON freqlog(lastused)")
         cursor.execute("CREATE INDEX IF NOT EXISTS freqlog_avgspeed ON freqlog(avgspeed)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS freqlog_score ON freqlog(score)")
+        SQLiteBackend._init_word_aggregates(cursor)
 
         # Chordlog table
         cursor.execute("CREATE TABLE IF NOT EXISTS chordlog (chord TEXT NOT NULL PRIMARY KEY, frequency INTEGER, "
-                       "lastused timestamp NOT NULL) WITHOUT ROWID")
+                       f"lastused timestamp NOT NULL, {SQL_CHORD_SCORE}) WITHOUT ROWID")
         cursor.execute("CREATE INDEX IF NOT EXISTS chordlog_frequency ON chordlog(frequency)")
         cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS chordlog_lastused ON chordlog(lastused)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS chordlog_score ON chordlog(score)")
 
         # Banlist table
-        cursor.execute("CREATE TABLE IF NOT EXISTS banlist (word TEXT PRIMARY KEY, dateadded timestamp NOT NULL) "
-                       "WITHOUT ROWID")
+        cursor.execute("CREATE TABLE IF NOT EXISTS banlist (word TEXT PRIMARY KEY, dateadded timestamp NOT NULL, "
+                       "hash BLOB) WITHOUT ROWID")
         cursor.execute("CREATE INDEX IF NOT EXISTS banlist_dateadded ON banlist(dateadded)")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS banlist_hash ON banlist(hash)")
 
         # Config table
         cursor.execute("CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID")
 
+        # Checkpoints of interrupted long operations
+        cursor.execute(SQL_CREATE_CHECKPOINTS)
+
+        # Search indexes
+        SQLiteBackend._init_search_indexes(cursor)
+
+        # Usage history
+        SQLiteBackend._init_history(cursor)
+
+        # Chordmap cache tables
+        cursor.execute("CREATE TABLE IF NOT EXISTS devices (device TEXT PRIMARY KEY, chordcount INTEGER NOT NULL, "
+                       "updated timestamp NOT NULL) WITHOUT ROWID")
+        cursor.execute("CREATE TABLE IF NOT EXISTS chordmap (device TEXT NOT NULL, output TEXT NOT NULL)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS chordmap_device ON chordmap(device)")
+
         # Add salt to settings table if it doesn't exist
         cursor.execute("INSERT OR IGNORE INTO config VALUES ('salt', ?)", (os.urandom(16),))
 
+    @staticmethod
+    def _init_word_aggregates(cursor: Cursor) -> None:
+        """
+        Create the un-cased aggregate tables of freqlog, their indexes and the triggers that maintain them,
+        and fill them from freqlog
+        """
+        for table, key, members in SQL_WORD_AGGREGATES.values():
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} (word TEXT NOT NULL PRIMARY KEY, "
+                           "frequency INTEGER NOT NULL, lastused timestamp NOT NULL, avgspeed REAL NOT NULL, "
+                           "score INTEGER NOT NULL) WITHOUT ROWID")
+            for column in ("frequency", "lastused", "avgspeed", "score"):
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table}({column})")
+
+            def refresh(word: str) -> str:
+                """Statements recomputing the aggregate row of a freqlog word from the words it aggregates"""
+                k = key.format(word=word)
+                return (f"DELETE FROM {table} WHERE word = {k}; "
+                        f"INSERT INTO {table} SELECT {k}, sum(frequency), max(lastused), "
+                        f"sum(avgspeed * frequency) / sum(frequency), length({k}) * sum(frequency) FROM freqlog "
+                        f"WHERE {members.format(key=k)} GROUP BY {k};")
+
+            # Logging only adds to an entry, so apply the difference in place (same merge as SQL_UPSERT_WORD).
+            #   Anything else (i.e. deletes) recomputes the affected rows.
+            new_key, old_key = key.format(word="new.word"), key.format(word="old.word")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON freqlog BEGIN "
+                           f"INSERT INTO {table} VALUES ({new_key}, new.frequency, new.lastused, new.avgspeed, "
+                           f"length({new_key}) * new.frequency) ON CONFLICT(word) DO UPDATE SET "
+                           "frequency = frequency + excluded.frequency, lastused = max(lastused, excluded.lastused), "
+                           "avgspeed = (avgspeed * frequency + excluded.avgspeed * excluded.frequency) / "
+                           "(frequency + excluded.frequency), score = score + excluded.score; END")
+            added = "new.lastused >= old.lastused AND new.frequency > 0"
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE ON freqlog "
+                           f"WHEN {old_key} = {new_key} AND {added} BEGIN "
+                           f"UPDATE {table} SET frequency = frequency - old.frequency + new.frequency, "
+                           "lastused = max(lastused, new.lastused), "
+                           "avgspeed = (avgspeed * frequency - old.avgspeed * old.frequency + "
+                           "new.avgspeed * new.frequency) / (frequency - old.frequency + new.frequency), "
+                           "score = length(word) * (frequency - old.frequency + new.frequency) "
+                           f"WHERE word = {new_key}; END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_replace AFTER UPDATE ON freqlog "
+                           f"WHEN NOT ({old_key} = {new_key} AND {added}) "
+                           f"BEGIN {refresh('old.word')} {refresh('new.word')} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON freqlog "
+                           f"BEGIN {refresh('old.word')} END")
+
+            # Existing words
+            k = key.format(word="word")
+            cursor.execute(f"INSERT OR IGNORE INTO {table} SELECT {k}, sum(frequency), max(lastused), "
+                           f"sum(avgspeed * frequency) / sum(frequency), length({k}) * sum(frequency) FROM freqlog "
+                           f"GROUP BY {k}")
+
+    @staticmethod
+    def _init_search_indexes(cursor: Cursor) -> None:
+        """
+        Create the trigram indexes of freqlog and chordlog and the triggers that maintain them, and fill them
+        Logs a warning and leaves searches unindexed if SQLite was built without FTS5
+        """
+        for table, column in SQL_SEARCH_INDEXES.items():
+            try:
+                cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_search USING fts5({column}, "
+                               "tokenize = 'trigram')")
+            except sqlite3.OperationalError as e:
+                logging.warning(f"Could not create search index for {table}, searches will scan it: {e}")
+                return
+
+            # FTS5 rows are only found by rowid or MATCH, so find a deleted entry's row by searching for it
+            #   (scans if it is too short to search for)
+            delete = (f"DELETE FROM {table}_search WHERE length(old.{column}) >= {SEARCH_INDEX_MIN_LENGTH} AND "
+                      f"rowid IN (SELECT rowid FROM {table}_search WHERE {table}_search MATCH "
+                      f"'\"' || replace(old.{column}, '\"', '\"\"') || '\"' AND {column} = old.{column}); "
+                      f"DELETE FROM {table}_search WHERE length(old.{column}) < {SEARCH_INDEX_MIN_LENGTH} AND "
+                      f"{column} = old.{column};")
+            insert = f"INSERT INTO {table}_search ({column}) VALUES (new.{column});"
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} "
+                           f"BEGIN {insert} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {column} ON {table} "
+                           f"WHEN old.{column} != new.{column} BEGIN {delete} {insert} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} "
+                           f"BEGIN {delete} END")
+
+            # Existing entries, merged into one b-tree per trigram (what logging adds later is merged incrementally)
+            cursor.execute(f"INSERT INTO {table}_search ({column}) SELECT {column} FROM {table}")
+            cursor.execute(f"INSERT INTO {table}_search ({table}_search) VALUES ('optimize')")
+
+    @staticmethod
+    def _drop_derived_triggers(cursor: Cursor) -> None:
+        """
+        Drop the triggers that keep the aggregate and search tables up to date with freqlog and chordlog, for bulk
+        loads. _init_word_aggregates and _init_search_indexes recreate them and fill the tables afterwards
+        """
+        for table, _, _ in SQL_WORD_AGGREGATES.values():
+            for event in ("insert", "update", "replace", "delete"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {table}_{event}")
+        for table in SQL_SEARCH_INDEXES:
+            for event in ("insert", "update", "delete"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {table}_search_{event}")
+
+    @staticmethod
+    def _init_history(cursor: Cursor) -> None:
+        """Create the usage history tables of freqlog and chordlog and the triggers that delete from them"""
+        for table, column in SQL_HISTORY_TABLES.items():
+            # Keyed by bucket so range queries and rollups are primary key range scans
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}_history (period INTEGER NOT NULL, "
+                           f"start timestamp NOT NULL, {column} TEXT NOT NULL, frequency INTEGER NOT NULL, "
+                           f"PRIMARY KEY (period, start, {column})) WITHOUT ROWID")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_history_{column} ON {table}_history"
+                           f"({column} COLLATE NOCASE)")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_history_delete AFTER DELETE ON {table} BEGIN "
+                           f"DELETE FROM {table}_history WHERE {column} = old.{column} COLLATE NOCASE AND "
+                           f"{column} = old.{column}; END")
+
+    @staticmethod
+    def _history_bucket(time: datetime, period: HistoryPeriod) -> datetime:
+        """Get the start of the usage history bucket of a time (local time, weeks start on Monday)"""
+        day = time.replace(hour=0, minute=0, second=0, microsecond=0)
+        match period:
+            case HistoryPeriod.DAY:
+                return day
+            case HistoryPeriod.WEEK:
+                return day - timedelta(days=day.weekday())
+            case HistoryPeriod.MONTH:
+                return day.replace(day=1)
+
     @staticmethod
     def is_db_populated(db_path: str) -> bool:
         """
@@ -95,7 +291,12 @@ class SQLiteBackend(Backend):
                 raise PermissionError(f"Database path {db_path} is not writable")
             return False
 
-    def __init__(self, db_path: str, password_callback: callable, upgrade_callback: callable = None) -> None:
+    def __init__(self, db_path: str, password_callback: callable, upgrade_callback: callable = None,
+                 write_behind: bool = False, write_buffer_size: int = Defaults.DEFAULT_WRITE_BUFFER_SIZE,
+                 write_buffer_interval: float = Defaults.DEFAULT_WRITE_BUFFER_INTERVAL, wal: bool = True,
+                 busy_timeout: float = Defaults.DEFAULT_BUSY_TIMEOUT,
+                 reader_pool_size: int = Defaults.DEFAULT_READER_POOL_SIZE,
+                 progress_callback: callable = None) -> None:
         """
         Initialize the SQLite backend
         :param db_path: Path to the database file
@@ -103,6 +304,14 @@ class SQLiteBackend(Backend):
                 Should take one argument: whether the password is being set for the first time
         :param upgrade_callback: Callback to call when upgrading the database.
                 Should take one argument: the new version, and call sys.exit() if an upgrade is unwanted
+        :param write_behind: Whether to buffer logged words/chords in memory and write them in batches
+        :param write_buffer_size: Number of distinct buffered words/chords after which the buffer is flushed
+        :param write_buffer_interval: Seconds since the last flush after which the buffer is flushed
+        :param wal: Whether to put the database in WAL mode, so that readers and the writer don't block each other
+        :param busy_timeout: Seconds to wait for a lock held by another connection before raising
+        :param reader_pool_size: Number of idle read-only connections to keep for queries (0 to query on the writer
+                connection, which is always the case for in-memory databases)
+        :param progress_callback: Callback to call with a Progress as long operations (upgrades, merges) advance
         :raises ValueError: If the database version is newer than the current version
         :raises PermissionError: If the database path is not readable or writable
         :raises IsADirectoryError: If the database path is not a file
@@ -111,10 +320,32 @@ class SQLiteBackend(Backend):
         """
         self.db_path = db_path
         db_populated = self.is_db_populated(db_path)
-        self.conn = sqlite3.connect(self.db_path)
+        self.busy_timeout = busy_timeout
+        self.conn = sqlite3.connect(self.db_path, timeout=busy_timeout)  # Writer connection
         self.cursor = self.conn.cursor()
+        if wal and db_path != ":memory:":
+            mode = self.cursor.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            if mode != "wal":
+                logging.warning(f"Could not put database in WAL mode, using {mode} journal mode")
+
+        # Read-only connections for queries, taken from the pool for each query and returned afterwards
+        self.reader_pool_size = reader_pool_size if db_path != ":memory:" else 0
+        self._readers: queue.SimpleQueue[sqlite3.Connection] = queue.SimpleQueue()
         self.password_callback = password_callback
         self.upgrade_callback = upgrade_callback
+        self.progress_callback = progress_callback
+
+        # Write-behind buffer, folds repeated entries until flushed (declare before anything can call close())
+        self.write_behind = write_behind
+        self.write_buffer_size = write_buffer_size
+        self.write_buffer_interval = write_buffer_interval
+        self._pending_words: dict[str, WordMetadata] = {}
+        self._pending_chords: dict[str, ChordMetadata] = {}
+        self._last_flush: float = time.monotonic()
+        self._num_buffered: int = 0  # Number of log_word/log_chord calls that went through the buffer
+        self._num_flushes: int = 0  # Number of commits made by flush()
+        self._pending_history: dict[tuple[str, str, float], int] = {}  # (table, entry, day) -> frequency
+        self._history_day: datetime | None = None  # Day of the latest logged entry, history is rolled up on new days
 
         version = Version(__version__)
 
@@ -143,11 +374,20 @@ class SQLiteBackend(Backend):
                     os.remove(self.db_path)
                 raise
 
-        # Fetch salt from config table and initialize Fernet for encryption/decryption using user-supplied password
+        # Fetch salt from config table and start deriving the banlist key from the user-supplied password, which
+        #   takes a while, so the rest of the database is read in the meantime
         self.salt = self._fetchconfig("salt")
-        self.fernet = Fernet(base64.urlsafe_b64encode(
-            PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=self.salt,
-                       iterations=480000).derive(self.password.encode())))
+        key_future = KeyDerivation.start(self.salt, self.password)
+
+        # Whether searches can use the trigram indexes (not if SQLite was built without FTS5)
+        self.search_indexed: bool = self._fetchone(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name IN ('freqlog_search', 'chordlog_search')")[0] == 2
+        hashes = self._fetchall("SELECT hash FROM banlist WHERE hash IS NOT NULL")
+
+        # Initialize Fernet for encryption/decryption
+        key = key_future.result()
+        self.fernet = Fernet(base64.urlsafe_b64encode(key))
+        self._hash_key = self._derive_hash_key(key)
 
         # Initialize password check if it doesn't exist
         self._execute("INSERT OR IGNORE INTO config VALUES ('check', ?)", (self.fernet.encrypt(self.salt),))
@@ -156,9 +396,29 @@ class SQLiteBackend(Backend):
         if not self.check_password(self.password):
             raise cryptography.InvalidToken("Incorrect password")
 
-        # Decrypt banlist
-        self.banlist = [BanlistEntry(self.decrypt(row[0]), datetime.fromtimestamp(row[1])) for row in
-                        self._fetchall(f"{SQL_SELECT_STAR_FROM_BANLIST}")]
+        # Keyed hashes of banned words, to check words against the banlist without decrypting it
+        self._banned: set[bytes] = {row[0] for row in hashes}
+        self._banlist: dict[bytes, BanlistEntry] | None = None  # Decrypted banlist, when it's first needed
+
+        # Hash entries banned before v0.5.9 (decrypting only them)
+        unhashed: list[tuple[bytes, str]] = []
+        duplicates: list[tuple[str]] = []
+        rows = self._fetchall("SELECT word FROM banlist WHERE hash IS NULL")
+        if rows:
+            progress = Progress("Hashing banned words", len(rows), self.progress_callback)
+            for word, in rows:
+                word_hash = self._hash_word(self.decrypt(word))
+                progress.advance()
+                if word_hash in self._banned:  # Nothing stopped the same word being banned twice
+                    duplicates.append((word,))
+                    continue
+                self._banned.add(word_hash)
+                unhashed.append((word_hash, word))
+            self.cursor.executemany("DELETE FROM banlist WHERE word = ?", duplicates)
+            self.cursor.executemany("UPDATE banlist SET hash = ? WHERE word = ?", unhashed)
+            self.conn.commit()
+            progress.finish()
+            logging.info(f"Hashed {len(unhashed)} banlist entries")
 
     def _execute(self, query: str, params=None) -> None:
         if params:
@@ -181,9 +441,99 @@ class SQLiteBackend(Backend):
             self.cursor.execute(query)
         return self.cursor.fetchall()
 
+    @contextmanager
+    def _reader(self) -> Iterator[Cursor]:
+        """
+        Get a cursor on a read-only connection from the pool (or the writer connection if there is no pool)
+        Reads see the last committed state, so flush() the write-behind buffer first
+        """
+        if not self.reader_pool_size:
+            yield self.cursor
+            return
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(f"{Path(self.db_path).resolve().as_uri()}?mode=ro", uri=True,
+                                   timeout=self.busy_timeout, check_same_thread=False)
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+            if self._readers.qsize() < self.reader_pool_size:
+                self._readers.put(conn)
+            else:
+                conn.close()
+
+    def _read_one(self, query: str, params=None) -> tuple:
+        """Fetch one row of a query on a reader connection"""
+        with self._reader() as cursor:
+            return cursor.execute(query, params or ()).fetchone()
+
+    def _read_all(self, query: str, params=None) -> list[tuple]:
+        """Fetch all rows of a query on a reader connection"""
+        with self._reader() as cursor:
+            return cursor.execute(query, params or ()).fetchall()
+
+    def _sql_search(self, table: str, search: str, key: str = "{word}", limit: int = -1) -> tuple[str, tuple]:
+        """
+        Get a WHERE condition and its parameters for entries containing a search string (case-insensitive)
+        :param table: Searched table: freqlog or chordlog
+        :param search: Part of word/chord to search for, matched literally
+        :param key: Expression for the key of the queried table from a searched entry (for the aggregate tables)
+        :param limit: Maximum number of entries the query returns
+        :returns: Condition (empty if not searching) and its parameters
+        """
+        if not search:
+            return "", ()
+        column = SQL_SEARCH_INDEXES[table]
+        if self.search_indexed and len(search) >= SEARCH_INDEX_MIN_LENGTH:
+            phrase = '"' + search.replace('"', '""') + '"'  # Trigrams of a phrase match it as a substring
+            if limit <= 0 or not self._search_is_common(table, phrase, limit):
+                return (f"{column} IN (SELECT {key.format(word=column)} FROM {table}_search "
+                        f"WHERE {table}_search MATCH ?)", (phrase,))
+
+        # Filter while walking the sort column's index
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"{column} LIKE ? ESCAPE '\\'", (f"%{escaped}%",)
+
+    def _search_is_common(self, table: str, phrase: str, limit: int) -> bool:
+        """
+        Whether a search matches so many entries that filtering the sorted entries until the limit is reached is
+        faster than sorting all the matches from the search index
+        Sorting m matches costs about as much as filtering (rows / m) * limit entries, so the break-even point is
+        around sqrt(limit * rows) matches
+        """
+        rows = self._read_one(f"SELECT max(rowid) FROM {table}_search")[0] or 0  # Estimate, rowids aren't reused
+        threshold = math.isqrt(limit * rows) + 1
+        return self._read_one(f"SELECT COUNT(*) FROM (SELECT 1 FROM {table}_search WHERE {table}_search MATCH ? "
+                              f"LIMIT {threshold})", (phrase,))[0] >= threshold
+
     def _fetchconfig(self, key: str) -> str | bytes:
         return self._fetchone("SELECT value FROM config WHERE key = ?", (key,))[0]
 
+    @property
+    def banlist(self) -> dict[bytes, BanlistEntry]:
+        """Banlist entries by keyed hash of the word, decrypted on first use"""
+        if self._banlist is None:
+            self._banlist = {row[2]: BanlistEntry(self.decrypt(row[0]), datetime.fromtimestamp(row[1]))
+                             for row in self._read_all(SQL_SELECT_STAR_FROM_BANLIST)}
+            logging.debug(f"Decrypted {len(self._banlist)} banlist entries")
+        return self._banlist
+
+    def _derive_key(self, password: str) -> bytes:
+        """Derive the banlist key from a password and the database's salt (once per process)"""
+        return KeyDerivation.derive(self.salt, password)
+
+    @staticmethod
+    def _derive_hash_key(key: bytes) -> bytes:
+        """Derive the key of banlist hashes from the banlist key (so neither key reveals the other)"""
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"nexus banlist hash").derive(key)
+
+    def _hash_word(self, word: str) -> bytes:
+        """Keyed hash of a banned word, to look it up without decrypting the banlist"""
+        return hmac.digest(self._hash_key, word.lower().encode(), "sha256")
+
     def encrypt(self, word: str) -> str:
         """Encrypt a word"""
         return self.fernet.encrypt(word.encode()).decode()
@@ -201,6 +551,15 @@ class SQLiteBackend(Backend):
             self.upgrade_callback(old_version)
         logging.warning(f"Upgrading database from {old_version} to {Version(__version__)}")
 
+        # Each step bumps the version once it is done, so an interrupted upgrade resumes at the step it was in
+        steps = [step for step in UPGRADE_STEPS if old_version < step]
+        progress = Progress("Upgrading database", len(steps), self.progress_callback, unit="steps")
+
+        def bump(step: str) -> None:
+            """Bump version after an upgrade step"""
+            self.set_version(Version(step))
+            progress.advance()
+
         if old_version < '0.4.1':  # Restore first 4 tables
             # Freqloq table
             self._execute("CREATE TABLE IF NOT EXISTS freqlog (word TEXT NOT NULL PRIMARY KEY, frequency INTEGER, "
@@ -224,45 +583,104 @@ class SQLiteBackend(Backend):
                           "dateadded timestamp NOT NULL) WITHOUT ROWID")
 
             # Bump version
-            self.set_version(Version('0.4.1'))
+            bump('0.4.1')
         if old_version < '0.5.0':
             # Get password
             self.password = self.password_callback(True)
+            self.salt = os.urandom(16)
+            self.fernet = Fernet(base64.urlsafe_b64encode(self._derive_key(self.password)))
 
-            # Merge data in banlist table into banlist_lower and drop banlist table
-            self._execute("INSERT OR IGNORE INTO banlist_lower SELECT word, dateadded FROM banlist")
+            # In one transaction, as the entries are moved from table to table (sqlite3 doesn't start one for DDL)
+            self.cursor.execute("BEGIN")
+            try:
+                # Merge data in banlist table into banlist_lower and drop banlist table
+                self.cursor.execute("INSERT OR IGNORE INTO banlist_lower SELECT word, dateadded FROM banlist")
+
+                # Drop old banlist table
+                self.cursor.execute("DROP TABLE banlist")
+
+                # Move banlist_lower table to banlist and encrypt entries
+                # Read from banlist_lower
+                res = self.cursor.execute("SELECT word, dateadded FROM banlist_lower").fetchall()
+
+                # Config table, with the salt of the encryption key
+                self.cursor.execute("CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT NOT NULL) "
+                                    "WITHOUT ROWID")
+                self.cursor.execute("INSERT INTO config VALUES ('salt', ?)", (self.salt,))
+
+                # Encrypt and write to banlist
+                self.cursor.execute("CREATE TABLE banlist (word TEXT PRIMARY KEY, dateadded timestamp NOT NULL)")
+                encrypting = Progress("Encrypting banlist", len(res), self.progress_callback)
+                for word, dateadded in res:
+                    self.cursor.execute("INSERT INTO banlist VALUES (?, ?)", (self.encrypt(word.lower()), dateadded))
+                    encrypting.advance()
+
+                # Drop banlist_lower table
+                self.cursor.execute("DROP TABLE banlist_lower")
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+            encrypting.finish()
+
+            # Bump version
+            bump('0.5.0')
+        if old_version < '0.5.4':
+            # Chordmap cache tables
+            self._execute("CREATE TABLE IF NOT EXISTS devices (device TEXT PRIMARY KEY, chordcount INTEGER NOT NULL, "
+                          "updated timestamp NOT NULL) WITHOUT ROWID")
+            self._execute("CREATE TABLE IF NOT EXISTS chordmap (device TEXT NOT NULL, output TEXT NOT NULL)")
+            self._execute("CREATE INDEX IF NOT EXISTS chordmap_device ON chordmap(device)")
 
-            # Drop old banlist table
-            self._execute("DROP TABLE banlist")
+            # Bump version
+            bump('0.5.4')
+        if old_version < '0.5.5':
+            # Un-cased aggregates of freqlog
+            self._init_word_aggregates(self.cursor)
+            self.conn.commit()
 
-            # Move banlist_lower table to banlist and encrypt entries
-            # Read from banlist_lower
-            res = self._fetchall("SELECT word, dateadded FROM banlist_lower")
+            # Bump version
+            bump('0.5.5')
+        if old_version < '0.5.6':
+            # Indexed score columns (only virtual generated columns can be added to existing tables)
+            self._execute(f"ALTER TABLE freqlog ADD COLUMN {SQL_WORD_SCORE}")
+            self._execute("CREATE INDEX IF NOT EXISTS freqlog_score ON freqlog(score)")
+            self._execute(f"ALTER TABLE chordlog ADD COLUMN {SQL_CHORD_SCORE}")
+            self._execute("CREATE INDEX IF NOT EXISTS chordlog_score ON chordlog(score)")
 
-            # Config table
-            self._execute("CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID")
+            # Bump version
+            bump('0.5.6')
+        if old_version < '0.5.7':
+            # Trigram search indexes
+            self._init_search_indexes(self.cursor)
+            self.conn.commit()
 
-            # Initialize Fernet for encryption/decryption using user-supplied password
-            self.salt = os.urandom(16)
-            self._execute("INSERT INTO config VALUES ('salt', ?)", (self.salt,))
-            self.fernet = Fernet(base64.urlsafe_b64encode(
-                PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=self.salt,
-                           iterations=480000).derive(self.password.encode())))
+            # Bump version
+            bump('0.5.7')
+        if old_version < '0.5.8':
+            # Usage history (starts empty, logged entries have no record of when they were used before)
+            self._init_history(self.cursor)
 
-            # Encrypt and write to banlist
-            self._execute("CREATE TABLE banlist (word TEXT PRIMARY KEY, dateadded timestamp NOT NULL)")
-            for word, dateadded in res:
-                self._execute("INSERT INTO banlist VALUES (?, ?)", (self.encrypt(word.lower()), dateadded))
+            # Bump version
+            bump('0.5.8')
+        if old_version < '0.5.9':
+            # Keyed hashes of banned words (filled in once the password is known)
+            self._execute("ALTER TABLE banlist ADD COLUMN hash BLOB")
+            self._execute("CREATE UNIQUE INDEX IF NOT EXISTS banlist_hash ON banlist(hash)")
 
-            # Drop banlist_lower table
-            self._execute("DROP TABLE banlist_lower")
+            # Bump version
+            bump('0.5.9')
+        if old_version < '0.5.10':
+            # Checkpoints of long operations
+            self._execute(SQL_CREATE_CHECKPOINTS)
 
             # Bump version
-            self.set_version(Version('0.5.0'))
+            bump('0.5.10')
         # TODO: update this function when changing DDL
         if old_version < Version(__version__):
             # Bump version
             self.set_version(Version(__version__))
+        progress.finish()
 
     def get_version(self) -> Version:
         """Get the version of the database"""
@@ -273,54 +691,50 @@ class SQLiteBackend(Backend):
         self._execute(f"PRAGMA user_version = {int(version)}")
 
     def set_password(self, password: str) -> None:
-        """Set the password used to encrypt/decrypt banlist entries"""
-        self.fernet = Fernet(base64.urlsafe_b64encode(
-            PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=self.salt,
-                       iterations=480000).derive(password.encode())))
+        """Set the password used to encrypt/decrypt banlist entries, re-encrypting and re-hashing them"""
+        entries = self.banlist.values()  # Decrypted with the old key
+        KeyDerivation.forget(self.salt, self.password)
+        self.password = password
+        key = self._derive_key(password)
+        self.fernet = Fernet(base64.urlsafe_b64encode(key))
+        self._hash_key = self._derive_hash_key(key)
+        self._banlist = {self._hash_word(entry.word): entry for entry in entries}
+        self._banned = set(self._banlist)
+        self.cursor.execute("DELETE FROM banlist")
+        self.cursor.executemany("INSERT INTO banlist (word, dateadded, hash) VALUES (?, ?, ?)",
+                                ((self.encrypt(entry.word), entry.date_added.timestamp(), word_hash)
+                                 for word_hash, entry in self.banlist.items()))
         self._execute("UPDATE config SET value = ? WHERE key = 'check'",
                       (self.fernet.encrypt(self.salt),))
 
     def check_password(self, password) -> bool:
-        """Check if the password is correct"""
+        """Check if the password is correct, forgetting its derived key if it isn't"""
         try:
-            return (Fernet(base64.urlsafe_b64encode(
-                PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=self.salt, iterations=480000).derive(
-                    password.encode()))).decrypt(self._fetchconfig("check")) == self.salt)
+            if Fernet(base64.urlsafe_b64encode(self._derive_key(password))).decrypt(self._fetchconfig("check")) == \
+                    self.salt:
+                return True
         except cryptography.InvalidToken:
-            return False
+            pass
+        KeyDerivation.forget(self.salt, password)
+        return False
 
     def get_word_metadata(self, word: str, case: CaseSensitivity) -> WordMetadata | None:
         """
         Get metadata for a word
         :returns: WordMetadata if word is found, None otherwise
         """
+        self.flush()
         match case:
-            case CaseSensitivity.INSENSITIVE:
-                word = word.lower()
-                res = self._fetchall(f"{SQL_SELECT_STAR_FROM_FREQLOG} WHERE word = ? COLLATE NOCASE", (word,))
-                word_metadata = None
-                for row in res:
-                    if word_metadata is None:
-                        word_metadata = WordMetadata(word, row[1], datetime.fromtimestamp(row[2]),
-                                                     timedelta(seconds=row[3]))
-                    else:  # Combine (or) same word with different casing
-                        word_metadata |= WordMetadata(word, row[1], datetime.fromtimestamp(row[2]),
-                                                      timedelta(seconds=row[3]))
-                return word_metadata
-            case CaseSensitivity.FIRST_CHAR:
-                word_u = word[0].upper() + word[1:]
-                word_l = word[0].lower() + word[1:]
-                res_u = self._fetchone(f"{SQL_SELECT_STAR_FROM_FREQLOG} WHERE word=?", (word_u,))
-                res_l = self._fetchone(f"{SQL_SELECT_STAR_FROM_FREQLOG} WHERE word=?", (word_l,))
-                word_meta_u = WordMetadata(word, res_u[1], datetime.fromtimestamp(res_u[2]),
-                                           timedelta(seconds=res_u[3])) if res_u else None
-                word_meta_l = WordMetadata(word, res_l[1], datetime.fromtimestamp(res_l[2]),
-                                           timedelta(seconds=res_l[3])) if res_l else None
-                if not word_meta_u:  # First operand in or must not be None
-                    return word_meta_l
-                return word_meta_u | word_meta_l
+            case CaseSensitivity.INSENSITIVE | CaseSensitivity.FIRST_CHAR:
+                table, key, _ = SQL_WORD_AGGREGATES[case]
+                res = self._read_one(f"SELECT frequency, lastused, avgspeed FROM {table} "
+                                     f"WHERE word = {key.format(word=':word')}", {"word": word})
+                if case == CaseSensitivity.INSENSITIVE:
+                    word = word.lower()
+                return WordMetadata(word, res[0], datetime.fromtimestamp(res[1]),
+                                    timedelta(seconds=res[2])) if res else None
             case CaseSensitivity.SENSITIVE:
-                res = self._fetchone(f"{SQL_SELECT_STAR_FROM_FREQLOG} WHERE word=?", (word,))
+                res = self._read_one(f"{SQL_SELECT_STAR_FROM_FREQLOG} WHERE word=?", (word,))
                 return WordMetadata(word, res[1], datetime.fromtimestamp(res[2]),
                                     timedelta(seconds=res[3])) if res else None
 
@@ -329,7 +743,8 @@ class SQLiteBackend(Backend):
         Get metadata for a chord
         :returns: ChordMetadata if chord is found, None otherwise
         """
-        res = self._fetchone(f"{SQL_SELECT_STAR_FROM_CHORDLOG} WHERE chord=?", (chord,))
+        self.flush()
+        res = self._read_one(f"{SQL_SELECT_STAR_FROM_CHORDLOG} WHERE chord=?", (chord,))
         return ChordMetadata(res[0], res[1], datetime.fromtimestamp(res[2])) if res else None
 
     def get_banlist_entry(self, word: str) -> BanlistEntry | None:
@@ -338,8 +753,13 @@ class SQLiteBackend(Backend):
         :param word: Word to get entry for
         :return: BanlistEntry if word is banned for the specified case, None otherwise
         """
-        word = word.lower()
-        return next((entry for entry in self.banlist if entry.word == word), None)
+        word_hash = self._hash_word(word)
+        if word_hash not in self._banned:
+            return None
+        if self._banlist is not None:
+            return self._banlist[word_hash]
+        res = self._read_one("SELECT dateadded FROM banlist WHERE hash = ?", (word_hash,))
+        return BanlistEntry(word.lower(), datetime.fromtimestamp(res[0]))  # Banned words are stored lowercase
 
     def log_word(self, word: str, start_time: datetime, end_time: datetime) -> bool:
         """
@@ -351,15 +771,11 @@ class SQLiteBackend(Backend):
         """
         if self.check_banned(word):
             return False  # banned
-        metadata = self.get_word_metadata(word, CaseSensitivity.SENSITIVE)
-        if metadata:  # Use or operator to combine metadata with existing entry
-            metadata |= WordMetadata(word, 1, end_time, end_time - start_time)
-            self._execute("UPDATE freqlog SET frequency=?, lastused=?, avgspeed=? WHERE word=?",
-                          (metadata.frequency, metadata.last_used.timestamp(), metadata.average_speed.total_seconds(),
-                           word))
-        else:  # New entry
-            self._execute("INSERT INTO freqlog VALUES (?, ?, ?, ?)",
-                          (word, 1, end_time.timestamp(), (end_time - start_time).total_seconds()))
+        self._log_history("freqlog", word, end_time)
+        if self.write_behind:
+            self._buffer_word(WordMetadata(word, 1, end_time, end_time - start_time))
+            return True
+        self._execute(SQL_UPSERT_WORD, (word, 1, end_time.timestamp(), (end_time - start_time).total_seconds()))
         return True
 
     def _insert_word(self, word: str, frequency: int, last_used: datetime, average_speed: timedelta) -> None:
@@ -380,72 +796,189 @@ class SQLiteBackend(Backend):
         """
         if self.check_banned(chord):
             return False  # banned
-        metadata = self.get_chord_metadata(chord)
-        if metadata:  # Use or operator to combine metadata with existing entry
-            metadata |= ChordMetadata(chord, 1, end_time)
-            self._execute("UPDATE chordlog SET frequency=?, lastused=? WHERE chord=?",
-                          (metadata.frequency, metadata.last_used.timestamp(), chord))
-        else:  # New entry
-            self._execute("INSERT INTO chordlog VALUES (?, ?, ?)", (chord, 1, end_time.timestamp()))
+        self._log_history("chordlog", chord, end_time)
+        if self.write_behind:
+            self._buffer_chord(ChordMetadata(chord, 1, end_time))
+            return True
+        self._execute(SQL_UPSERT_CHORD, (chord, 1, end_time.timestamp()))
         return True
 
+    def _log_history(self, table: str, entry: str, time: datetime) -> None:
+        """
+        Count a use of an entry in its day of the usage history (buffered, or committed with the entry itself)
+        Rolls up old history first if this is the first entry logged on a new day
+        """
+        day = self._history_bucket(time, HistoryPeriod.DAY)
+        if self._history_day is None or day > self._history_day:
+            self._history_day = day
+            self.rollup_history(time)
+        if self.write_behind:
+            key = (table, entry, day.timestamp())
+            self._pending_history[key] = self._pending_history.get(key, 0) + 1
+        else:
+            self.cursor.execute(SQL_UPSERT_HISTORY[table], (HistoryPeriod.DAY.value, day.timestamp(), entry, 1))
+
+    @property
+    def commits_saved(self) -> int:
+        """Number of commits avoided by the write-behind buffer so far"""
+        return self._num_buffered - self._num_flushes
+
+    def _buffer_word(self, metadata: WordMetadata) -> None:
+        """Fold a word entry into the write-behind buffer, flushing if a threshold is hit"""
+        pending = self._pending_words.get(metadata.word)
+        self._pending_words[metadata.word] = metadata if pending is None else pending | metadata
+        self._num_buffered += 1
+        self._flush_if_due()
+
+    def _buffer_chord(self, metadata: ChordMetadata) -> None:
+        """Fold a chord entry into the write-behind buffer, flushing if a threshold is hit"""
+        pending = self._pending_chords.get(metadata.chord)
+        self._pending_chords[metadata.chord] = metadata if pending is None else pending | metadata
+        self._num_buffered += 1
+        self._flush_if_due()
+
+    def _flush_if_due(self) -> None:
+        """Flush the write-behind buffer if it is over its size or time threshold"""
+        if (len(self._pending_words) + len(self._pending_chords) >= self.write_buffer_size or
+                time.monotonic() - self._last_flush >= self.write_buffer_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all buffered word and chord entries to the database in a single transaction"""
+        self._last_flush = time.monotonic()
+        if not self._pending_words and not self._pending_chords and not self._pending_history:
+            return
+        words, chords, history = self._pending_words, self._pending_chords, self._pending_history
+        self._pending_words, self._pending_chords, self._pending_history = {}, {}, {}
+        try:
+            self.cursor.executemany(SQL_UPSERT_WORD, ((word, m.frequency, m.last_used.timestamp(),
+                                                       m.average_speed.total_seconds()) for word, m in words.items()))
+            self.cursor.executemany(SQL_UPSERT_CHORD, ((chord, m.frequency, m.last_used.timestamp())
+                                                       for chord, m in chords.items()))
+            for table in SQL_HISTORY_TABLES:
+                self.cursor.executemany(SQL_UPSERT_HISTORY[table], ((HistoryPeriod.DAY.value, day, entry, frequency)
+                                                                    for (t, entry, day), frequency in history.items()
+                                                                    if t == table))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            logging.error(f"Failed to flush {len(words)} words and {len(chords)} chords from write-behind buffer")
+            raise
+        self._num_flushes += 1
+        logging.debug(f"Flushed {len(words)} words and {len(chords)} chords, {self.commits_saved} commits saved")
+
     def check_banned(self, word: str) -> bool:
         """
         Check if a word is banned
         :returns: True if word is banned, False otherwise
         """
-        return self.get_banlist_entry(word) is not None
+        return self._hash_word(word) in self._banned
 
     def ban_word(self, word: str, time: datetime) -> bool:
         """
         Delete a word/chord entry and add it to the ban list
         :returns: True if word was banned, False if it was already banned
         """
-        if self.check_banned(word):
-            return False  # already banned
-
-        # Freqlog
-        word = word.lower()
-        self._execute("DELETE FROM freqlog WHERE word = ? COLLATE NOCASE", (word,))
-
-        # Chordlog
-        self._execute("DELETE FROM chordlog WHERE chord=?", (word,))
+        return self.ban_words([word], time)[0]
 
-        # Ban
-        self.banlist.append(BanlistEntry(word, time))
-        self._execute("INSERT OR IGNORE INTO banlist VALUES (?, ?)", (self.encrypt(word), time.timestamp()))
-        return True
+    def ban_words(self, words: list[str], time: datetime) -> list[bool]:
+        """
+        Delete word/chord entries and add them to the ban list, in one transaction
+        :returns: For each word, True if it was banned, False if it was already banned (or earlier in words)
+        """
+        self.flush()
+        res, banned = [], {}
+        for word in words:
+            word_hash = self._hash_word(word)
+            res.append(word_hash not in self._banned and word_hash not in banned)
+            if res[-1]:
+                banned[word_hash] = word.lower()
+        if not banned:
+            return res
+        try:
+            # Freqlog and chordlog
+            self.cursor.executemany("DELETE FROM freqlog WHERE word = ? COLLATE NOCASE",
+                                    ((word,) for word in banned.values()))
+            self.cursor.executemany("DELETE FROM chordlog WHERE chord = ?", ((word,) for word in banned.values()))
+
+            # Ban
+            self.cursor.executemany("INSERT OR IGNORE INTO banlist (word, dateadded, hash) VALUES (?, ?, ?)",
+                                    ((self.encrypt(word), time.timestamp(), word_hash)
+                                     for word_hash, word in banned.items()))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        self._banned.update(banned)
+        if self._banlist is not None:
+            self._banlist.update((word_hash, BanlistEntry(word, time)) for word_hash, word in banned.items())
+        return res
 
     def delete_word(self, word: str, case: CaseSensitivity) -> bool:
         """
         Delete a word/chord entry
         :returns: True if word was deleted, False if it's not in the database
         """
-        if not self.get_word_metadata(word, case):
-            return False
-        match case:
-            case CaseSensitivity.INSENSITIVE:
-                word = word.lower()
-                self._execute("DELETE FROM freqlog WHERE word = ? COLLATE NOCASE", (word,))
-            case CaseSensitivity.FIRST_CHAR:
-                word_u = word[0].upper() + word[1:]
-                word_l = word[0].lower() + word[1:]
-                self._execute("DELETE FROM freqlog WHERE word=?", (word_u,))
-                self._execute("DELETE FROM freqlog WHERE word=?", (word_l,))
-            case CaseSensitivity.SENSITIVE:
-                self._execute("DELETE FROM freqlog WHERE word=?", (word,))
-        return True
+        return self.delete_words({word: case})[0]
+
+    def delete_words(self, words: dict[str, CaseSensitivity]) -> list[bool]:
+        """
+        Delete word/chord entries, in one transaction
+        :param words: Words to delete and the case sensitivity to delete each with
+        :returns: For each word, True if it was deleted, False if it's not in the database
+        """
+        self.flush()
+        res = []
+        try:
+            # One statement per word, for its number of deleted rows (cheap in a single transaction)
+            for word, case in words.items():
+                match case:
+                    case CaseSensitivity.INSENSITIVE:
+                        deleted = self.cursor.execute("DELETE FROM freqlog WHERE word = ? COLLATE NOCASE",
+                                                      (word.lower(),)).rowcount
+                    case CaseSensitivity.FIRST_CHAR:
+                        deleted = self.cursor.execute("DELETE FROM freqlog WHERE word IN (?, ?)",
+                                                      (word[0].upper() + word[1:], word[0].lower() + word[1:])).rowcount
+                    case CaseSensitivity.SENSITIVE:
+                        deleted = self.cursor.execute("DELETE FROM freqlog WHERE word = ?", (word,)).rowcount
+                res.append(deleted > 0)
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        return res
 
     def unban_word(self, word: str) -> bool:
         """
         Remove a word from the ban list
         :returns: True if word was unbanned, False if it was already not banned
         """
-        if not self.check_banned(word):
-            return False  # not banned
-        self._execute("DELETE FROM banlist WHERE dateadded=?", (self.get_banlist_entry(word).date_added.timestamp(),))
-        self.banlist.remove(self.get_banlist_entry(word))
-        return True
+        return self.unban_words([word])[0]
+
+    def unban_words(self, words: list[str]) -> list[bool]:
+        """
+        Remove words from the ban list, in one transaction
+        :returns: For each word, True if it was unbanned, False if it was already not banned (or earlier in words)
+        """
+        res, unbanned = [], set()
+        for word in words:
+            word_hash = self._hash_word(word)
+            res.append(word_hash in self._banned and word_hash not in unbanned)
+            if res[-1]:
+                unbanned.add(word_hash)
+        if not unbanned:
+            return res
+        try:
+            self.cursor.executemany("DELETE FROM banlist WHERE hash = ?", ((word_hash,) for word_hash in unbanned))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        self._banned -= unbanned
+        if self._banlist is not None:
+            for word_hash in unbanned:
+                del self._banlist[word_hash]
+        return res
 
     def num_words(self, case: CaseSensitivity = CaseSensitivity.INSENSITIVE) -> int:
         """
@@ -453,13 +986,57 @@ class SQLiteBackend(Backend):
         :param case: Case sensitivity
         :return: Number of words in db
         """
+        self.flush()
         match case:
             case CaseSensitivity.SENSITIVE:
-                return self._fetchone("SELECT COUNT(*) FROM freqlog")[0]
-            case CaseSensitivity.INSENSITIVE:
-                return len({row[0].lower() for row in self._fetchall("SELECT word FROM freqlog")})
-            case CaseSensitivity.FIRST_CHAR:
-                return len({row[0][0].lower() + row[0][1:] for row in self._fetchall("SELECT word FROM freqlog")})
+                return self._read_one("SELECT COUNT(*) FROM freqlog")[0]
+            case CaseSensitivity.INSENSITIVE | CaseSensitivity.FIRST_CHAR:
+                return self._read_one(f"SELECT COUNT(*) FROM {SQL_WORD_AGGREGATES[case][0]}")[0]
+
+    def _fetch_sorted(self, columns: str, table: str, primary_key: str, sort_by: str, reverse: bool,
+                      search: tuple[str, tuple], limit: int, after: tuple | None = None) -> list[tuple]:
+        """
+        Fetch rows sorted by an indexed column, breaking ties by primary key (from the same index)
+        WARNING: Directly loaded into SQL query, do not use unsanitized user input (except for search parameters)
+        :param columns: Columns to fetch
+        :param table: Table to fetch from
+        :param primary_key: Primary key column of the table
+        :param sort_by: Column to sort by
+        :param reverse: Reverse sort order
+        :param search: Condition and parameters from _sql_search()
+        :param limit: Maximum number of rows to fetch
+        :param after: Sort key of the row to fetch rows after, None to fetch from the start
+        :returns: Rows, each followed by its sort key (sort column and primary key, or primary key if sorting by it)
+        :raises ValueError: If after isn't a sort key of the table for this sort order
+        """
+        sort_key = [primary_key] if sort_by == primary_key else [sort_by, primary_key]
+        order, comparison = ("DESC", "<") if reverse else ("ASC", ">")
+        conditions, params = ([search[0]], search[1]) if search[0] else ([], ())
+        if after is not None:
+            if len(after) != len(sort_key):
+                raise ValueError(f"Invalid sort key for sorting {table} by {sort_by}: {after}")
+            conditions.append(f"({', '.join(sort_key)}) {comparison} ({', '.join('?' * len(sort_key))})")
+            params += tuple(after)
+        return self._read_all(f"SELECT {columns}, {', '.join(sort_key)} FROM {table}"
+                              f"{' WHERE ' + ' AND '.join(conditions) if conditions else ''} "
+                              f"ORDER BY {', '.join(f'{column} {order}' for column in sort_key)}"
+                              f"{f' LIMIT {limit}' if limit > 0 else ''}", params)
+
+    def _fetch_words(self, limit: int, sort_by: WordMetadataAttr, reverse: bool, case: CaseSensitivity, search: str,
+                     after: tuple | None = None) -> list[tuple[WordMetadata, tuple]]:
+        """Fetch sorted words and their sort keys (see _fetch_sorted())"""
+        if case == CaseSensitivity.SENSITIVE:
+            table = "freqlog"
+            sql_search = self._sql_search("freqlog", search, limit=limit)
+        else:
+            table, key, _ = SQL_WORD_AGGREGATES[case]
+            sql_search = self._sql_search("freqlog", search, key, limit)
+
+        # Every sort_by is an indexed column
+        res = self._fetch_sorted("word, frequency, lastused, avgspeed", table, "word", sort_by.value, reverse,
+                                 sql_search, limit, after)
+        return [(WordMetadata(row[0], row[1], datetime.fromtimestamp(row[2]), timedelta(seconds=row[3])), row[4:])
+                for row in res]
 
     def list_words(self, limit: int = -1, sort_by: WordMetadataAttr = WordMetadataAttr.score, reverse: bool = True,
                    case: CaseSensitivity = CaseSensitivity.INSENSITIVE, search: str = "") -> list[WordMetadata]:
@@ -471,44 +1048,38 @@ class SQLiteBackend(Backend):
         :param case: Case sensitivity
         :param search: Part of word to search for
         """
-        sql_search = f" WHERE word LIKE '%{search}%'" if search else ""
-        if case == CaseSensitivity.SENSITIVE:
-            # WARNING: Directly loaded into SQL query, do not use unsanitized user input
-            sql_sort_limit: str = sort_by.value
-            if reverse:
-                sql_sort_limit += " DESC"
-            if limit > 0:
-                sql_sort_limit += f" LIMIT {limit}"
-            if sort_by == WordMetadataAttr.score:  # Score is not a column in the database
-                res = self._fetchall(
-                    f"{SQL_SELECT_STAR_FROM_FREQLOG}{sql_search}")
-                ret = sorted([WordMetadata(row[0], row[1], datetime.fromtimestamp(row[2]), timedelta(seconds=row[3]))
-                              for row in res], key=lambda x: x.score, reverse=reverse)
-                return ret[:limit] if limit > 0 else ret
-
-            # Valid sort_by column
-            res = self._fetchall(f"{SQL_SELECT_STAR_FROM_FREQLOG}{sql_search}{f' LIMIT {limit}' if limit > 0 else ''}"
-                                 f" ORDER BY {sql_sort_limit}")
-            return [WordMetadata(row[0], row[1], datetime.fromtimestamp(row[2]), timedelta(seconds=row[3]))
-                    for row in res]
-
-        # Case INSENSITIVE or FIRST_CHAR
-        res = self._fetchall(SQL_SELECT_STAR_FROM_FREQLOG + sql_search)
-        d: dict[WordMetadata] = {}
-        for row in res:
-            word = row[0]
-            word = word[0].lower() + word[1:] if case == CaseSensitivity.FIRST_CHAR else word.lower()  # un-case
-            word_metadata = WordMetadata(word, row[1], datetime.fromtimestamp(row[2]), timedelta(seconds=row[3]))
-            try:  # Combine (or) same word with different casing
-                d[word] |= word_metadata
-            except KeyError:  # New word
-                d[word] = word_metadata
-        ret = sorted(list(d.values()), key=lambda x: getattr(x, sort_by.name), reverse=reverse)
-        return ret[:limit] if limit > 0 else ret
+        self.flush()
+        return [word for word, _ in self._fetch_words(limit, sort_by, reverse, case, search)]
+
+    def iter_words(self, sort_by: WordMetadataAttr = WordMetadataAttr.score, reverse: bool = True,
+                   case: CaseSensitivity = CaseSensitivity.INSENSITIVE, search: str = "",
+                   page_size: int = Defaults.DEFAULT_PAGE_SIZE, cursor: str | None = None) -> KeysetIterator:
+        """
+        Iterate over words in the db, fetching them a page at a time
+        :param sort_by: Attribute to sort by: word, frequency, last_used, average_speed, score
+        :param reverse: Reverse sort order
+        :param case: Case sensitivity
+        :param search: Part of word to search for
+        :param page_size: Number of words to fetch at a time
+        :param cursor: Cursor of an iterator with the same sort_by, reverse and case to resume after
+        :returns: Iterator of WordMetadata, with the cursor of the last word returned
+        :raises ValueError: If the cursor is invalid
+        """
+        self.flush()
+        return KeysetIterator(lambda after, n: self._fetch_words(n, sort_by, reverse, case, search, after),
+                              page_size, cursor)
 
     def num_chords(self):
         """Get number of chords in db"""
-        return self._fetchone("SELECT COUNT(*) FROM chordlog")[0]
+        self.flush()
+        return self._read_one("SELECT COUNT(*) FROM chordlog")[0]
+
+    def _fetch_chords(self, limit: int, sort_by: ChordMetadataAttr, reverse: bool, search: str,
+                      after: tuple | None = None) -> list[tuple[ChordMetadata, tuple]]:
+        """Fetch sorted chords and their sort keys (see _fetch_sorted())"""
+        res = self._fetch_sorted("chord, frequency, lastused", "chordlog", "chord", sort_by.value, reverse,
+                                 self._sql_search("chordlog", search, limit=limit), limit, after)
+        return [(ChordMetadata(row[0], row[1], datetime.fromtimestamp(row[2])), row[3:]) for row in res]
 
     def list_chords(self, limit: int = -1, sort_by: ChordMetadataAttr = ChordMetadataAttr.score, reverse: bool = True,
                     search: str = "") -> list[ChordMetadata]:
@@ -519,33 +1090,201 @@ class SQLiteBackend(Backend):
         :param reverse: Reverse sort order
         :param search: Part of chord to search for
         """
-        sql_search = f" WHERE chord LIKE '%{search}%'" if search else ""
-        sql_sort_limit = sort_by.value
-        if reverse:
-            sql_sort_limit += " DESC"
-        if limit > 0:
-            sql_sort_limit += f" LIMIT {limit}"
-        if sort_by == ChordMetadataAttr.score:  # Score is not a column in the database
-            res = self._fetchall(
-                f"{SQL_SELECT_STAR_FROM_CHORDLOG}{sql_search}")
-            ret = sorted([ChordMetadata(row[0], row[1], datetime.fromtimestamp(row[2])) for row in res],
-                         key=lambda x: x.score, reverse=reverse)
-            return ret[:limit] if limit > 0 else ret
-
-        # Valid sort_by column
-        res = self._fetchall(f"{SQL_SELECT_STAR_FROM_CHORDLOG}{sql_search}{f' LIMIT {limit}' if limit > 0 else ''}"
-                             f" ORDER BY {sql_sort_limit}")
-        return [ChordMetadata(row[0], row[1], datetime.fromtimestamp(row[2])) for row in res]
+        self.flush()
+        return [chord for chord, _ in self._fetch_chords(limit, sort_by, reverse, search)]
+
+    def iter_chords(self, sort_by: ChordMetadataAttr = ChordMetadataAttr.score, reverse: bool = True,
+                    search: str = "", page_size: int = Defaults.DEFAULT_PAGE_SIZE,
+                    cursor: str | None = None) -> KeysetIterator:
+        """
+        Iterate over chords in the db, fetching them a page at a time
+        :param sort_by: Attribute to sort by: chord, frequency, last_used, score
+        :param reverse: Reverse sort order
+        :param search: Part of chord to search for
+        :param page_size: Number of chords to fetch at a time
+        :param cursor: Cursor of an iterator with the same sort_by and reverse to resume after
+        :returns: Iterator of ChordMetadata, with the cursor of the last chord returned
+        :raises ValueError: If the cursor is invalid
+        """
+        self.flush()
+        return KeysetIterator(lambda after, n: self._fetch_chords(n, sort_by, reverse, search, after),
+                              page_size, cursor)
+
+    def rollup_history(self, now: datetime | None = None) -> None:
+        """
+        Roll up usage history days older than DEFAULT_HISTORY_DAYS into weeks, and weeks older than
+        DEFAULT_HISTORY_WEEKS into months, so the history grows by a bucket per month per entry at most
+        Weeks are rolled up into the month they start in
+        :param now: Time to count the age of buckets from (default: now)
+        """
+        self.flush()
+        now = now if now else datetime.now()
+        rollups = ((HistoryPeriod.DAY, HistoryPeriod.WEEK,
+                    self._history_bucket(now, HistoryPeriod.DAY) - timedelta(days=Defaults.DEFAULT_HISTORY_DAYS)),
+                   (HistoryPeriod.WEEK, HistoryPeriod.MONTH,
+                    self._history_bucket(now, HistoryPeriod.WEEK) - timedelta(weeks=Defaults.DEFAULT_HISTORY_WEEKS)))
+        num_rolled_up = 0
+        try:
+            for table, column in SQL_HISTORY_TABLES.items():
+                for period, into, cutoff in rollups:
+                    starts = self._fetchall(f"SELECT DISTINCT start FROM {table}_history "
+                                            "WHERE period = ? AND start < ?", (period.value, cutoff.timestamp()))
+                    for start, in starts:
+                        into_start = self._history_bucket(datetime.fromtimestamp(start), into).timestamp()
+                        self.cursor.execute(f"INSERT INTO {table}_history (period, start, {column}, frequency) "
+                                            f"SELECT ?, ?, {column}, frequency FROM {table}_history "
+                                            f"WHERE period = ? AND start = ? ON CONFLICT(period, start, {column}) "
+                                            "DO UPDATE SET frequency = frequency + excluded.frequency",
+                                            (into.value, into_start, period.value, start))
+                    self.cursor.execute(f"DELETE FROM {table}_history WHERE period = ? AND start < ?",
+                                        (period.value, cutoff.timestamp()))
+                    num_rolled_up += len(starts)
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            logging.error("Failed to roll up usage history")
+            raise
+        if num_rolled_up:
+            logging.info(f"Rolled up {num_rolled_up} usage history buckets")
+
+    def _list_usage(self, table: str, key: str, start: datetime, end: datetime, limit: int) -> list[tuple[str, int]]:
+        """
+        List entries by how many times they were used in the usage history buckets starting between two times
+        WARNING: Directly loaded into SQL query, do not use unsanitized user input
+        :param table: Table whose usage history to list
+        :param key: Expression to group the history by
+        """
+        self.flush()
+        periods = ", ".join(str(period.value) for period in HistoryPeriod)
+        return self._read_all(f"SELECT {key}, sum(frequency) AS total FROM {table}_history "
+                              f"WHERE period IN ({periods}) AND start >= ? AND start < ? GROUP BY 1 "
+                              f"ORDER BY total DESC, 1 ASC{f' LIMIT {limit}' if limit > 0 else ''}",
+                              (start.timestamp(), end.timestamp()))
+
+    def list_word_usage(self, start: datetime, end: datetime, limit: int = -1,
+                        case: CaseSensitivity = CaseSensitivity.INSENSITIVE) -> list[tuple[str, int]]:
+        """
+        List words by how many times they were used between two times
+        Uses are counted by day, week or month (depending on their age), from the buckets starting in the range
+        :param start: Start of the range (inclusive)
+        :param end: End of the range (exclusive)
+        :param limit: Maximum number of words to return
+        :param case: Case sensitivity
+        :returns: (word, number of uses) pairs, most used first
+        """
+        key = "word" if case == CaseSensitivity.SENSITIVE else SQL_WORD_AGGREGATES[case][1].format(word="word")
+        return self._list_usage("freqlog", key, start, end, limit)
+
+    def list_chord_usage(self, start: datetime, end: datetime, limit: int = -1) -> list[tuple[str, int]]:
+        """
+        List chords by how many times they were used between two times
+        Uses are counted by day, week or month (depending on their age), from the buckets starting in the range
+        :param start: Start of the range (inclusive)
+        :param end: End of the range (exclusive)
+        :param limit: Maximum number of chords to return
+        :returns: (chord, number of uses) pairs, most used first
+        """
+        return self._list_usage("chordlog", "chord", start, end, limit)
+
+    def _get_history(self, table: str, entry: str, condition: str, start: datetime | None,
+                     end: datetime | None) -> list[HistoryEntry]:
+        """
+        Get the usage history buckets of an entry, oldest first
+        WARNING: Directly loaded into SQL query, do not use unsanitized user input
+        :param table: Table whose usage history to get
+        :param entry: Entry to return the history as
+        :param condition: Condition matching the entry's rows (using the :entry parameter)
+        """
+        self.flush()
+        params: dict[str, str | float] = {"entry": entry}
+        if start:
+            condition += " AND start >= :start"
+            params["start"] = start.timestamp()
+        if end:
+            condition += " AND start < :end"
+            params["end"] = end.timestamp()
+        res = self._read_all(f"SELECT period, start, sum(frequency) FROM {table}_history WHERE {condition} "
+                             "GROUP BY period, start ORDER BY start, period", params)
+        return [HistoryEntry(entry, datetime.fromtimestamp(row[1]), HistoryPeriod(row[0]), row[2]) for row in res]
+
+    def get_word_history(self, word: str, case: CaseSensitivity, start: datetime | None = None,
+                         end: datetime | None = None) -> list[HistoryEntry]:
+        """
+        Get the usage history of a word
+        :param word: Word to get the history of
+        :param case: Case sensitivity
+        :param start: Only get buckets starting at or after this time
+        :param end: Only get buckets starting before this time
+        :returns: Day, week and month buckets the word was used in, oldest first
+        """
+        key = "{word}" if case == CaseSensitivity.SENSITIVE else SQL_WORD_AGGREGATES[case][1]
+        if case == CaseSensitivity.INSENSITIVE:
+            word = word.lower()
+        return self._get_history("freqlog", word, f"word = :entry COLLATE NOCASE AND "
+                                                  f"{key.format(word='word')} = {key.format(word=':entry')}",
+                                 start, end)
+
+    def get_chord_history(self, chord: str, start: datetime | None = None,
+                          end: datetime | None = None) -> list[HistoryEntry]:
+        """
+        Get the usage history of a chord
+        :param chord: Chord to get the history of
+        :param start: Only get buckets starting at or after this time
+        :param end: Only get buckets starting before this time
+        :returns: Day, week and month buckets the chord was used in, oldest first
+        """
+        return self._get_history("chordlog", chord, "chord = :entry COLLATE NOCASE AND chord = :entry", start, end)
 
     def delete_chord(self, chord: str) -> bool:
         """
         Delete a chord entry
         :returns: True if chord was deleted, False if it's not in the database
         """
-        if not self.get_chord_metadata(chord):
-            return False
-        self._execute("DELETE FROM chordlog WHERE chord=?", (chord,))
-        return True
+        return self.delete_chords([chord])[0]
+
+    def delete_chords(self, chords: list[str]) -> list[bool]:
+        """
+        Delete chord entries, in one transaction
+        :returns: For each chord, True if it was deleted, False if it's not in the database
+        """
+        self.flush()
+        try:
+            res = [self.cursor.execute("DELETE FROM chordlog WHERE chord = ?", (chord,)).rowcount > 0
+                   for chord in chords]
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        return res
+
+    def get_chordmap(self, device: str, chord_count: int) -> list[str] | None:
+        """
+        Get the cached chordmap of a device
+        :param device: Device identity
+        :param chord_count: Number of chords currently on the device
+        :returns: Chord outputs, None if the device's chordmap isn't cached or its chord count changed
+        """
+        res = self._fetchone("SELECT chordcount FROM devices WHERE device=?", (device,))
+        if not res or res[0] != chord_count:
+            return None
+        return [row[0] for row in self._fetchall("SELECT output FROM chordmap WHERE device=?", (device,))]
+
+    def set_chordmap(self, device: str, chord_count: int, outputs: list[str]) -> None:
+        """
+        Replace the cached chordmap of a device
+        :param device: Device identity
+        :param chord_count: Number of chords on the device when its chordmap was fetched
+        :param outputs: Chord outputs
+        """
+        try:
+            self.cursor.execute("DELETE FROM chordmap WHERE device=?", (device,))
+            self.cursor.executemany("INSERT INTO chordmap VALUES (?, ?)", ((device, output) for output in outputs))
+            self.cursor.execute("INSERT OR REPLACE INTO devices VALUES (?, ?, ?)",
+                                (device, chord_count, datetime.now().timestamp()))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
 
     def list_banned_words(self, limit: int, sort_by: BanlistAttr,
                           reverse: bool) -> list[BanlistEntry]:
@@ -556,101 +1295,245 @@ class SQLiteBackend(Backend):
         :param reverse: Reverse sort order
         :returns: List of banned words
         """
-        res = sorted(self.banlist, key=lambda x: getattr(x, sort_by.name), reverse=reverse)
+        res = sorted(self.banlist.values(), key=lambda x: getattr(x, sort_by.name), reverse=reverse)
         return res[:limit] if limit > 0 else res
 
-    def merge_backend(self, src_db_path: str, dst_db_path: str, ban_date: Age,
-                      src_db_passwd_callback: callable, dst_db_passwd_callback: callable) -> None:
+    def merge_backend(self, src_db_paths: list[str], dst_db_path: str, ban_date: Age,
+                      src_db_passwd_callbacks: list[callable], dst_db_passwd_callback: callable,
+                      chunk_size: int = Defaults.DEFAULT_MERGE_CHUNK_SIZE) -> None:
         """
-        Merge another database and this one into a new database
-        :param src_db_path: Path to the source database
+        Merge other databases and this one into a new database
+        Sources are attached to the destination and aggregated in SQL, only the encrypted banlists go through Python.
+        Each chunk of work is committed with a checkpoint, so an interrupted merge resumes when it is run again with
+        the same databases.
+        :param src_db_paths: Paths to the source databases
         :param dst_db_path: Path to the destination database
-        :param src_db_passwd_callback: Callback to call to get password to decrypt the source database banlist
-                Should take one argument: whether the password is being set for the first time
+        :param src_db_passwd_callbacks: Callbacks to call to get passwords to decrypt the source database banlists,
+                one per source database. Should take one argument: whether the password is being set for the first time
         :param dst_db_passwd_callback: Callback to call to get password to decrypt the destination database banlist
                 Should take one argument: whether the password is being set for the first time
         :param ban_date: Whether to use older or newer date banned for banlist entries of the same word (OLDER or NEWER)
-        :requires: src_db_path != dst_db_path != self.db_path
-        :requires: src_db_path must be a valid Freqlog database and readable
-        :requires: dst_db_path must not be an existing file but must be writable
+        :param chunk_size: Maximum number of entries per source merged per transaction
+        :requires: src_db_paths, dst_db_path and self.db_path must all be different
+        :requires: src_db_paths must be valid Freqlog databases and readable
+        :requires: dst_db_path must not be an existing file (unless it is an interrupted merge of the same databases)
+                but must be writable
+        :requires: At most SQLITE_LIMIT_ATTACHED - 1 source databases (usually 9), merge more in several passes
         :raises ValueError: If requirements are not met
         """
+        self.flush()
+
         # Assert requirements
-        if src_db_path == dst_db_path:
-            raise ValueError("src_db_path and dst_db_path must be different")
-        if src_db_path == self.db_path:
-            raise ValueError("src_db_path and self.db_path must be different")
-        if dst_db_path == self.db_path:
-            raise ValueError("dst_db_path and self.db_path must be different")
-        if os.path.isfile(dst_db_path):
-            raise ValueError("dst_db_path must not be an existing file")
-        try:  # Ensure that src is writable (WARNING: Must use 'a' instead of 'w' mode to avoid erasing file!!!)
-            with open(src_db_path, "a"):
-                pass
-        except OSError as e:
-            raise ValueError("src_db_path must be writable") from e
+        if len(src_db_paths) != len(src_db_passwd_callbacks):
+            raise ValueError("src_db_paths and src_db_passwd_callbacks must have the same length")
+        db_paths = [os.path.abspath(path) for path in (self.db_path, *src_db_paths)]
+        if len(set(db_paths)) != len(db_paths):
+            raise ValueError("src_db_paths and self.db_path must all be different")
+        if len(db_paths) > self.conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):
+            raise ValueError(f"Can merge at most {self.conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)} databases "
+                             "at once, including this one")
+        # An empty dst (left by an earlier failed merge) is started afresh
+        resume = os.path.isfile(dst_db_path) and os.path.getsize(dst_db_path) > 0
+        if resume:
+            checkpoint = self._read_checkpoint(dst_db_path, "merge")
+            if checkpoint is None or checkpoint["sources"] != db_paths or checkpoint["ban_date"] != ban_date.name:
+                raise ValueError("dst_db_path must not be an existing file, unless it is an interrupted merge of the "
+                                 "same databases")
+            logging.warning(f"Resuming interrupted merge into {dst_db_path} at {checkpoint['step']}")
+        for src_db_path in src_db_paths:
+            try:  # Ensure that src is writable (WARNING: Must use 'a' instead of 'w' mode to avoid erasing file!!!)
+                with open(src_db_path, "a"):
+                    pass
+            except OSError as e:
+                raise ValueError("src_db_path must be writable") from e
         try:
-            with open(dst_db_path, "w"):
+            with open(dst_db_path, "a" if resume else "w"):
                 pass
         except OSError as e:
             raise ValueError("dst_db_path must be writable") from e
 
-        # DB meta
-        src_db = SQLiteBackend(src_db_path, src_db_passwd_callback, self.upgrade_callback)
-        dst_db = SQLiteBackend(dst_db_path, dst_db_passwd_callback)
+        # DB meta (opening the sources upgrades them and checks their passwords)
+        src_dbs = []
+        dst_db = None
+        merged = False
+        try:
+            for src_db_path, src_db_passwd_callback in zip(src_db_paths, src_db_passwd_callbacks):
+                src_dbs.append(SQLiteBackend(src_db_path, src_db_passwd_callback, self.upgrade_callback,
+                                             progress_callback=self.progress_callback))
+            dst_db = SQLiteBackend(dst_db_path, dst_db_passwd_callback, progress_callback=self.progress_callback)
+            dst_db._merge(db_paths, [self, *src_dbs], ban_date, chunk_size)
+            merged = True
+        finally:  # Close databases
+            for db in src_dbs:
+                db.close()
+            if dst_db is not None:
+                dst_db.close()
+
+            # Don't leave behind a dst this merge created but didn't get to checkpoint, there is nothing to resume
+            if not merged and not resume and self._read_checkpoint(dst_db_path, "merge") is None:
+                for path in (dst_db_path, f"{dst_db_path}-wal", f"{dst_db_path}-shm"):
+                    if os.path.exists(path):
+                        os.remove(path)
 
-        # Merge databases
-        # TODO: optimize this/add progress bars (this takes a long time)
+    @staticmethod
+    def _read_checkpoint(db_path: str, operation: str) -> dict | None:
+        """
+        Get the checkpoint of an interrupted operation from a database without opening it as a backend
+        :returns: State of the operation, None if it isn't a Freqlog database or has no checkpoint for the operation
+        """
+        if not SQLiteBackend.is_db_populated(db_path):
+            return None
+        conn = sqlite3.connect(db_path)
         try:
-            # Merge banlist
-            logging.info("Merging banlist")
-            src_banned_words = src_db.list_banned_words(0, BanlistAttr.word, False)
-            banned_words = self.list_banned_words(0, BanlistAttr.word, False)
-
-            # Ban words from self banlist in dst db
-            for entry in banned_words:
-                dst_db.ban_word(entry.word, entry.date_added)
-
-            # Ban words from src banlist in dst db
-            for entry in src_banned_words:
-                dst_entry = dst_db.get_banlist_entry(entry.word)
-                if dst_entry and ((ban_date == Age.OLDER and entry.date_added < dst_entry.date_added) or
-                                  (ban_date == Age.NEWER and entry.date_added > dst_entry.date_added)):
-                    dst_db.unban_word(entry.word)
-                    dst_db.ban_word(entry.word, entry.date_added)
-                else:
-                    dst_db.ban_word(entry.word, entry.date_added)
-
-            # Merge freqlog
-            logging.info("Merging freqlog")
-            src_words = src_db.list_words(0, WordMetadataAttr.word, False, CaseSensitivity.SENSITIVE)
-            words = [word.word for word in self.list_words(0, WordMetadataAttr.word, False, CaseSensitivity.SENSITIVE)]
-            entries = self.list_words(0, WordMetadataAttr.word, False, CaseSensitivity.SENSITIVE)
-            for src_word in src_words:
-                if src_word.word in words:
-                    entries[words.index(src_word.word)] |= src_word
-                else:
-                    entries.append(src_word)
-            for word in entries:
-                dst_db._insert_word(word.word, word.frequency, word.last_used, word.average_speed)
-
-            # Merge chordlog
-            logging.info("Merging chordlog")
-            src_chords = src_db.list_chords(0, ChordMetadataAttr.chord, False, "")
-            chords = [chord.chord for chord in self.list_chords(0, ChordMetadataAttr.chord, False, "")]
-            entries = self.list_chords(0, ChordMetadataAttr.chord, False, "")
-            for src_chord in src_chords:
-                if src_chord.chord in chords:
-                    entries[chords.index(src_chord.chord)] |= src_chord
+            row = conn.execute("SELECT state FROM checkpoints WHERE operation = ?", (operation,)).fetchone()
+        except sqlite3.DatabaseError:  # Not a database, or from before checkpoints (v0.5.10)
+            row = None
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else None
+
+    def _set_checkpoint(self, operation: str, state: dict | None) -> None:
+        """
+        Save (or with None, clear) the checkpoint of an operation, in the current transaction
+        :param operation: Name of the operation
+        :param state: JSON serializable state to resume the operation from
+        """
+        if state is None:
+            self.cursor.execute("DELETE FROM checkpoints WHERE operation = ?", (operation,))
+        else:
+            self.cursor.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?)", (operation, json.dumps(state)))
+
+    def _merge(self, db_paths: list[str], dbs: list["SQLiteBackend"], ban_date: Age, chunk_size: int) -> None:
+        """
+        Merge databases into this new one (or finish merging them, if it has a checkpoint of the merge)
+        :param db_paths: Absolute paths to the databases to merge, attached while merging
+        :param dbs: Open backends of the databases to merge, to decrypt their banlists
+        :param ban_date: Whether to use older or newer date banned for banlist entries of the same word (OLDER or NEWER)
+        :param chunk_size: Maximum number of entries per source merged per transaction
+        """
+        sources = [f"src{i}" for i in range(len(db_paths))]
+        for source, path in zip(sources, db_paths):
+            self._execute(f"ATTACH DATABASE ? AS {source}", (path,))
+
+        # Steps of the merge: tables merged in SQL -> (column to merge them a chunk of at a time (None for all at
+        #   once), merged columns, statement inserting the merged rows of a chunk from the rows of all sources)
+        #   Freqlog and chordlog are merged with the same result as merging WordMetadata/ChordMetadata with |
+        #   (single-source entries are copied as is), buckets of the usage history add up (rolled up when logging)
+        tables = {
+            "freqlog": ("word", "word, frequency, lastused, avgspeed", lambda rows: (
+                "INSERT INTO freqlog (word, frequency, lastused, avgspeed) SELECT word, sum(frequency), max(lastused), "
+                "CASE count(*) WHEN 1 THEN max(avgspeed) ELSE sum(avgspeed * frequency) / sum(frequency) END "
+                f"FROM ({rows}) GROUP BY word")),
+            "chordlog": ("chord", "chord, frequency, lastused", lambda rows: (
+                "INSERT INTO chordlog (chord, frequency, lastused) SELECT chord, sum(frequency), max(lastused) "
+                f"FROM ({rows}) GROUP BY chord")),
+        }
+        for table, column in SQL_HISTORY_TABLES.items():
+            tables[f"{table}_history"] = (None, f"period, start, {column}, frequency", lambda rows, t=table, c=column: (
+                f"INSERT INTO {t}_history (period, start, {c}, frequency) SELECT period, start, {c}, sum(frequency) "
+                f"FROM ({rows}) GROUP BY period, start, {c}"))
+        steps = [*tables, "banlist", "index"]
+
+        try:
+            state = self._read_checkpoint(self.db_path, "merge")
+            if state is None:
+                # Bulk load without the per-row triggers of the aggregate and search tables, rebuilt at the end
+                state = {"sources": db_paths, "ban_date": ban_date.name, "step": steps[0], "after": None, "done": 0}
+                self.cursor.execute("BEGIN")
+                self._drop_derived_triggers(self.cursor)
+                self._set_checkpoint("merge", state)
+                self.conn.commit()
+
+            # Rows of the sources, to report progress in
+            total = self._fetchone("SELECT " + " + ".join(f"(SELECT count(*) FROM {source}.{table})"
+                                                          for source in sources for table in [*tables, "banlist"]))[0]
+            progress = Progress("Merging databases", total, self.progress_callback, state["done"])
+
+            for i in range(steps.index(state["step"]), len(steps)):
+                step = steps[i]
+                logging.info("Indexing merged database" if step == "index" else f"Merging {step}")
+                if step in tables:
+                    self._merge_chunks(sources, step, *tables[step], chunk_size, state, progress)
+                elif step == "banlist":
+                    # Merge banlist (encrypted with each source's key), then drop what any source banned from the logs
+                    banlist: dict[str, BanlistEntry] = {}
+                    for db in dbs:
+                        for entry in db.banlist.values():
+                            kept = banlist.get(entry.word)
+                            if kept is None or (ban_date == Age.OLDER and entry.date_added < kept.date_added) or \
+                                    (ban_date == Age.NEWER and entry.date_added > kept.date_added):
+                                banlist[entry.word] = entry
+                            progress.advance()
+                    self.cursor.executemany("INSERT INTO banlist (word, dateadded, hash) VALUES (?, ?, ?)",
+                                            ((self.encrypt(word), entry.date_added.timestamp(), self._hash_word(word))
+                                             for word, entry in banlist.items()))
+                    self.cursor.executemany("DELETE FROM freqlog WHERE word = ? COLLATE NOCASE",
+                                            ((word,) for word in banlist))
+                    self.cursor.executemany("DELETE FROM chordlog WHERE chord = ?", ((word,) for word in banlist))
                 else:
-                    entries.append(src_chord)
-            for chord in entries:
-                dst_db._insert_chord(chord.chord, chord.frequency, chord.last_used)
-        finally:  # Close databases
-            src_db.close()
-            dst_db.close()
+                    # Rebuild the aggregate and search tables from the merged freqlog and chordlog
+                    self.cursor.execute("BEGIN")
+                    self._init_word_aggregates(self.cursor)
+                    self._init_search_indexes(self.cursor)
+
+                # Commit the step with a checkpoint at the next one (or without a checkpoint once merged)
+                state.update(step=steps[i + 1] if i + 1 < len(steps) else None, after=None, done=progress.done)
+                self._set_checkpoint("merge", state if state["step"] else None)
+                self.conn.commit()
+            progress.finish()
+        except BaseException:  # Including KeyboardInterrupt, the merge resumes from the last checkpoint
+            self.conn.rollback()
+            raise
+        finally:
+            for source in sources:
+                self._execute(f"DETACH DATABASE {source}")
+        self._banned = {row[0] for row in self._fetchall("SELECT hash FROM banlist")}
+        self._banlist = None
+
+    def _merge_chunks(self, sources: list[str], table: str, key: str | None, columns: str, insert: callable,
+                      chunk_size: int, state: dict, progress: Progress) -> None:
+        """
+        Merge a table of the attached sources a chunk of keys at a time, committing each chunk with a checkpoint
+        The last chunk is left uncommitted, to be committed with the checkpoint of the next step
+        :param sources: Names of the attached source databases
+        :param table: Table to merge
+        :param key: Column to merge the table by chunks of, None to merge it all at once
+        :param columns: Columns of the table to merge
+        :param insert: Callback to get the statement inserting the merged rows of a chunk
+                Should take one argument: a query of the chunk's rows in all sources
+        :param chunk_size: Maximum number of rows per source per chunk
+        :param state: Checkpoint state of the merge, with the last merged key and number of rows merged
+        :param progress: Progress of the merge
+        """
+        while True:
+            params = {"after": state["after"], "end": None}
+            condition = f"{key} > :after" if key and params["after"] is not None else "1"
+
+            # A chunk ends where the first source to reach chunk_size rows does (or includes the rest of the rows)
+            if key:
+                ends = [row[0] for source in sources for row in self.cursor.execute(
+                    f"SELECT {key} FROM {source}.{table} WHERE {condition} ORDER BY {key} LIMIT 1 OFFSET :offset",
+                    {**params, "offset": chunk_size - 1})]
+                params["end"] = min(ends) if ends else None
+                if params["end"] is not None:
+                    condition += f" AND {key} <= :end"
+            rows = " UNION ALL ".join(f"SELECT {columns} FROM {source}.{table} WHERE {condition}" for source in sources)
+
+            num_rows = self.cursor.execute(f"SELECT count(*) FROM ({rows})", params).fetchone()[0]
+            self.cursor.execute(insert(rows), params)
+            progress.advance(num_rows)
+            state.update(after=params["end"], done=progress.done)
+            if params["end"] is None:  # Last chunk, committed with the next step
+                return
+            self._set_checkpoint("merge", state)
+            self.conn.commit()
 
     def close(self) -> None:
-        """Close the database connection"""
+        """Flush the write-behind buffer and close the database connection"""
+        self.flush()
+        if self.write_behind:
+            logging.info(f"Write-behind buffer saved {self.commits_saved} commits")
         self.cursor.close()
         self.conn.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
@@ -8,9 +8,9 @@ from typing import Literal
 import webbrowser
 
 from cryptography import fernet as cryptography
-from PySide6.QtCore import Qt, QTranslator, QLocale
+from PySide6.QtCore import Qt, QTranslator, QLocale, QObject, Signal
 from PySide6.QtWidgets import QApplication, QPushButton, QStatusBar, QTableWidget, QTableWidgetItem, QMainWindow, \
-    QDialog, QFileDialog, QMenu, QSystemTrayIcon, QMessageBox, QInputDialog, QLineEdit
+    QDialog, QFileDialog, QMenu, QSystemTrayIcon, QMessageBox, QInputDialog, QLineEdit, QProgressDialog
 from PySide6.QtGui import QIcon, QAction
 
 from nexus import __id__, __version__
@@ -20,7 +20,7 @@ from nexus.ui.MainWindow import Ui_MainWindow
 from nexus.style import Stylesheet, Colors
 
 from nexus.Freqlog.Definitions import CaseSensitivity, WordMetadataAttr, WordMetadataAttrLabel, WordMetadata, \
-    Defaults, ChordMetadataAttr, ChordMetadataAttrLabel, ChordMetadata
+    Defaults, ChordMetadataAttr, ChordMetadataAttrLabel, ChordMetadata, Progress
 from nexus.Version import Version
 
 if os.name == 'nt':  # Needed for taskbar icon on Windows
@@ -58,6 +58,11 @@ class Translator(QTranslator):
         return source
 
 
+class DeviceSignals(QObject):
+    """Signals from the device discovery thread, delivered on the GUI thread"""
+    discovered = Signal()
+
+
 class GUI(object):
     """nexus GUI"""
 
@@ -111,6 +116,8 @@ class GUI(object):
         # Signals
         self.start_stop_button.clicked.connect(self.start_stop)
         self.window.refreshButton.clicked.connect(self.refresh)
+        self.device_signals = DeviceSignals()
+        self.device_signals.discovered.connect(self.refresh)  # Update the chords on device in the status bar
 
         # Window close button
         self.window.closeEvent = lambda event: self.window.hide()  # FIXME: this is quitting instead of hiding
@@ -208,11 +215,27 @@ class GUI(object):
 
         self.freqlog: Freqlog | None = None  # for logging
         self.temp_freqlog: Freqlog | None = None  # for other operations
+        self.progress_dialog: QProgressDialog | None = None  # for long operations (upgrades, exports)
         self.password = None
         self.logging_thread: Thread | None = None
         self.start_stop_button_started = False
         self.args = args
 
+    def show_progress(self, progress: Progress) -> None:
+        """Show the progress of a long operation in a progress dialog, which hides once the operation is finished"""
+        if self.progress_dialog is None:
+            self.progress_dialog = QProgressDialog(self.window)
+            self.progress_dialog.setWindowTitle(self.tr("GUI", "Please wait"))
+            self.progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+            self.progress_dialog.setCancelButton(None)  # Operations run on the GUI thread, they can't be cancelled
+            self.progress_dialog.setMinimumDuration(500)
+        self.progress_dialog.setLabelText(str(progress))
+        self.progress_dialog.setMaximum(progress.total)  # Busy indicator if the total is unknown (0)
+        self.progress_dialog.setValue(progress.done)
+        if progress.finished:
+            self.progress_dialog.reset()
+        QApplication.processEvents()  # Repaint while the operation blocks the event loop
+
     def show_hide(self, reason):
         if reason == QSystemTrayIcon.ActivationReason.Trigger:
             if not self.window.isVisible():
@@ -680,7 +703,8 @@ class GUI(object):
         while True:
             try:
                 self.temp_freqlog = Freqlog(self.args.freqlog_db_path, self.prompt_for_password, loggable=False,
-                                            upgrade_callback=self.prompt_for_upgrade)  # for other operations
+                                            upgrade_callback=self.prompt_for_upgrade,
+                                            progress_callback=self.show_progress)  # for other operations
                 break
             except cryptography.InvalidToken:
                 QMessageBox.critical(self.window, self.tr("GUI", "Error"),
@@ -691,6 +715,9 @@ class GUI(object):
                                      self.tr("GUI", "Error opening database: {}").format(e))
                 raise
 
+        # Look for a device without blocking, and refresh once it's found
+        self.temp_freqlog.discover_device().add_done_callback(lambda _: self.device_signals.discovered.emit())
+
         # Refresh and enter event loop
         self.refresh()
         self.app.exec()
@@ -1,16 +1,18 @@
 import argparse
+import itertools
 import logging
 import os.path
 import signal
 import sys
 
+from datetime import datetime, timedelta
 from getpass import getpass
 import vinput
 
 from nexus import __doc__, __version__
 from nexus.Freqlog import Freqlog
-from nexus.Freqlog.Definitions import Age, BanlistAttr, CaseSensitivity, ChordMetadata, ChordMetadataAttr, Defaults, \
-    Order, WordMetadata, WordMetadataAttr
+from nexus.Freqlog.Definitions import Age, BanlistAttr, CaptureStream, CaseSensitivity, ChordMetadata, \
+    ChordMetadataAttr, Defaults, Order, OverflowPolicy, Progress, WordMetadata, WordMetadataAttr
 from nexus.GUI import GUI
 from nexus.Version import Version
 
@@ -27,7 +29,7 @@ def main():
         5: Requested word or chord not found
         6: Tried to ban already banned word or unban already unbanned word
         7: ValueError during merge db (likely requirements not met)
-        8: Upgrade cancelled
+        8: Upgrade or merge cancelled (an interrupted merge resumes when run again)
         9: Keyboard interrupt during startup banlist password input
         11: Python version < 3.11
         100: Feature not yet implemented
@@ -58,6 +60,20 @@ def main():
                             required=False)
     upgrade_arg = argparse.ArgumentParser(add_help=False)
     upgrade_arg.add_argument("--upgrade", action="store_true", help="Upgrade database if necessary")
+    segment_arg = argparse.ArgumentParser(add_help=False)
+    segment_arg.add_argument("--new-word-threshold", default=Defaults.DEFAULT_NEW_WORD_THRESHOLD, type=float,
+                             help="Time in seconds after which character input is considered a new word")
+    segment_arg.add_argument("--chord-char-threshold", default=Defaults.DEFAULT_CHORD_CHAR_THRESHOLD, type=int,
+                             help="Time in milliseconds between characters in a chord to be considered a chord")
+    segment_arg.add_argument("--allowed-chars", default=Defaults.DEFAULT_ALLOWED_CHARS,
+                             help="Chars to be considered as part of words")
+    segment_arg.add_argument("--allowed-first-chars",
+                             default=Defaults.DEFAULT_ALLOWED_FIRST_CHARS,
+                             help="Chars to be considered as the first char in words")
+    segment_arg.add_argument("--modifier-keys", default=Defaults.DEFAULT_MODIFIERS,
+                             help="Specify which modifier keys to use",
+                             choices=Defaults.MODIFIER_NAMES,
+                             nargs='+')
 
     # Parse command line arguments
     parser = argparse.ArgumentParser(
@@ -69,20 +85,31 @@ def main():
     subparsers = parser.add_subparsers(dest="command", title="Commands")
 
     # Start freqlogging
-    parser_start = subparsers.add_parser("startlog", help="Start logging", parents=[log_arg, path_arg, upgrade_arg])
-    parser_start.add_argument("--new-word-threshold", default=Defaults.DEFAULT_NEW_WORD_THRESHOLD, type=float,
-                              help="Time in seconds after which character input is considered a new word")
-    parser_start.add_argument("--chord-char-threshold", default=Defaults.DEFAULT_CHORD_CHAR_THRESHOLD, type=int,
-                              help="Time in milliseconds between characters in a chord to be considered a chord")
-    parser_start.add_argument("--allowed-chars", default=Defaults.DEFAULT_ALLOWED_CHARS,
-                              help="Chars to be considered as part of words")
-    parser_start.add_argument("--allowed-first-chars",
-                              default=Defaults.DEFAULT_ALLOWED_FIRST_CHARS,
-                              help="Chars to be considered as the first char in words")
-    parser_start.add_argument("--modifier-keys", default=Defaults.DEFAULT_MODIFIERS,
-                              help="Specify which modifier keys to use",
-                              choices=Defaults.MODIFIER_NAMES,
-                              nargs='+')
+    parser_start = subparsers.add_parser("startlog", help="Start logging",
+                                         parents=[log_arg, path_arg, upgrade_arg, segment_arg])
+    parser_start.add_argument("--write-behind", action="store_true",
+                              help="Buffer logged words/chords in memory and write them to the database in batches")
+    parser_start.add_argument("--capture", default=[s.name for s in CaptureStream if s in Defaults.DEFAULT_CAPTURE],
+                              help="Optional input streams to capture besides key presses (default: %(default)s)",
+                              choices=[s.name for s in CaptureStream], nargs='*')
+    parser_start.add_argument("--event-buffer-size", default=Defaults.DEFAULT_EVENT_BUFFER_SIZE, type=int,
+                              help="Max number of captured events waiting to be processed")
+    parser_start.add_argument("--overflow", default=Defaults.DEFAULT_OVERFLOW_POLICY.name,
+                              help="What to do with new events when the event buffer is full",
+                              choices=[p.name for p in OverflowPolicy])
+    parser_start.add_argument("--journal", nargs="?", const="", metavar="DIR",
+                              help="Journal raw keystrokes to DIR (default: next to the db) until they are logged, to "
+                                   "recover them if nexus crashes. The journal contains everything you type, "
+                                   "including passwords, until it is logged")
+    parser_start.add_argument("--keep-journal", action="store_true",
+                              help="Keep journaled keystrokes after they are logged, as a recording for replay")
+
+    # Replay journal
+    parser_replay = subparsers.add_parser("replay", help="Log a recorded keystroke journal into freqlog",
+                                          parents=[log_arg, path_arg, upgrade_arg, segment_arg])
+    parser_replay.add_argument("journal", help="Journal directory or segment file to replay (see startlog --journal)")
+    parser_replay.add_argument("--streaming", action="store_true",
+                               help="Segment events one at a time, even if numpy is installed for batch segmentation")
     # Num words
     subparsers.add_parser("numwords", help="Get number of words in freqlog",
                           parents=[log_arg, path_arg, case_arg, upgrade_arg])
@@ -111,6 +138,17 @@ def main():
     parser_chords.add_argument("-o", "--order", default=Order.ASCENDING, help="Order (default: DESCENDING)",
                                choices=[order.name for order in Order])
 
+    # Get usage history
+    parser_history = subparsers.add_parser("history", help="Get most used words or chords in the last days, or the "
+                                                           "usage history of some",
+                                           parents=[log_arg, path_arg, case_arg, num_arg, upgrade_arg])
+    parser_history.add_argument("entry", help="Word(s) (or chords with --chords) to get the usage history of",
+                                nargs="*")
+    parser_history.add_argument("--chords", action="store_true", help="Get chords instead of words")
+    parser_history.add_argument("-d", "--days", type=int, default=Defaults.DEFAULT_HISTORY_DAYS_CLI,
+                                help="Number of days to include, counting today (default: %(default)s, 0 for all). "
+                                     "Older history is counted by week or month")
+
     # Get banned words
     parser_banned = subparsers.add_parser("banlist", help="Get list of banned words",
                                           parents=[log_arg, path_arg, num_arg, upgrade_arg])
@@ -152,12 +190,12 @@ def main():
     parser.add_argument("-v", "--version", action="version", version=f"%(prog)s {__version__}")
 
     # Merge db
-    parser_merge = subparsers.add_parser("mergedb", help="Merge two Freqlog databases", parents=[log_arg, upgrade_arg])
+    parser_merge = subparsers.add_parser("mergedb", help="Merge two or more Freqlog databases",
+                                         parents=[log_arg, upgrade_arg])
     parser_merge.add_argument("--ban-data-keep", default=Age.OLDER.name,
                               help=f"Which ban data to keep (default: {Age.OLDER.name})",
                               choices=[age.name for age in Age])
-    parser_merge.add_argument("src1", help="Path to first source database")
-    parser_merge.add_argument("src2", help="Path to second source database")
+    parser_merge.add_argument("src", nargs="+", help="Paths to source databases (at least two)")
     parser_merge.add_argument("dst", help="Path to destination database")
 
     # Parse arguments
@@ -214,7 +252,7 @@ def main():
 
     # Validate arguments before creating Freqlog object
     match args.command:
-        case "startlog":
+        case "startlog" | "replay":
             try:  # Validate backend
                 Freqlog.is_backend_initialized(args.freqlog_db_path)
             except (ValueError, PermissionError, IsADirectoryError) as e:
@@ -226,6 +264,9 @@ def main():
             if args.chord_char_threshold <= 0:
                 logging.error("Chord character threshold must be greater than 0")
                 exit_code = 3
+            if args.command == "startlog" and args.event_buffer_size <= 0:
+                logging.error("Event buffer size must be greater than 0")
+                exit_code = 3
             if len(args.allowed_chars) == 0:
                 logging.error("Must allow at least one char")
                 exit_code = 3
@@ -243,10 +284,21 @@ def main():
             if args.num and args.num < 0:
                 logging.error("Number of chords must be >= 0")
                 exit_code = 3
+        case "history":
+            if args.num and args.num < 0:
+                logging.error("Number of entries must be >= 0")
+                exit_code = 3
+            if args.days < 0:
+                logging.error("Number of days must be >= 0")
+                exit_code = 3
         case "banlist":
             if args.num and args.num < 0:
                 logging.error("Number of words must be >= 0")
                 exit_code = 3
+        case "mergedb":
+            if len(args.src) < 2:
+                logging.error("Must merge at least two source databases")
+                exit_code = 3
 
     def _prompt_for_upgrade(db_version: Version) -> None:
         """Prompt user to upgrade"""
@@ -289,22 +341,49 @@ def main():
         except KeyboardInterrupt:
             sys.exit(9)
 
+    def _print_progress(progress: Progress) -> None:
+        """Show the progress of a long operation as a progress bar on stderr (if it is a terminal)"""
+        if not sys.stderr.isatty():
+            return
+        width = 30
+        filled = width * progress.done // progress.total if progress.total > 0 else 0
+        line = f"[{'#' * filled}{'.' * (width - filled)}] {progress}"
+        print(f"\r{line:<79}", end="\n" if progress.finished else "", file=sys.stderr, flush=True)
+
+    def _parse_modifier_keys(names: list[str]) -> vinput.KeyboardModifiers:
+        """
+        Get the modifier keys struct for a list of modifier names
+        :param names: Names of modifiers (see Defaults.MODIFIER_NAMES)
+        """
+        mods = vinput.KeyboardModifiers()
+        logging.debug('Activated modifier keys:')
+        for mod in names:
+            logging.debug(' - ' + str(mod))
+            setattr(mods, mod, True)
+        return mods
+
     # Parse commands
-    if args.command == "mergedb":  # Merge databases
+    if args.command == "mergedb" and exit_code == 0:  # Merge databases
         logging.warning("This feature has yet to be thoroughly tested and is not guaranteed to work. Manually verify"
                         f"(via an export) that the destination DB ({args.dst}) contains all your data after merging.")
         try:  # Get passwords
             input("DANGER: Backup your databases before merging!!! Press enter to continue.")
-            src1_pass = _prompt_for_password(False, "source database 1")
-            src2_pass = _prompt_for_password(False, "source database 2")
+            src_passes = [_prompt_for_password(False, f"source database {i + 1}") for i in range(len(args.src))]
             dst_pass = _prompt_for_password(True, "destination database")
         except KeyboardInterrupt:
             logging.error("Merge cancelled")
             sys.exit(8)
         try:
-            src1 = Freqlog(args.src1, lambda _: src1_pass, loggable=False, upgrade_callback=_prompt_for_upgrade)
-            src1.merge_backends(args.src2, args.dst, Age[args.ban_data_keep], lambda _: src2_pass, lambda _: dst_pass)
+            src1 = Freqlog(args.src[0], lambda _: src_passes[0], loggable=False, upgrade_callback=_prompt_for_upgrade,
+                           progress_callback=_print_progress)
+            src1.merge_backends(args.src[1:], args.dst, Age[args.ban_data_keep],
+                                [lambda _, src_pass=src_pass: src_pass for src_pass in src_passes[1:]],
+                                lambda _: dst_pass)
             sys.exit(0)
+        except KeyboardInterrupt:
+            print(file=sys.stderr)  # End the progress bar
+            logging.error("Merge interrupted, run the same command again to resume it")
+            sys.exit(8)
         except Exception as e:
             logging.error(e)
             exit_code = 7
@@ -325,7 +404,9 @@ def main():
     if args.command != "startlog":
         try:
             freqlog = Freqlog(args.freqlog_db_path, password_callback=_prompt_for_password, loggable=False,
-                              upgrade_callback=_prompt_for_upgrade)
+                              upgrade_callback=_prompt_for_upgrade,
+                              write_behind=args.command == "replay",  # Replay commits in batches
+                              progress_callback=_print_progress)
         except Exception as e:
             logging.error(e)
             sys.exit(4)
@@ -343,18 +424,30 @@ def main():
     match args.command:
         case "startlog":  # Start freqlogging
             try:
-                freqlog = Freqlog(args.freqlog_db_path, password_callback=_prompt_for_password, loggable=True)
+                freqlog = Freqlog(args.freqlog_db_path, password_callback=_prompt_for_password, loggable=True,
+                                  write_behind=args.write_behind, progress_callback=_print_progress)
             except Exception as e:
                 logging.error(e)
                 sys.exit(4)
-            mods = vinput.KeyboardModifiers()
-            logging.debug('Activated modifier keys:')
-            for mod in args.modifier_keys:
-                logging.debug(' - ' + str(mod))
-                setattr(mods, mod, True)
-            signal.signal(signal.SIGINT, lambda _: freqlog.stop_logging())
+            mods = _parse_modifier_keys(args.modifier_keys)
+            capture = CaptureStream.NONE
+            for stream in args.capture:
+                capture |= CaptureStream[stream]
+            signal.signal(signal.SIGINT, lambda *_: freqlog.stop_logging())
+            journal_path = None
+            if args.journal is not None or args.keep_journal:
+                journal_path = args.journal or args.freqlog_db_path + Defaults.DEFAULT_JOURNAL_DIR_SUFFIX
             freqlog.start_logging(args.new_word_threshold, args.chord_char_threshold, args.allowed_chars,
-                                  args.allowed_first_chars, mods)
+                                  args.allowed_first_chars, mods, capture, args.event_buffer_size,
+                                  OverflowPolicy[args.overflow], journal_path, args.keep_journal)
+        case "replay":  # Replay a recorded journal
+            try:
+                freqlog.replay(args.journal, args.new_word_threshold, args.chord_char_threshold, args.allowed_chars,
+                               args.allowed_first_chars, _parse_modifier_keys(args.modifier_keys),
+                               batch=not args.streaming)
+            except (OSError, ValueError) as e:
+                logging.error(e)
+                exit_code = 4
         case "checkword":  # Check if word is banned
             for word in args.word:
                 if freqlog.check_banned(word):
@@ -363,22 +456,21 @@ def main():
                 else:
                     print(f"'{word}' is not banned")
         case "banword":  # Ban word
-            for word in args.word:
-                if not freqlog.ban_word(word):
-                    exit_code = 6
+            if not all(freqlog.ban_words(args.word, datetime.now())):
+                exit_code = 6
         case "unbanword":  # Unban word
-            for word in args.word:
-                if not freqlog.unban_word(word):
-                    exit_code = 6
+            if not all(freqlog.unban_words(args.word)):
+                exit_code = 6
         case "delword":  # Delete word
-            for word in args.word:
-                if not freqlog.delete_word(word, CaseSensitivity[args.case]):
+            words = dict.fromkeys(args.word, CaseSensitivity[args.case])
+            for word, deleted in zip(words, freqlog.delete_words(words)):
+                if not deleted:
                     print(f"Word '{word}' not found")
                     exit_code = 5
         case "delchordentry":  # Delete chord entry
             logging.debug("args.chord: " + str(args.chord))
-            for chord in args.chord:
-                if not freqlog.delete_logged_chord(chord):
+            for chord, deleted in zip(args.chord, freqlog.delete_logged_chords(args.chord)):
+                if not deleted:
                     print(f"Chord '{chord}' not found")
                     exit_code = 5
         case "words":  # Get words
@@ -386,14 +478,17 @@ def main():
                 freqlog.export_words_to_csv(args.export, num, WordMetadataAttr[args.sort_by],
                                             args.order == Order.DESCENDING, CaseSensitivity[args.case])
             elif len(args.word) == 0:  # All words
-                res = freqlog.list_words(limit=num, sort_by=WordMetadataAttr[args.sort_by],
-                                         reverse=args.order == Order.DESCENDING,
-                                         case=CaseSensitivity[args.case], search=args.search if args.search else "")
-                if len(res) == 0:
+                res = freqlog.iter_words(sort_by=WordMetadataAttr[args.sort_by],
+                                         reverse=args.order == Order.DESCENDING, case=CaseSensitivity[args.case],
+                                         search=args.search if args.search else "",
+                                         page_size=min(num, Defaults.DEFAULT_PAGE_SIZE) if num > 0
+                                         else Defaults.DEFAULT_PAGE_SIZE)
+                printed = False
+                for word in itertools.islice(res, num) if num > 0 else res:
+                    print(word)  # TODO: pretty print
+                    printed = True
+                if not printed:
                     print("No words in freqlog. Start typing!")
-                else:
-                    for word in res:
-                        print(word)  # TODO: pretty print
             else:  # Specific words
                 if num:
                     logging.warning("-n/--num argument ignored when specific words are given")
@@ -414,13 +509,15 @@ def main():
                 freqlog.export_chords_to_csv(args.export, num, ChordMetadataAttr[args.sort_by],
                                              args.order == Order.DESCENDING)
             elif len(args.chord) == 0:  # All chords
-                res = freqlog.list_logged_chords(num, ChordMetadataAttr[args.sort_by],
-                                                 args.order == Order.DESCENDING)
-                if len(res) == 0:
+                res = freqlog.iter_logged_chords(ChordMetadataAttr[args.sort_by], args.order == Order.DESCENDING,
+                                                 page_size=min(num, Defaults.DEFAULT_PAGE_SIZE) if num > 0
+                                                 else Defaults.DEFAULT_PAGE_SIZE)
+                printed = False
+                for chord in itertools.islice(res, num) if num > 0 else res:
+                    print(chord)
+                    printed = True
+                if not printed:
                     print("No chords in freqlog. Start chording!")
-                else:
-                    for chord in res:
-                        print(chord)
             else:  # Specific chords
                 if num:
                     logging.warning("-n/--num argument ignored when specific chords are given")
@@ -436,6 +533,29 @@ def main():
                     for chord in sorted(chords, key=lambda x: getattr(x, args.sort_by),
                                         reverse=(args.order == Order.DESCENDING)):
                         print(chord)
+        case "history":  # Get usage history
+            end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            start = end - timedelta(days=args.days) if args.days else datetime.fromtimestamp(0)
+            if len(args.entry) == 0:  # Most used entries
+                if args.chords:
+                    res = freqlog.list_chord_usage(start, end, num)
+                else:
+                    res = freqlog.list_word_usage(start, end, num, CaseSensitivity[args.case])
+                if len(res) == 0:
+                    print(f"No {'chords' if args.chords else 'words'} used since {start.date()}")
+                for entry, frequency in res:
+                    print(f"{'Chord' if args.chords else 'Word'}: {entry} | Frequency: {frequency}")
+            else:  # Specific entries
+                for entry in args.entry:
+                    if args.chords:
+                        history = freqlog.get_chord_history(entry, start, end)
+                    else:
+                        history = freqlog.get_word_history(entry, CaseSensitivity[args.case], start, end)
+                    if len(history) == 0:
+                        print(f"'{entry}' not used since {start.date()}")
+                        exit_code = 5
+                    for bucket in history:
+                        print(bucket)
         case "banlist":  # Get banned words
             banlist = freqlog.list_banned_words(limit=num, sort_by=BanlistAttr[args.sort_by],
                                                 reverse=args.order == Order.DESCENDING)
@@ -0,0 +1,19 @@
+from nexus.Freqlog.backends.SQLite.KeyDerivation import KeyDerivation, KEY_LENGTH
+
+
+def test_derive_once():
+    future = KeyDerivation.start(b"salt", "password")
+    assert KeyDerivation.start(b"salt", "password") is future
+    key = KeyDerivation.derive(b"salt", "password")
+    assert len(key) == KEY_LENGTH and key == future.result()
+    assert KeyDerivation.derive(b"pepper", "password") != key
+    assert KeyDerivation.derive(b"salt", "Password") != key
+
+
+def test_forget():
+    KeyDerivation.derive(b"salt", "wrong")
+    assert all(isinstance(digest, bytes) for digest in KeyDerivation._keys)  # Passwords aren't kept
+    assert KeyDerivation.derive(b"sal", "twrong") != KeyDerivation.derive(b"salt", "wrong")
+    future = KeyDerivation.start(b"salt", "wrong")
+    KeyDerivation.forget(b"salt", "wrong")
+    assert KeyDerivation.start(b"salt", "wrong") is not future
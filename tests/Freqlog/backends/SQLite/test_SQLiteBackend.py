@@ -1,9 +1,13 @@
+import os
 from datetime import datetime, timedelta
 
+import cryptography.fernet as cryptography
 import pytest
 
 from nexus.Freqlog.backends import SQLiteBackend
-from nexus.Freqlog.Definitions import BanlistAttr, CaseSensitivity, WordMetadataAttr
+from nexus.Freqlog.backends.SQLite.KeyDerivation import KeyDerivation
+from nexus.Freqlog.Definitions import Age, BanlistAttr, CaseSensitivity, ChordMetadataAttr, Defaults, HistoryPeriod, \
+    Progress, WordMetadataAttr
 
 TIME = datetime.now()
 
@@ -29,6 +33,7 @@ def test_check_password(loaded_backend):
     backend = loaded_backend
     assert backend.check_password("test") is True
     assert backend.check_password("wrong") is False
+    assert KeyDerivation._digest(backend.salt, "wrong") not in KeyDerivation._keys  # Wrong keys are forgotten
     backend.set_password("new")
     assert backend.check_password("new") is True
     assert backend.check_password("test") is False
@@ -88,6 +93,65 @@ def test_list_words_limit(loaded_backend):
     assert data[1].word == "two"
 
 
+def test_list_by_score(loaded_backend):
+    backend = loaded_backend
+    data = backend.list_words(3, WordMetadataAttr.score, True, CaseSensitivity.SENSITIVE)
+    assert [(word.word, word.score) for word in data] == [("two", 6), ("three", 5), ("tHrEe", 5)]
+    assert backend._read_one("SELECT score FROM freqlog WHERE word = 'two'") == (6,)
+    backend.log_chord("ab", TIME)
+    backend.log_chord("xyz", TIME + timedelta(seconds=1))
+    backend.log_chord("ab", TIME + timedelta(seconds=2))
+    assert [(chord.chord, chord.score) for chord in backend.list_chords(0, ChordMetadataAttr.score, False)] == \
+           [("xyz", 3), ("ab", 4)]
+
+
+@pytest.mark.parametrize("case", list(CaseSensitivity))
+@pytest.mark.parametrize("sort_by", list(WordMetadataAttr))
+@pytest.mark.parametrize("reverse", [False, True])
+def test_iter_words(loaded_backend, case, sort_by, reverse):
+    backend = loaded_backend
+    expected = [vars(word) for word in backend.list_words(-1, sort_by, reverse, case)]
+    assert [vars(word) for word in backend.iter_words(sort_by, reverse, case, page_size=2)] == expected
+
+    # Resume after each word from its cursor
+    words = backend.iter_words(sort_by, reverse, case, page_size=2)
+    for i, word in enumerate(words):
+        assert vars(word) == expected[i]
+        assert [vars(word) for word in backend.iter_words(sort_by, reverse, case, page_size=3,
+                                                          cursor=words.cursor)] == expected[i + 1:]
+
+
+def test_iter_chords(loaded_backend):
+    backend = loaded_backend
+    for i, chord in enumerate(["ab", "xyz", "ab", "cd"]):
+        backend.log_chord(chord, TIME + timedelta(seconds=i))
+    chords = backend.iter_chords(ChordMetadataAttr.score, True, page_size=1)
+    assert next(chords).chord == "ab"
+    assert [chord.chord for chord in backend.iter_chords(cursor=chords.cursor)] == ["xyz", "cd"]
+    assert [chord.chord for chord in backend.iter_chords(search="yz")] == ["xyz"]
+    with pytest.raises(ValueError):
+        backend.iter_chords(cursor="not a cursor")
+    with pytest.raises(ValueError):
+        list(backend.iter_chords(ChordMetadataAttr.chord, cursor=chords.cursor))  # Cursor from a different order
+
+
+@pytest.mark.parametrize("search,case,words", [
+    ("hre", CaseSensitivity.SENSITIVE, ["three", "tHrEe", "Three"]),
+    ("HRE", CaseSensitivity.INSENSITIVE, ["three"]),
+    ("hre", CaseSensitivity.FIRST_CHAR, ["three", "tHrEe"]),
+    ("o", CaseSensitivity.SENSITIVE, ['"quoted"', "two", "one"]),  # Too short for the index
+    ("%", CaseSensitivity.SENSITIVE, ["50%"]),
+    ("t_o", CaseSensitivity.SENSITIVE, []),
+    ("it's", CaseSensitivity.SENSITIVE, ["it's"]),
+    ('"q', CaseSensitivity.INSENSITIVE, ['"quoted"']),
+])
+def test_search(loaded_backend, search, case, words):
+    backend = loaded_backend
+    for i, word in enumerate(["50%", "it's", '"quoted"']):
+        backend.log_word(word, TIME - timedelta(days=1, seconds=1 + i), TIME - timedelta(days=1, seconds=i))
+    assert [word.word for word in backend.list_words(0, WordMetadataAttr.score, True, case, search)] == words
+
+
 @pytest.mark.parametrize("word,original,remaining", [
     ("one", 5, 4),
     ("two", 5, 4),
@@ -132,8 +196,242 @@ def test_dup_ban_unban(loaded_backend):
     assert backend.unban_word("one") is False
 
 
+def test_bulk_ban_unban_delete(loaded_backend):
+    backend = loaded_backend
+    backend.log_chord("ab", TIME)
+    assert backend.ban_words(["ONE", "one", "new", "ab"], TIME) == [True, False, True, True]
+    assert backend.get_word_metadata("one", CaseSensitivity.SENSITIVE) is None
+    assert backend.get_chord_metadata("ab") is None
+    assert backend.ban_words(["one", "other"], TIME) == [False, True]
+    assert backend.unban_words(["new", "new", "never"]) == [True, False, False]
+    assert sorted(entry.word for entry in backend.list_banned_words(0, BanlistAttr.word, False)) == \
+           ["ab", "one", "other"]
+    assert backend.delete_words({"three": CaseSensitivity.SENSITIVE, "THREE": CaseSensitivity.INSENSITIVE,
+                                 "two": CaseSensitivity.FIRST_CHAR, "one": CaseSensitivity.SENSITIVE}) == \
+           [True, True, True, False]
+    assert backend.num_words(CaseSensitivity.SENSITIVE) == 0
+    backend.log_chord("cd", TIME)
+    assert backend.delete_chords(["cd", "cd"]) == [True, False]
+
+
+def test_banlist_hash(tmp_path):
+    path = str(tmp_path / "freqlog.db")
+    backend = SQLiteBackend(path, lambda _: "test")
+    backend.ban_word("One", TIME)
+    backend.ban_word("two", TIME + timedelta(seconds=1))
+    assert backend.ban_word("ONE", TIME) is False
+    hashes = [row[0] for row in backend._fetchall("SELECT hash FROM banlist")]
+    assert len(set(hashes)) == 2 and b"one" not in hashes and None not in hashes
+
+    # Entries banned before hashes are hashed when the password is known
+    backend._execute("UPDATE banlist SET hash = NULL")
+    backend.close()
+    backend = SQLiteBackend(path, lambda _: "test")
+    assert sorted(row[0] for row in backend._fetchall("SELECT hash FROM banlist")) == sorted(hashes)
+    assert backend.get_banlist_entry("one").date_added == TIME
+    assert backend.unban_word("TWO") is True
+    assert backend._fetchone("SELECT COUNT(*) FROM banlist")[0] == 1
+    assert backend._banlist is None  # Not decrypted until listed
+    assert [entry.word for entry in backend.list_banned_words(0, BanlistAttr.word, False)] == ["one"]
+
+    # Changing the password re-keys the hashes
+    backend.set_password("new")
+    backend.close()
+    backend = SQLiteBackend(path, lambda _: "new")
+    assert backend.check_banned("one") is True
+    assert backend._fetchone("SELECT hash FROM banlist")[0] not in hashes
+    backend.close()
+
+
 def test_num_words(loaded_backend):
     backend = loaded_backend
     assert backend.num_words(CaseSensitivity.INSENSITIVE) == 3
     assert backend.num_words(CaseSensitivity.SENSITIVE) == 5
     assert backend.num_words(CaseSensitivity.FIRST_CHAR) == 4
+
+
+def test_word_aggregates(loaded_backend):
+    backend = loaded_backend
+    backend.log_word("Three", TIME + timedelta(minutes=6) - timedelta(seconds=1), TIME + timedelta(minutes=6))
+    data = backend.get_word_metadata("THREE", CaseSensitivity.INSENSITIVE)
+    assert (data.word, data.frequency, data.score) == ("three", 4, 20)
+    assert close_to(data.average_speed, timedelta(seconds=2.5))
+
+    # Deleting a variant recomputes the aggregates from the remaining ones
+    assert backend.delete_word("Three", CaseSensitivity.SENSITIVE) is True
+    data = backend.get_word_metadata("three", CaseSensitivity.INSENSITIVE)
+    assert data.frequency == 2
+    assert close_to(data.last_used, TIME + timedelta(minutes=5))
+    assert close_to(data.average_speed, timedelta(seconds=3.5))
+    assert backend.get_word_metadata("three", CaseSensitivity.FIRST_CHAR).frequency == 1
+    assert backend.num_words(CaseSensitivity.FIRST_CHAR) == 4
+    assert [word.word for word in backend.list_words(2, WordMetadataAttr.score, True, CaseSensitivity.FIRST_CHAR)] \
+           == ["two", "three"]  # Ties broken by word
+
+
+def test_write_behind():
+    backend = SQLiteBackend(":memory:", lambda _: "test", write_behind=True, write_buffer_size=3)
+    backend.log_word("one", TIME - timedelta(seconds=1), TIME)
+    backend.log_word("one", TIME + timedelta(minutes=1) - timedelta(seconds=3), TIME + timedelta(minutes=1))
+    backend.log_chord("two", TIME + timedelta(minutes=2))
+    backend.log_chord("two", TIME + timedelta(minutes=3))
+
+    # Nothing written yet, 4 entries folded into 2
+    assert backend._fetchone("SELECT COUNT(*) FROM freqlog")[0] == 0
+    assert backend._fetchone("SELECT COUNT(*) FROM chordlog")[0] == 0
+    assert backend.commits_saved == 4
+
+    # Third distinct entry hits the size threshold
+    backend.log_word("three", TIME + timedelta(minutes=4) - timedelta(seconds=2), TIME + timedelta(minutes=4))
+    assert backend._fetchone("SELECT COUNT(*) FROM freqlog")[0] == 2
+    assert backend.commits_saved == 4
+
+    # Buffered entries are merged with existing ones and visible to reads
+    backend.log_word("one", TIME + timedelta(minutes=5) - timedelta(seconds=2), TIME + timedelta(minutes=5))
+    data = backend.get_word_metadata("one", CaseSensitivity.SENSITIVE)
+    assert data.frequency == 3
+    assert close_to(data.last_used, TIME + timedelta(minutes=5))
+    assert close_to(data.average_speed, timedelta(seconds=2))
+    chord = backend.get_chord_metadata("two")
+    assert chord.frequency == 2
+    assert close_to(chord.last_used, TIME + timedelta(minutes=3))
+    assert backend.commits_saved == 4
+    backend.close()
+
+
+@pytest.mark.parametrize("write_behind", [False, True])
+def test_history(write_behind):
+    backend = SQLiteBackend(":memory:", lambda _: "test", write_behind=write_behind)
+    day = datetime(2024, 3, 6)  # Wednesday
+    for i, (word, days) in enumerate([("one", 0), ("One", 0), ("one", 1), ("two", 1), ("two", 1), ("two", 2)]):
+        end = day + timedelta(days=days, hours=12, seconds=i)
+        backend.log_word(word, end - timedelta(seconds=1), end)
+    backend.log_chord("ab", day + timedelta(hours=12))
+
+    # Day buckets
+    assert backend.list_word_usage(day, day + timedelta(days=2)) == [("one", 3), ("two", 2)]
+    assert backend.list_word_usage(day, day + timedelta(days=2), 2, CaseSensitivity.SENSITIVE) == \
+           [("one", 2), ("two", 2)]
+    assert [(h.entry, h.start, h.period, h.frequency) for h in
+            backend.get_word_history("ONE", CaseSensitivity.INSENSITIVE)] == \
+           [("one", day, HistoryPeriod.DAY, 2), ("one", day + timedelta(days=1), HistoryPeriod.DAY, 1)]
+    assert [h.frequency for h in backend.get_word_history("One", CaseSensitivity.SENSITIVE)] == [1]
+    assert [h.frequency for h in backend.get_word_history("two", CaseSensitivity.SENSITIVE,
+                                                          day + timedelta(days=2))] == [1]
+    assert backend.list_chord_usage(day, day + timedelta(days=1)) == [("ab", 1)]
+
+    # Days roll up into their week, then weeks into the month they start in
+    backend.rollup_history(day + timedelta(days=Defaults.DEFAULT_HISTORY_DAYS + 3))
+    assert [(h.start, h.period, h.frequency) for h in backend.get_word_history("two", CaseSensitivity.SENSITIVE)] == \
+           [(datetime(2024, 3, 4), HistoryPeriod.WEEK, 3)]
+    assert backend.list_word_usage(datetime(2024, 3, 4), datetime(2024, 3, 5)) == [("one", 3), ("two", 3)]
+    backend.rollup_history(datetime(2024, 3, 4) + timedelta(weeks=Defaults.DEFAULT_HISTORY_WEEKS + 1))
+    assert [(h.start, h.period, h.frequency) for h in backend.get_chord_history("ab")] == \
+           [(datetime(2024, 3, 1), HistoryPeriod.MONTH, 1)]
+    assert backend.list_word_usage(datetime(2024, 3, 1), datetime(2024, 4, 1)) == [("one", 3), ("two", 3)]
+
+    # Deleted and banned entries are deleted from the history
+    backend.delete_word("two", CaseSensitivity.SENSITIVE)
+    backend.ban_word("ab", day)
+    assert backend.list_word_usage(datetime(2024, 3, 1), datetime(2024, 4, 1)) == [("one", 3)]
+    assert backend.get_chord_history("ab") == []
+    backend.close()
+
+
+def test_wal_readers(tmp_path):
+    db = str(tmp_path / "freqlog.db")
+    backend = SQLiteBackend(db, lambda _: "test", busy_timeout=0.1)
+    other = SQLiteBackend(db, lambda _: "test", busy_timeout=0.1)
+    for i, word in enumerate(["one", "two", "three"]):
+        backend.log_word(word, TIME + timedelta(minutes=i) - timedelta(seconds=1), TIME + timedelta(minutes=i))
+    with backend._reader() as cursor:
+        # Hold a read transaction open mid-query while another connection commits
+        cursor.execute("SELECT word FROM freqlog ORDER BY lastused")
+        assert cursor.fetchone() == ("one",)
+        other.log_word("four", TIME + timedelta(minutes=3) - timedelta(seconds=1), TIME + timedelta(minutes=3))
+        assert cursor.fetchall() == [("two",), ("three",)]  # Snapshot from before the commit
+    assert backend.num_words() == 4  # Pooled reader sees the commit
+    assert {word.word for word in other.list_words()} == {"one", "two", "three", "four"}
+    assert backend._readers.qsize() == 1
+    other.close()
+    backend.close()
+
+
+def test_merge_backend(tmp_path):
+    paths = [str(tmp_path / f"{name}.db") for name in ("a", "b", "c", "merged")]
+    dbs = [SQLiteBackend(path, lambda _, password=password: password)
+           for path, password in zip(paths[:3], ("a", "b", "c"))]
+    for i, db in enumerate(dbs):
+        db.log_word("one", TIME + timedelta(minutes=i) - timedelta(seconds=i + 1), TIME + timedelta(minutes=i))
+        db.log_word(f"only{i}", TIME + timedelta(hours=i, seconds=29), TIME + timedelta(hours=i, seconds=30))
+        db.log_chord("ab", TIME + timedelta(days=i))
+        db.ban_word("banned", TIME + timedelta(days=i))
+    dbs[1].log_word("Later", TIME + timedelta(days=3) - timedelta(seconds=1), TIME + timedelta(days=3))
+    dbs[2].ban_word("later", TIME)
+    for db in dbs[1:]:
+        db.close()
+
+    with pytest.raises(ValueError):
+        dbs[0].merge_backend([paths[0]], paths[3], Age.OLDER, [lambda _: "a"], lambda _: "merged")
+    dbs[0].merge_backend(paths[1:3], paths[3], Age.NEWER, [lambda _: "b", lambda _: "c"], lambda _: "merged")
+    dbs[0].close()
+
+    merged = SQLiteBackend(paths[3], lambda _: "merged")
+    one = merged.get_word_metadata("one", CaseSensitivity.SENSITIVE)
+    assert one.frequency == 3 and close_to(one.last_used, TIME + timedelta(minutes=2))
+    assert close_to(one.average_speed, timedelta(seconds=2))
+    assert sorted(word.word for word in merged.list_words()) == ["one", "only0", "only1", "only2"]
+    assert merged.get_chord_metadata("ab").frequency == 3
+    assert merged.get_word_metadata("later", CaseSensitivity.INSENSITIVE) is None  # Banned by another source
+    assert merged.get_banlist_entry("banned").date_added == TIME + timedelta(days=2)
+    assert merged.check_banned("LATER") is True
+    assert merged.get_word_history("one", CaseSensitivity.SENSITIVE)[0].frequency == 3
+
+    # Aggregate and search tables are rebuilt, and their triggers work again
+    assert merged.num_words(CaseSensitivity.INSENSITIVE) == 4
+    assert [word.word for word in merged.list_words(search="nly")] == ["only2", "only1", "only0"]
+    merged.delete_word("only0", CaseSensitivity.SENSITIVE)
+    assert [word.word for word in merged.list_words(search="nly")] == ["only2", "only1"]
+    merged.close()
+
+
+def test_merge_resume(tmp_path):
+    paths = [str(tmp_path / f"{name}.db") for name in ("a", "b", "merged", "interrupted")]
+    for n, path in enumerate(paths[:2]):
+        db = SQLiteBackend(path, lambda _: "test")
+        for i in range(n * 3, n * 3 + 6):
+            end = TIME + timedelta(minutes=i, seconds=n * 30)
+            db.log_word(f"word{i}", end - timedelta(seconds=1), end)
+        db.ban_word("banned", TIME)
+        db.close()
+
+    def interrupt(progress: Progress) -> None:
+        progress.interval = 0
+        if progress.task == "Merging databases" and progress.done >= 4:  # After the first chunk is committed
+            raise KeyboardInterrupt
+
+    backend = SQLiteBackend(paths[0], lambda _: "test")
+    with pytest.raises(cryptography.InvalidToken):  # Fails before merging anything, so leaves no dst behind
+        backend.merge_backend([paths[1]], paths[2], Age.OLDER, [lambda _: "wrong"], lambda _: "test")
+    assert not os.path.exists(paths[2])
+    open(paths[2], "w").close()  # Empty dst left by an older version
+    backend.merge_backend([paths[1]], paths[2], Age.OLDER, [lambda _: "test"], lambda _: "test", chunk_size=2)
+    backend.progress_callback = interrupt
+    with pytest.raises(KeyboardInterrupt):
+        backend.merge_backend([paths[1]], paths[3], Age.OLDER, [lambda _: "test"], lambda _: "test", chunk_size=2)
+    assert SQLiteBackend._read_checkpoint(paths[3], "merge")["after"] == "word1"
+    with pytest.raises(ValueError):  # Only resumed with the same databases
+        backend.merge_backend([paths[1]], paths[3], Age.NEWER, [lambda _: "test"], lambda _: "test", chunk_size=2)
+
+    reports = []
+    backend.progress_callback = reports.append
+    backend.merge_backend([paths[1]], paths[3], Age.OLDER, [lambda _: "test"], lambda _: "test", chunk_size=2)
+    backend.close()
+    assert reports[-1].finished and reports[-1].done == reports[-1].total == 12 + 12 + 2  # Words, history, banlist
+    assert SQLiteBackend._read_checkpoint(paths[3], "merge") is None
+    merged, resumed = SQLiteBackend(paths[2], lambda _: "test"), SQLiteBackend(paths[3], lambda _: "test")
+    assert [vars(word) for word in resumed.list_words()] == [vars(word) for word in merged.list_words()]
+    assert resumed.num_words() == 9 and resumed.check_banned("banned")
+    assert [word.word for word in resumed.list_words(search="rd8")] == ["word8"]
+    merged.close()
+    resumed.close()
@@ -0,0 +1,40 @@
+import pytest
+from charachorder import CharaChorder
+
+
+class FakeCharaChorder:
+    """Stands in for a CharaChorder on a serial port, serving a fixed chordmap"""
+
+    def __init__(self, outputs: list[str], device_id: str = "CHARACHORDER ONE M0", version: str = "1.1.3") -> None:
+        self.outputs = outputs
+        self.device_id = device_id
+        self.version = version
+        self.chordmaps_read = 0  # Number of chordmaps sent over "serial"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_) -> None:
+        pass
+
+    def get_id(self) -> str:
+        return self.device_id
+
+    def get_version(self) -> str:
+        return self.version
+
+    def get_chordmap_count(self) -> int:
+        return len(self.outputs)
+
+    def get_chordmaps(self):
+        for i, output in enumerate(self.outputs):
+            self.chordmaps_read += 1
+            yield [chr(ord("a") + i % 26)], list(output)
+
+
+@pytest.fixture()
+def fake_device(monkeypatch) -> FakeCharaChorder:
+    """Connect Freqlog to a fake device instead of scanning serial ports"""
+    device = FakeCharaChorder(["chord", "nexus", "frequency"])
+    monkeypatch.setattr(CharaChorder, "list_devices", staticmethod(lambda: [device]))
+    return device
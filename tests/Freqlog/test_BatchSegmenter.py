@@ -0,0 +1,77 @@
+import random
+
+import pytest
+import vinput
+
+from nexus.Freqlog.Definitions import ActionType, Defaults
+from nexus.Freqlog.Events import MODIFIER_BITS, EventClock
+from nexus.Freqlog.Journal import Journal
+from nexus.Freqlog.Segmenter import Segmenter
+
+pytest.importorskip("numpy")
+from nexus.Freqlog.BatchSegmenter import BatchSegmenter  # noqa: E402
+
+MS = 1_000_000
+NEW_WORD_THRESHOLD_NS = int(Defaults.DEFAULT_NEW_WORD_THRESHOLD * 1_000_000_000)
+
+
+def make_corpus(n: int, seed: int) -> list[tuple]:
+    """Random typing with words, chords, typos, word deletes, shortcuts, clicks, releases and pauses"""
+    rng = random.Random(seed)
+    keys = [bytes([c]) for c in b"abcdefghijklmnopqrstuvwxyz'-.,;!?0123456789"] + [b"\x80", b"\xc3"]
+    events = []
+    t = 0
+    while len(events) < n:
+        chord = rng.random() < 0.3
+        for _ in range(rng.randint(1, 10)):
+            t += rng.choice([0, 1, 2, 3]) * MS if chord else rng.randint(0, 250) * MS
+            r = rng.random()
+            if r < 0.08:
+                events.append((ActionType.PRESS, b"\b", 0, t))
+            elif r < 0.09:
+                events.append((ActionType.PRESS, b"\b", MODIFIER_BITS['left_control'], t))
+            elif r < 0.10:
+                events.append((ActionType.PRESS, rng.choice(keys), MODIFIER_BITS['left_control'], t))
+            else:
+                events.append((ActionType.PRESS, rng.choice(keys), 0, t))
+            if rng.random() < 0.05:
+                events.append((ActionType.RELEASE, events[-1][1], 0, t + MS))
+        t += rng.choice([1, 2, 100, 300, 6000, -5]) * MS if rng.random() < 0.2 else rng.randint(1, 300) * MS
+        events.append((ActionType.PRESS, rng.choice([b" ", b" ", b" ", b"\t", b"\n", b"\b"]), 0, t))
+        if rng.random() < 0.03:
+            events.append((ActionType.PRESS, vinput.MouseButtonEvent(), 0, t))
+    return events
+
+
+def segmenter(logged: list) -> Segmenter:
+    modifier_keys = vinput.KeyboardModifiers()
+    for attr in Defaults.DEFAULT_MODIFIERS:
+        setattr(modifier_keys, attr, True)
+    return Segmenter(lambda w, s, e: logged.append(("word", w, s, e)),
+                     lambda c, s, e: logged.append(("chord", c, s, e)),
+                     Defaults.DEFAULT_ALLOWED_CHARS, Defaults.DEFAULT_ALLOWED_FIRST_CHARS, modifier_keys,
+                     Defaults.DEFAULT_CHORD_CHAR_THRESHOLD)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_matches_streaming(tmp_path, seed):
+    path = str(tmp_path / "journal")
+    journal = Journal(path, EventClock(), max_segment_size=64 * 1024)  # Several segments
+    journal.append(make_corpus(20_000, seed))
+    journal.close()
+
+    streamed = []
+    streaming = segmenter(streamed)
+    for _, events, _ in Journal.iter_segments(path):
+        streaming.feed_all(events, NEW_WORD_THRESHOLD_NS)
+    streaming.flush()
+
+    batched = []
+    batch = BatchSegmenter(segmenter(batched), NEW_WORD_THRESHOLD_NS)
+    for _, records, _ in BatchSegmenter.iter_segments(path):
+        batch.feed(records)
+    batch.flush()
+
+    assert batched == streamed
+    assert len({kind for kind, *_ in streamed}) == 2
+    assert batch.vectorized > 0
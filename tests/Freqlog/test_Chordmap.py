@@ -0,0 +1,62 @@
+from nexus.Freqlog import Freqlog
+from nexus.Freqlog.Chordmap import ChordmapIndex, Modification
+
+
+def test_match():
+    index = ChordmapIndex(["chord", "party ", "stop", "make", "box", "I", "parties"])
+    assert len(index) == 7
+    assert index.match("chord") == ("chord", Modification.NONE)
+    assert index.match("Chord") == ("chord", Modification.CASE)
+    assert index.match("i") == ("I", Modification.CASE)
+    assert index.match("chords") == ("chord", Modification.PLURAL)
+    assert index.match("boxes") == ("box", Modification.PLURAL)
+    assert index.match("partied") == ("party", Modification.PAST_TENSE)
+    assert index.match("parties") == ("parties", Modification.NONE)  # Outputs win over variants
+    assert index.match("making") == ("make", Modification.GERUND)
+    assert index.match("stopped") == ("stop", Modification.PAST_TENSE)  # Not precomputed, found in the trie
+    assert index.match("Stopping") == ("stop", Modification.GERUND)
+    assert "chording" in index
+    assert "chordx" not in index
+    assert "cho" not in index
+
+
+def open_freqlog(db: str) -> Freqlog:
+    """Open a loggable Freqlog and load its chords as the logging thread does once the device is discovered"""
+    freqlog = Freqlog(db, lambda _: "test")
+    freqlog.discover_device().result()
+    freqlog._load_chordmap()
+    return freqlog
+
+
+def test_chordmap_cache(tmp_path, fake_device):
+    db = str(tmp_path / "freqlog.db")
+    freqlog = open_freqlog(db)
+    freqlog.chords_thread.join()  # Nothing cached, fetched in the background
+    assert fake_device.chordmaps_read == 3
+    assert freqlog.chords.match("chords") == ("chord", Modification.PLURAL)
+    freqlog._cache_chordmap()  # Done by the logging thread when idle or stopping
+    freqlog.backend.close()
+
+    freqlog = open_freqlog(db)
+    assert freqlog.chords_thread is None  # Loaded from the cache
+    assert fake_device.chordmaps_read == 3
+    assert "nexus" in freqlog.chords
+    freqlog.backend.close()
+
+    fake_device.outputs.append("new")
+    freqlog = open_freqlog(db)
+    freqlog.chords_thread.join()  # Chord count changed, fetched again
+    assert fake_device.chordmaps_read == 7
+    assert "new" in freqlog.chords
+    freqlog.backend.close()
+
+
+def test_lazy_device_discovery(fake_device, monkeypatch):
+    opened = []
+    monkeypatch.setattr(type(fake_device), "__enter__", lambda self: opened.append(self) or self)
+    freqlog = Freqlog(":memory:", lambda _: "test", loggable=False)
+    assert opened == [] and freqlog.num_chords is None  # Queries don't touch serial
+    assert freqlog.discover_device().result() == 3
+    assert opened == [fake_device] and freqlog.device_id == "CHARACHORDER ONE M0 1.1.3"
+    assert freqlog.discover_device().result() == 3  # Only discovered once
+    assert len(opened) == 1
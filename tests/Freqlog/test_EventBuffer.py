@@ -0,0 +1,69 @@
+from threading import Thread
+
+import pytest
+
+from nexus.Freqlog.Definitions import OverflowPolicy
+from nexus.Freqlog.EventBuffer import EventBuffer
+
+
+def test_drain_order():
+    buffer = EventBuffer(4)
+    for i in range(3):
+        buffer.put(i)
+    assert buffer.drain(max_items=2) == [0, 1]
+    for i in range(3, 6):  # Wraps around the end of the ring
+        buffer.put(i)
+    assert buffer.depth == 4
+    assert buffer.drain() == [2, 3, 4, 5]
+    assert buffer.drain(timeout=0) == []
+    assert buffer.max_depth == 4
+
+
+def test_overflow_drop():
+    buffer = EventBuffer(2, OverflowPolicy.DROP)
+    assert [buffer.put(i) for i in range(4)] == [True, True, False, False]
+    assert buffer.drain() == [0, 1]
+    assert buffer.accepted == 2
+    assert buffer.dropped == 2
+
+
+def test_overflow_spill():
+    buffer = EventBuffer(2, OverflowPolicy.SPILL)
+    for i in range(5):
+        assert buffer.put(i)
+    assert buffer.spilled == 3
+    assert buffer.drain() == [0, 1, 2, 3, 4]
+    assert buffer.depth == 0
+
+
+def test_overflow_block():
+    buffer = EventBuffer(2, OverflowPolicy.BLOCK)
+    producer = Thread(target=lambda: [buffer.put(i) for i in range(5)])
+    producer.start()
+    drained = []
+    while len(drained) < 5:
+        drained += buffer.drain(timeout=1)
+    producer.join(timeout=1)
+    assert drained == [0, 1, 2, 3, 4]
+    assert buffer.max_depth == 2
+
+
+def test_invalid_capacity():
+    with pytest.raises(ValueError):
+        EventBuffer(0)
+
+
+def test_close():
+    buffer = EventBuffer(2)
+    buffer.put(0)
+    consumer = Thread(target=lambda: buffer.drain())  # Returns the pending event
+    consumer.start()
+    consumer.join(timeout=1)
+    waiter = Thread(target=lambda: buffer.drain())  # Blocks until closed
+    waiter.start()
+    buffer.close()
+    waiter.join(timeout=1)
+    assert not waiter.is_alive()
+    assert buffer.closed
+    assert not buffer.put(1)
+    assert buffer.drain() == []
@@ -0,0 +1,64 @@
+import time
+from threading import Event, Thread
+
+from nexus.Freqlog import Freqlog
+from nexus.Freqlog.Definitions import ActionType
+
+THRESHOLD_NS = 300_000_000
+
+
+def test_process_queue_deadlines(tmp_path, fake_device):
+    freqlog = Freqlog(str(tmp_path / "freqlog.db"), lambda _: "test", loggable=False)
+    freqlog.new_word_threshold = THRESHOLD_NS / 1_000_000_000
+    freqlog.segmenter = freqlog._make_segmenter()
+
+    # Record when each word reaches the backend
+    logged: list[tuple[str, int]] = []
+    word_logged = Event()
+    log_word = freqlog.backend.log_word
+
+    def _log_word(word, start_time, end_time):
+        logged.append((word, time.perf_counter_ns()))
+        word_logged.set()
+        return log_word(word, start_time, end_time)
+
+    freqlog.backend.log_word = _log_word
+
+    def _type(keys: str, interval: float) -> int:
+        """Put a press for each key into the queue interval seconds apart, returning when the last one was put"""
+        for i, key in enumerate(keys):
+            if i:
+                time.sleep(interval)
+            last = time.perf_counter_ns()
+            freqlog.q.put((ActionType.PRESS, key.encode(), 0, last))
+        return last
+
+    last_keys: list[int] = []
+    words_waited: list[bool] = []
+    stopped_at: list[int] = []
+
+    def _listener():
+        """Stand in for the listener thread, as the loop must run on the thread that opened the backend"""
+        # Logged once the threshold passes, with no further events to wake the loop
+        last_keys.append(_type("hi", 0.02))
+        words_waited.append(word_logged.wait(5))
+        word_logged.clear()
+        # Keys closer together than the threshold push the deadline back, even when the word takes longer than it
+        last_keys.append(_type("slow", THRESHOLD_NS / 2_000_000_000))
+        words_waited.append(word_logged.wait(5))
+        # Stopping wakes the loop right away instead of waiting for the deadline of the word in progress
+        _type("stop", 0.02)
+        stopped_at.append(time.perf_counter_ns())
+        freqlog.stop_logging()
+
+    listener = Thread(target=_listener, daemon=True)
+    listener.start()
+    freqlog._process_queue()
+    returned_at = time.perf_counter_ns()
+    listener.join()
+
+    assert words_waited == [True, True]
+    assert [word for word, _ in logged] == ["hi", "slow", "stop"]  # The word in progress is logged on the way out
+    assert logged[0][1] >= last_keys[0] + THRESHOLD_NS
+    assert logged[1][1] >= last_keys[1] + THRESHOLD_NS
+    assert returned_at - stopped_at[0] < THRESHOLD_NS
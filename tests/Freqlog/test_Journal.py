@@ -0,0 +1,76 @@
+import os
+
+import vinput
+
+from nexus.Freqlog import Freqlog
+from nexus.Freqlog.Definitions import ActionType, CaseSensitivity
+from nexus.Freqlog.Events import EventClock
+from nexus.Freqlog.Journal import HEADER, RECORD, Journal
+
+MS = 1_000_000
+
+
+def key_events(keys: str, start: int) -> list[tuple]:
+    return [(ActionType.PRESS, key.encode(), 0, start + i * MS) for i, key in enumerate(keys)]
+
+
+def test_recover_after_crash(tmp_path):
+    path = str(tmp_path / "journal")
+    clock = EventClock()
+    journal = Journal(path, clock)
+    journal.append(key_events("logged ", clock.anchor_ns))
+    journal.checkpoint()
+    tail = key_events("lost", clock.anchor_ns + 10 * MS) + [(ActionType.PRESS, vinput.MouseButtonEvent(), 0, 0)]
+    journal.append(tail)
+    journal.sync()  # Crash without closing
+
+    [(read_clock, events)] = Journal.read(path, since_checkpoint=True)
+    assert (read_clock.anchor_ns, read_clock.anchor) == (clock.anchor_ns, clock.anchor)
+    assert events[:-1] == tail[:-1]
+    assert isinstance(events[-1][1], vinput.MouseButtonEvent)
+    assert len(Journal.read(path)[0][1]) == len(tail)  # Checkpointed segment was deleted
+
+
+def test_checkpoint_deletes_logged_segments(tmp_path):
+    path = str(tmp_path / "journal")
+    clock = EventClock()
+    journal = Journal(path, clock, max_segment_size=HEADER.size + 4 * RECORD.size)
+    journal.append(key_events("abcdefgh", clock.anchor_ns))  # Rotates
+    journal.append(key_events("ij", clock.anchor_ns))
+    journal.sync()
+    assert len(Journal.segment_files(path)) == 2
+    assert len(Journal.read(path, since_checkpoint=True)[0][1]) == 10  # Merged across segments
+    journal.checkpoint()
+    journal.close()
+    assert len(Journal.segment_files(path)) == 1
+    assert Journal.read(path, since_checkpoint=True) == []
+
+
+def test_torn_write(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = Journal(path, EventClock())
+    journal.append(key_events("ab", 0))
+    journal.close()
+    [segment] = Journal.segment_files(path)
+    with open(segment, "ab") as f:
+        f.write(b"\x01\x02\x03")  # Partial record
+    assert len(Journal.read(path)[0][1]) == 2
+    Journal.clear(path)
+    assert os.listdir(path) == []
+
+
+def test_replay(tmp_path):
+    path = str(tmp_path / "journal")
+    clock = EventClock()
+    journal = Journal(path, clock, keep=True)
+    journal.append(key_events("typed ", clock.anchor_ns) +  # 1ms apart: a chord
+                   [(ActionType.PRESS, key.encode(), 0, clock.anchor_ns + (1000 + 100 * i) * MS)
+                    for i, key in enumerate("slowly ")])
+    journal.append(key_events("idle", clock.anchor_ns + 60_000 * MS))  # Ended by the new word threshold
+    journal.checkpoint()
+    journal.close()
+
+    freqlog = Freqlog(":memory:", lambda _: "test", loggable=False)
+    assert freqlog.replay(path) == len("typed ") + len("slowly ") + len("idle")
+    assert freqlog.num_logged_chords() == 2  # "typed" and "idle" at 1ms per key
+    assert freqlog.get_word_metadata("slowly", CaseSensitivity.SENSITIVE).frequency == 1
@@ -0,0 +1,57 @@
+import pytest
+import vinput
+
+from nexus.Freqlog.Definitions import ActionType, Defaults
+from nexus.Freqlog.Events import MODIFIER_BITS
+from nexus.Freqlog.Segmenter import Segmenter
+
+MS = 1_000_000
+
+
+@pytest.fixture()
+def logged() -> list:
+    return []
+
+
+@pytest.fixture()
+def segmenter(logged) -> Segmenter:
+    modifier_keys = vinput.KeyboardModifiers()
+    for attr in Defaults.DEFAULT_MODIFIERS:
+        setattr(modifier_keys, attr, True)
+    return Segmenter(lambda w, s, e: logged.append(("word", w, s, e)),
+                     lambda c, s, e: logged.append(("chord", c, s, e)),
+                     Defaults.DEFAULT_ALLOWED_CHARS, Defaults.DEFAULT_ALLOWED_FIRST_CHARS, modifier_keys,
+                     Defaults.DEFAULT_CHORD_CHAR_THRESHOLD)
+
+
+def type_keys(segmenter: Segmenter, keys: str, start: int, interval: int) -> int:
+    for i, key in enumerate(keys):
+        segmenter.feed(ActionType.PRESS, key.encode(), 0, start + i * interval)
+        segmenter.feed(ActionType.RELEASE, key.encode(), 0, start + i * interval + 1)
+    return start + len(keys) * interval
+
+
+def test_word(segmenter, logged):
+    type_keys(segmenter, "helo\blo ", 0, 100 * MS)
+    assert logged == [("word", "hello", 0, 6 * 100 * MS)]  # Ends at the last char before the space
+    assert segmenter.word == ""
+
+
+def test_chord(segmenter, logged):
+    end = type_keys(segmenter, "chord ", 0, MS)
+    assert logged == []  # Chords take trailing whitespace, so they're only logged on the next word or timeout
+    segmenter.flush()
+    assert logged == [("chord", "chord", 0, end - MS)]
+
+
+def test_mouse_ends_word(segmenter, logged):
+    end = type_keys(segmenter, "mouse", 0, 100 * MS)
+    segmenter.feed(ActionType.PRESS, vinput.MouseButtonEvent(), 0, end)
+    assert logged == [("word", "mouse", 0, end - 100 * MS)]
+
+
+def test_banned_modifier(segmenter, logged):
+    type_keys(segmenter, "ab", 0, 100 * MS)
+    segmenter.feed(ActionType.PRESS, b"c", MODIFIER_BITS['left_control'], 200 * MS)  # Ctrl+C isn't typed
+    type_keys(segmenter, "d ", 300 * MS, 100 * MS)
+    assert logged == [("word", "abd", 0, 300 * MS)]